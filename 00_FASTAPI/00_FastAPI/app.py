@@ -1,11 +1,13 @@
 from fastapi import FastAPI, Path
 from typing import Annotated
 from fastapi.middleware.cors import CORSMiddleware
+from metrics import METRICS, MetricsMiddleware, TimedJSONResponse, metrics_endpoint, registry, server_error
 
 app = FastAPI(
     title="My API",
     description="This is a simple api",
     version="0.0.1",
+    default_response_class=TimedJSONResponse,
 )
 app.add_middleware(
     CORSMiddleware,
@@ -14,6 +16,10 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+if METRICS:
+    app.add_middleware(MetricsMiddleware, registry=registry)
+    app.add_exception_handler(Exception, server_error)
+    app.add_api_route("/metrics", metrics_endpoint, include_in_schema=False)
 
 
 @app.get('/')
@@ -0,0 +1,105 @@
+"""
+Overhead of the request metrics on the `hi` and `bye` routes: requests/s
+without the middleware, with every request measured and with sampling. The
+app is called directly (no server nor sockets), which is where the overhead
+is the largest share of a request.
+
+The differences are a few percent, less than the drift of a shared machine
+over a few seconds: the cases are run in turn for small blocks of requests,
+in an order rotated every round, and their CPU time is summed over all the
+rounds. The garbage collector only runs between rounds. Two runs agree
+within about 0.3%. Run from the
+00_FastAPI directory:
+
+    python -m benchmarks.bench_metrics --requests 50 --rounds 1500
+"""
+
+import argparse
+import asyncio
+import gc
+import time
+from starlette.middleware import Middleware
+from app import app
+from metrics import MetricsMiddleware, Registry
+
+
+def scope(path: str) -> dict:
+    return {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": "GET",
+        "scheme": "http",
+        "path": path,
+        "raw_path": path.encode(),
+        "query_string": b"",
+        "root_path": "",
+        "headers": [(b"host", b"bench")],
+        "client": ("127.0.0.1", 50000),
+        "server": ("bench", 80),
+    }
+
+
+async def receive():
+    return {"type": "http.request", "body": b"", "more_body": False}
+
+
+async def send(message):
+    pass
+
+
+def stack(middleware: list[Middleware]):
+    others = [m for m in app.user_middleware if m.cls is not MetricsMiddleware]
+    app.user_middleware = middleware + others
+    return app.build_middleware_stack()
+
+
+async def elapsed(stack, requests: int) -> float:
+    start = time.process_time()
+    for i in range(requests):
+        await stack({**scope("/" if i % 2 else "/bye"), "app": app}, receive, send)
+    return time.process_time() - start
+
+
+async def run(requests: int, rounds: int, sample_rates: list[float]):
+    cases = {"no metrics": []}
+    for sample_rate in sample_rates:
+        cases[f"sample {sample_rate:g}"] = [
+            Middleware(MetricsMiddleware, registry=Registry(), sample_rate=sample_rate)
+        ]
+    names = list(cases)
+    totals = dict.fromkeys(names, 0.0)
+    gc.disable()
+    try:
+        for round in range(rounds):
+            shift = round % len(names)
+            order = names[shift:] + names[:shift]
+            # rebuilt every round, in turn as well, so that no case keeps
+            # the objects allocated first
+            stacks = {name: stack(cases[name]) for name in order}
+            for name in order:
+                await elapsed(stacks[name], requests // 2)
+            for name in order:
+                totals[name] += await elapsed(stacks[name], requests)
+            gc.collect()
+    finally:
+        gc.enable()
+    return {name: requests * rounds / total for name, total in totals.items()}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=50)
+    parser.add_argument("--rounds", type=int, default=1500)
+    parser.add_argument("--sample-rates", type=float, nargs="+", default=[1, 0.1, 0.01])
+    args = parser.parse_args()
+
+    rates = asyncio.run(run(args.requests, args.rounds, args.sample_rates))
+    baseline = rates["no metrics"]
+    print(f"{'case':>12} {'req/s':>8} {'overhead':>9}")
+    for name, value in rates.items():
+        print(f"{name:>12} {value:>8.0f} {(baseline / value - 1) * 100:>8.2f}%")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,320 @@
+"""
+Request metrics, served at `/metrics` in the Prometheus text format: the
+latency of every route, the time spent rendering the response and its size.
+
+`MetricsMiddleware` is a plain ASGI middleware. Requests are grouped by the
+path template of their route (`/hello/{name}`) rather than by their path, so
+that the number of series doesn't grow with the ids in the URLs. Values go to
+a `Histogram` of log-linear buckets, in the manner of HdrHistogram: 8 buckets
+per power of two, so a percentile is within 12.5% of the real value, and
+recording a value is a `math.frexp` and an increment, without allocation.
+
+Responses whose `render` is wrapped with `timed_render` (e.g.
+`TimedJSONResponse`, the default response class of the app) count the time
+spent rendering, through a context variable set for the measured requests.
+The others, such as a plain `JSONResponse` returned by a route, aren't timed
+and record 0: the render histogram only covers the timed response classes.
+
+Every response is counted in `http_responses_total`, by method (`OTHER`
+for the unknown ones), route and status code, but only one request in
+1 / METRICS_SAMPLE_RATE is measured: the histograms hold the sampled requests,
+the counters all of them. On the `hi` and `bye` routes of 00_FastAPI called in
+process, which do nothing else, counting every response costs about 1.5% and
+measuring every request 9.4%: the default of 0.01 keeps the overhead at
+1.7-1.8%, 0.1 brings it to 3-3.5% (see `benchmarks/bench_metrics.py` there).
+With `METRICS_SERVER_TIMING=1` the measured responses get a `Server-Timing` header (`app` and `render`
+durations in ms), shown by the network tab of the browsers.
+
+Configuration (environment variables):
+    - METRICS: 0 disables the middleware and the `/metrics` route.
+    - METRICS_SAMPLE_RATE: the share of the requests measured, defaults to 0.01.
+    - METRICS_SERVER_TIMING: 1 adds the `Server-Timing` header.
+"""
+
+import functools
+import math
+import os
+import time
+from contextvars import ContextVar
+from fastapi import Request
+from fastapi.responses import JSONResponse, PlainTextResponse, Response
+
+METRICS = os.environ.get("METRICS", "1") != "0"
+METRICS_SAMPLE_RATE = float(os.environ.get("METRICS_SAMPLE_RATE", 0.01))
+METRICS_SERVER_TIMING = os.environ.get("METRICS_SERVER_TIMING", "0") == "1"
+SUB_BUCKETS = 8
+# the powers of two covered by the histograms: about 1 µs to 128 s and
+# 1 B to 1 GiB
+SECONDS = (-20, 7)
+BYTES = (0, 30)
+QUANTILES = (0.5, 0.9, 0.99)
+UNMATCHED = "<unmatched>"
+# the `method` label of the others, so that clients can't add series
+METHODS = frozenset(("GET", "HEAD", "POST", "PUT", "PATCH", "DELETE", "OPTIONS"))
+OTHER = "OTHER"
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+class Histogram:
+    def __init__(self, min_exponent: int, max_exponent: int, sub_buckets: int = SUB_BUCKETS):
+        self.min_exponent = min_exponent
+        self.max_exponent = max_exponent
+        self.sub_buckets = sub_buckets
+        # counts[0]: up to 2 ** min_exponent, counts[-1]: over 2 ** max_exponent
+        self.counts = [0] * ((max_exponent - min_exponent) * sub_buckets + 2)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def index(self, value: float) -> int:
+        mantissa, exponent = math.frexp(value)
+        if exponent <= self.min_exponent:
+            return 0
+        # value = 2 ** (exponent - 1) * (1 + scaled / sub_buckets), buckets
+        # include their upper bound like the `le` of Prometheus
+        scaled = (mantissa - 0.5) * 2 * self.sub_buckets
+        index = (exponent - self.min_exponent - 1) * self.sub_buckets + math.ceil(scaled)
+        return min(index, len(self.counts) - 1)
+
+    def upper_bound(self, index: int) -> float:
+        if index == 0:
+            return 2.0**self.min_exponent
+        if index == len(self.counts) - 1:
+            return self.max
+        group, sub = divmod(index - 1, self.sub_buckets)
+        return 2.0 ** (self.min_exponent + group) * (1 + (sub + 1) / self.sub_buckets)
+
+    def record(self, value: float):
+        self.counts[self.index(value)] += 1
+        self.count += 1
+        self.sum += value
+        if value > self.max:
+            self.max = value
+
+    def percentile(self, q: float) -> float:
+        if not self.count:
+            return 0.0
+        rank, seen = q * self.count, 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if count and seen >= rank:
+                return min(self.upper_bound(index), self.max)
+        return self.max
+
+    def buckets(self) -> list[tuple[float, int]]:
+        """The cumulative counts up to each power of two, the `le` buckets."""
+        cumulative = self.counts[0]
+        result = [(2.0**self.min_exponent, cumulative)]
+        for exponent in range(self.min_exponent + 1, self.max_exponent + 1):
+            start = (exponent - self.min_exponent - 1) * self.sub_buckets + 1
+            cumulative += sum(self.counts[start:start + self.sub_buckets])
+            result.append((2.0**exponent, cumulative))
+        return result
+
+
+class RequestStats:
+    __slots__ = ("render_seconds",)
+
+    def __init__(self):
+        self.render_seconds = 0.0
+
+    def server_timing(self, elapsed: float) -> bytes:
+        return f"app;dur={elapsed * 1000:.2f}, render;dur={self.render_seconds * 1000:.2f}".encode()
+
+
+# the stats of the request being measured, None outside of one
+current: ContextVar[RequestStats | None] = ContextVar("metrics_request", default=None)
+
+
+class RouteMetrics:
+    def __init__(self):
+        self.duration = Histogram(*SECONDS)
+        self.render_duration = Histogram(*SECONDS)
+        self.size = Histogram(*BYTES)
+
+
+class Registry:
+    def __init__(self):
+        # (method, route) -> metrics
+        self.routes: dict[tuple[str, str], RouteMetrics] = {}
+        # (method, route, status) -> responses, sampled or not
+        self.responses: dict[tuple[str, str, int], int] = {}
+        self.sample_rate = 1.0
+
+    def count(self, method: str, route: str, status: int):
+        key = (method, route, status)
+        self.responses[key] = self.responses.get(key, 0) + 1
+
+    def observe(self, method: str, route: str, status: int | None, elapsed: float, size: int,
+                stats: RequestStats):
+        metrics = self.routes.get((method, route))
+        if metrics is None:
+            metrics = self.routes[(method, route)] = RouteMetrics()
+        metrics.duration.record(elapsed)
+        metrics.render_duration.record(stats.render_seconds)
+        metrics.size.record(size)
+        if status is not None:
+            self.count(method, route, status)
+
+    def render(self) -> str:
+        lines = [
+            "# HELP metrics_sample_rate The share of the requests measured.",
+            "# TYPE metrics_sample_rate gauge",
+            f"metrics_sample_rate {self.sample_rate:g}",
+            "# HELP http_responses_total Responses by status code.",
+            "# TYPE http_responses_total counter",
+        ]
+        for (method, route, status), count in sorted(self.responses.items()):
+            labels = f'method="{escape(method)}",route="{escape(route)}",status="{status}"'
+            lines.append(f"http_responses_total{{{labels}}} {count}")
+        routes = sorted(self.routes.items())
+        histograms = (
+            ("http_request_duration_seconds", "duration", "Time to send the whole response."),
+            ("http_response_render_duration_seconds", "render_duration", "Time spent rendering the response body."),
+            ("http_response_size_bytes", "size", "Size of the response body."),
+        )
+        for name, attribute, help in histograms:
+            lines.append(f"# HELP {name} {help}")
+            lines.append(f"# TYPE {name} histogram")
+            for (method, route), metrics in routes:
+                histogram = getattr(metrics, attribute)
+                labels = f'method="{escape(method)}",route="{escape(route)}"'
+                for bound, count in histogram.buckets():
+                    lines.append(f'{name}_bucket{{{labels},le="{bound:g}"}} {count}')
+                lines.append(f'{name}_bucket{{{labels},le="+Inf"}} {histogram.count}')
+                lines.append(f"{name}_sum{{{labels}}} {histogram.sum:g}")
+                lines.append(f"{name}_count{{{labels}}} {histogram.count}")
+        lines.append(
+            "# HELP http_request_duration_quantile_seconds Latency percentiles from the histogram buckets."
+        )
+        lines.append("# TYPE http_request_duration_quantile_seconds gauge")
+        for (method, route), metrics in routes:
+            for q in QUANTILES:
+                labels = f'method="{escape(method)}",route="{escape(route)}",quantile="{q:g}"'
+                value = metrics.duration.percentile(q)
+                lines.append(f"http_request_duration_quantile_seconds{{{labels}}} {value:g}")
+        return "\n".join(lines) + "\n"
+
+
+def escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class MetricsMiddleware:
+    """
+    `__call__` is a plain function returning the coroutine of the app or of
+    `measure`, so that the requests which aren't sampled don't run one more.
+    Servers, which tell ASGI 3 apps by a coroutine `__call__`, are given the
+    app the middleware is added to, not the middleware.
+    """
+
+    def __init__(
+        self,
+        app,
+        registry: Registry,
+        sample_rate: float = METRICS_SAMPLE_RATE,
+        server_timing: bool = METRICS_SERVER_TIMING,
+    ):
+        self.app = app
+        self.registry = registry
+        registry.sample_rate = sample_rate
+        # measures one request in `every`, 0 for none: the others are only counted
+        self.every = round(1 / sample_rate) if sample_rate > 0 else 0
+        self.skipped = 0
+        self.responses = registry.responses
+        self.server_timing = server_timing
+
+    def __call__(self, scope, receive, send):
+        self.skipped += 1
+        if self.skipped == self.every:
+            self.skipped = 0
+            return self.measure(scope, receive, send)
+        # the fast path, which almost every request takes: nothing is timed,
+        # the status code is counted as the response starts, and neither the
+        # request nor its messages go through a coroutine of ours. Other
+        # scopes than "http" send no `http.response.start`, the errors that
+        # don't either are counted by `server_error`
+        responses = self.responses
+
+        def counted_send(message):
+            if message["type"] == "http.response.start":
+                key = (label(scope["method"]), route_path(scope), message["status"])
+                responses[key] = responses.get(key, 0) + 1
+            return send(message)
+
+        return self.app(scope, receive, counted_send)
+
+    async def measure(self, scope, receive, send):
+        # requests already measured by an outer middleware are passed on
+        if scope["type"] != "http" or current.get() is not None:
+            await self.app(scope, receive, send)
+            return
+        stats = RequestStats()
+        token = current.set(stats)
+        start = time.perf_counter()
+        # None until the response starts
+        status, size = None, 0
+
+        async def measured_send(message):
+            nonlocal status, size
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                if self.server_timing:
+                    timing = stats.server_timing(time.perf_counter() - start)
+                    message["headers"] = [*message.get("headers", ()), (b"server-timing", timing)]
+            elif message["type"] == "http.response.body":
+                size += len(message.get("body", b""))
+            await send(message)
+
+        try:
+            await self.app(scope, receive, measured_send)
+        finally:
+            elapsed = time.perf_counter() - start
+            current.reset(token)
+            self.registry.observe(label(scope["method"]), route_path(scope), status, elapsed, size, stats)
+
+
+def label(method: str) -> str:
+    return method if method in METHODS else OTHER
+
+
+def route_path(scope) -> str:
+    route = scope.get("route")
+    return route.path if route is not None else UNMATCHED
+
+
+def timed_render(render):
+    """Wraps `Response.render` to count its time in the measured request."""
+
+    @functools.wraps(render)
+    def wrapper(self, content):
+        stats = current.get()
+        if stats is None:
+            return render(self, content)
+        start = time.perf_counter()
+        body = render(self, content)
+        stats.render_seconds += time.perf_counter() - start
+        return body
+
+    return wrapper
+
+
+class TimedJSONResponse(JSONResponse):
+    render = timed_render(JSONResponse.render)
+
+
+registry = Registry()
+
+
+def metrics_endpoint(request: Request) -> Response:
+    return Response(registry.render(), media_type=CONTENT_TYPE)
+
+
+def server_error(request: Request, exc: Exception) -> Response:
+    """
+    The handler of the errors raised before a response started, which
+    ServerErrorMiddleware answers outside of `MetricsMiddleware`: counts
+    their 500 and sends the response Starlette would.
+    """
+    registry.count(label(request.method), route_path(request.scope), 500)
+    return PlainTextResponse("Internal Server Error", status_code=500)
@@ -0,0 +1,58 @@
+from fastapi.testclient import TestClient
+from app import app
+from metrics import MetricsMiddleware, Registry
+
+client = TestClient(app)
+
+
+def measured_client(sample_rate: float = 1, **options):
+    registry = Registry()
+    middleware = MetricsMiddleware(app, registry=registry, sample_rate=sample_rate, **options)
+
+    # TestClient tells ASGI 3 apps by a coroutine `__call__`
+    async def asgi(scope, receive, send):
+        await middleware(scope, receive, send)
+
+    return TestClient(asgi), registry
+
+
+class TestMetrics:
+    def test_requests_are_grouped_by_route(self):
+        measured, registry = measured_client()
+        names = ("jon", "mary", "paul")
+        for name in names:
+            measured.get(f"/hello/{name}")
+        measured.get("/missing")
+        metrics = registry.routes[("GET", "/hello/{name}")]
+        assert metrics.duration.count == 3
+        assert metrics.render_duration.sum > 0
+        assert metrics.size.sum == sum(len(f'{{"message":"Hello {n}."}}') for n in names)
+        assert registry.responses[("GET", "<unmatched>", 404)] == 1
+
+    def test_server_timing(self):
+        measured, _ = measured_client(server_timing=True)
+        res = measured.get("/")
+        assert res.json() == {"message": "hi"}
+        assert res.headers["server-timing"].startswith("app;dur=")
+        assert "server-timing" not in client.get("/").headers
+
+    def test_sampling(self):
+        measured, registry = measured_client(sample_rate=0.1)
+        for _ in range(20):
+            measured.get("/bye")
+        assert registry.routes[("GET", "/bye")].duration.count == 2
+        # every response is counted
+        assert registry.responses == {("GET", "/bye", 200): 20}
+
+    def test_unknown_methods_share_a_label(self):
+        measured, registry = measured_client(sample_rate=0.5)
+        for method in ("PROPFIND", "BREW", "GET"):
+            measured.request(method, "/")
+        assert registry.responses == {("OTHER", "/", 405): 2, ("GET", "/", 200): 1}
+        assert set(registry.routes) <= {("OTHER", "/"), ("GET", "/")}
+
+    def test_metrics_endpoint(self):
+        res = client.get("/metrics")
+        assert res.status_code == 200
+        assert res.headers["content-type"].startswith("text/plain; version=0.0.4")
+        assert "metrics_sample_rate" in res.text
@@ -4,23 +4,55 @@ from fastapi.responses import JSONResponse
 from routers.user import userRouter
 from fastapi import FastAPI
 from sqlmodel import SQLModel
-from db import engine
+from db import ReadSessionDep, engine, read_engine
+from hashing import hashing_pool
+from mail import mail_dispatcher
+from presence import presence
+from stats import user_stats
+from verification import tokens
+from migrations import migrate
 from contextlib import asynccontextmanager
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.staticfiles import StaticFiles
+from files import StorageFiles
+from ratelimit import AUTH_RULES, RATE_LIMIT, RateLimitMiddleware, limiter
+from metrics import METRICS, MetricsMiddleware, instrument_engine, metrics_endpoint, registry, server_error
 
-def create_db_and_tables():
-    SQLModel.metadata.create_all(engine)
+def json_metrics(source):
+    async def endpoint():
+        return JSONResponse(source.metrics(), status_code=status.HTTP_200_OK)
+
+    return endpoint
+
+
+async def create_db_and_tables():
+    async with engine.begin() as conn:
+        await conn.run_sync(SQLModel.metadata.create_all)
+    await migrate(engine)
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    create_db_and_tables()
+    await create_db_and_tables()
+    mail_dispatcher.start()
+    presence.start()
+    user_stats.start()
+    tokens.start()
     yield
+    await tokens.stop()
+    await user_stats.stop()
+    await presence.stop()
+    mail_dispatcher.stop(timeout=10)
+    hashing_pool.shutdown()
+    await engine.dispose()
+    await read_engine.dispose()
 
 
 app = FastAPI(lifespan=lifespan)
 
+# added first so that it runs inside CORS, its 429s get the CORS headers too
+if RATE_LIMIT:
+    app.add_middleware(RateLimitMiddleware, limiter=limiter, rules=AUTH_RULES)
+
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["http://localhost:8080", "http://localhost:3000", "*"],
@@ -28,14 +60,28 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
-app.mount("/storage", StaticFiles(directory="storage"), name="storage")
+# added last so that its timings include the other middlewares
+if METRICS:
+    app.add_middleware(MetricsMiddleware, registry=registry)
+    app.add_exception_handler(Exception, server_error)
+    instrument_engine(engine)
+    instrument_engine(read_engine)
+    app.add_api_route("/metrics", metrics_endpoint, include_in_schema=False)
+    for name, source in (("hashing", hashing_pool), ("presence", presence), ("ratelimit", limiter)):
+        app.add_api_route(f"/metrics/{name}", json_metrics(source), include_in_schema=False)
+
+app.mount("/storage", StorageFiles(directory="storage"), name="storage")
 app.include_router(authRouter)
 app.include_router(userRouter)
 
 
 @app.get("/")
-def default():
+async def default(session: ReadSessionDep):
     return JSONResponse(
-        {"message": "This is a users API", "totalUsers": 0},
+        {
+            "message": "This is a users API",
+            "totalUsers": await user_stats.count(session),
+            "verifiedUsers": await user_stats.count(session, verified=True),
+        },
         status_code=status.HTTP_200_OK,
     )
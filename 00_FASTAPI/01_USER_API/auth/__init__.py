@@ -0,0 +1,108 @@
+"""
+`CurrentUser` is the user that sent the request, resolved from a
+`Authorization: Bearer <jwt>` header (None when the header is missing or the
+token is not valid).
+
+Verified claims are cached by the sha256 digest of the token so that a token
+is only verified once, and the user row can be cached for a few seconds as
+well. Both caches are configured with environment variables:
+    - TOKEN_CACHE_TTL / TOKEN_CACHE_SIZE: defaults to 300 seconds / 10000 tokens.
+    - USER_CACHE_TTL / USER_CACHE_SIZE: defaults to 0 (disabled) / 10000 users.
+"""
+
+import hashlib
+import os
+import time
+from typing import Annotated
+from fastapi import Depends, Header
+from sqlmodel.ext.asyncio.session import AsyncSession
+import utils
+from cache import TTLCache
+from db import SessionDep
+from models import User
+
+token_cache = TTLCache(
+    maxsize=int(os.environ.get("TOKEN_CACHE_SIZE", 10_000)),
+    ttl=float(os.environ.get("TOKEN_CACHE_TTL", 300)),
+)
+user_cache = TTLCache(
+    maxsize=int(os.environ.get("USER_CACHE_SIZE", 10_000)),
+    ttl=float(os.environ.get("USER_CACHE_TTL", 0)),
+)
+
+
+def token_digest(token: str) -> str:
+    return hashlib.sha256(token.encode()).hexdigest()
+
+
+def bearer_token(authorization: str | None) -> str | None:
+    if authorization is None:
+        return None
+    parts = authorization.split(" ")
+    if len(parts) != 2 or not parts[1]:
+        return None
+    return parts[1]
+
+
+def verify_token(token: str) -> dict | None:
+    digest = token_digest(token)
+    claims = token_cache.get(digest)
+    if claims is not None:
+        return claims
+    try:
+        claims = utils.decode_jwt(token)
+    except Exception:
+        return None
+    if claims is None:
+        return None
+    ttl = None
+    if "exp" in claims:
+        # never keep a token in the cache after it expired
+        ttl = claims["exp"] - time.time()
+    token_cache.set(digest, claims, ttl)
+    return claims
+
+
+async def load_user(session: AsyncSession, id: int) -> User | None:
+    cached = user_cache.get(id)
+    if cached is not None:
+        # attaches a copy of the cached row to the session without a SELECT
+        return await session.merge(cached, load=False)
+    me = await session.get(User, id)
+    if me is not None and user_cache.ttl > 0:
+        session.expunge(me)
+        user_cache.set(id, me)
+        me = await session.merge(me, load=False)
+    return me
+
+
+def invalidate_user(id: int, token: str | None = None):
+    user_cache.delete(id)
+    if token is not None:
+        token_cache.delete(token_digest(token))
+
+
+def get_current_user_id(
+    authorization: Annotated[str | None, Header()] = None,
+) -> int | None:
+    token = bearer_token(authorization)
+    if token is None:
+        return None
+    claims = verify_token(token)
+    if claims is None or "id" not in claims:
+        return None
+    return claims["id"]
+
+
+async def get_current_user(
+    session: SessionDep, authorization: Annotated[str | None, Header()] = None
+) -> User | None:
+    id = get_current_user_id(authorization)
+    if id is None:
+        return None
+    return await load_user(session, id)
+
+
+# the id of the user, for routes that read the user themselves
+CurrentUserId = Annotated[int | None, Depends(get_current_user_id)]
+CurrentUser = Annotated[User | None, Depends(get_current_user)]
@@ -0,0 +1,248 @@
+"""
+Avatar uploads are streamed straight from the request body to disk: the
+multipart body is parsed while it arrives, written off the event loop in
+chunks and hashed on the way, and the upload is aborted as soon as it goes
+over AVATAR_MAX_BYTES (5 MiB by default). Files are named after the sha256 of
+their content, so the same picture uploaded twice is only stored once.
+
+Only PNG, JPEG, WEBP and GIF pictures are kept. With Pillow the extension
+comes from the format it detects in the file, without it from an allowed
+extension of the uploaded filename: anything else (e.g. html or svg, which a
+browser would run from /storage) is rejected. The headers of the parts are
+capped, so that a part can't grow them without limit.
+
+After the upload a background stage writes resized variants of the picture
+(AVATAR_SIZES in WEBP and JPEG) next to it, this needs Pillow. Without it only
+the original is kept.
+"""
+
+import hashlib
+import os
+import tempfile
+import anyio
+from python_multipart import MultipartParser
+from python_multipart.multipart import parse_options_header
+from starlette.requests import Request
+
+try:
+    from PIL import Image
+except ImportError:  # pragma: no cover
+    Image = None
+
+AVATAR_MAX_BYTES = int(os.environ.get("AVATAR_MAX_BYTES", 5 * 1024 * 1024))
+AVATAR_DIRECTORY = "storage/avatars"
+AVATAR_SIZES = (64, 256)
+AVATAR_FORMATS = {"webp": "WEBP", "jpeg": "JPEG"}
+# the variant the user's avatar points at once it exists
+AVATAR_DEFAULT_VARIANT = (256, "webp")
+# the allowed extensions of an uploaded filename and the Pillow formats,
+# mapped to the extension the file is stored with
+AVATAR_EXTENSIONS = {"png": "png", "jpg": "jpeg", "jpeg": "jpeg", "webp": "webp", "gif": "gif"}
+PICTURE_FORMATS = {"PNG": "png", "JPEG": "jpeg", "WEBP": "webp", "GIF": "gif"}
+MAX_HEADER_NAME = 256
+MAX_HEADER_VALUE = 4096
+MAX_HEADERS = 16
+BASE_URL = "http://127.0.0.1:8000"
+
+
+class AvatarError(Exception):
+    pass
+
+
+class AvatarTooLarge(AvatarError):
+    pass
+
+
+class Avatar:
+    def __init__(self, digest: str, ext: str, size: int):
+        self.digest = digest
+        self.ext = ext
+        self.size = size
+
+    @property
+    def path(self) -> str:
+        return f"{AVATAR_DIRECTORY}/{self.digest}.{self.ext}"
+
+    def variant_path(self, size: int, format: str) -> str:
+        return f"{AVATAR_DIRECTORY}/{self.digest}-{size}.{format}"
+
+    @property
+    def url(self) -> str:
+        return f"{BASE_URL}/{self.path}"
+
+    def variant_urls(self) -> dict:
+        if Image is None:
+            return {}
+        return {
+            f"{size}.{format}": f"{BASE_URL}/{self.variant_path(size, format)}"
+            for size in AVATAR_SIZES
+            for format in AVATAR_FORMATS
+        }
+
+    def default_variant_url(self) -> str | None:
+        if Image is None:
+            return None
+        return f"{BASE_URL}/{self.variant_path(*AVATAR_DEFAULT_VARIANT)}"
+
+    def has_variants(self) -> bool:
+        return Image is not None and all(
+            os.path.exists(self.variant_path(size, format))
+            for size in AVATAR_SIZES
+            for format in AVATAR_FORMATS
+        )
+
+
+def extension(filename: str | None) -> str | None:
+    """The extension an upload named `filename` is stored with, None when it isn't allowed."""
+    ext = (filename or "").rsplit(".", 1)[-1].lower() if "." in (filename or "") else ""
+    return AVATAR_EXTENSIONS.get(ext)
+
+
+def detect_extension(path: str) -> str | None:
+    """The extension of the picture at `path` by its content, None when it isn't one."""
+    try:
+        with Image.open(path) as image:
+            return PICTURE_FORMATS.get(image.format)
+    except Exception:
+        return None
+
+
+async def receive_avatar(
+    request: Request, field: str = "avatar", max_bytes: int = AVATAR_MAX_BYTES
+) -> Avatar:
+    """
+    Reads the `field` file of a multipart request into AVATAR_DIRECTORY and
+    returns it. Raises AvatarTooLarge as soon as the file goes over
+    `max_bytes` and AvatarError when the request has no such file, when it
+    isn't an allowed picture or when the headers of a part are too large.
+    """
+    content_type, params = parse_options_header(request.headers.get("content-type", ""))
+    if content_type != b"multipart/form-data" or b"boundary" not in params:
+        raise AvatarError("The request must be multipart/form-data.")
+    length = request.headers.get("content-length")
+    if length is not None and length.isdigit() and int(length) > max_bytes + 64 * 1024:
+        # refuse before reading anything, the headers of the parts are small
+        raise AvatarTooLarge(f"The avatar must be at most {max_bytes} bytes.")
+
+    os.makedirs(AVATAR_DIRECTORY, exist_ok=True)
+    state = {"headers": {}, "name": b"", "value": b"", "in_file": False, "done": False}
+    pending: list[bytes] = []
+    info = {"filename": None}
+
+    def on_part_begin():
+        state["headers"] = {}
+
+    def on_header_field(data, start, end):
+        state["name"] += data[start:end]
+        if len(state["name"]) > MAX_HEADER_NAME:
+            raise AvatarError("The headers of a part are too large.")
+
+    def on_header_value(data, start, end):
+        state["value"] += data[start:end]
+        if len(state["value"]) > MAX_HEADER_VALUE:
+            raise AvatarError("The headers of a part are too large.")
+
+    def on_header_end():
+        if len(state["headers"]) >= MAX_HEADERS:
+            raise AvatarError("The headers of a part are too large.")
+        state["headers"][state["name"].lower()] = state["value"]
+        state["name"], state["value"] = b"", b""
+
+    def on_headers_finished():
+        _, options = parse_options_header(state["headers"].get(b"content-disposition", b""))
+        state["in_file"] = (
+            not state["done"] and options.get(b"name") == field.encode() and b"filename" in options
+        )
+        if state["in_file"]:
+            info["filename"] = options[b"filename"].decode("latin-1")
+
+    def on_part_data(data, start, end):
+        if state["in_file"]:
+            pending.append(data[start:end])
+
+    def on_part_end():
+        if state["in_file"]:
+            state["in_file"], state["done"] = False, True
+
+    parser = MultipartParser(
+        params[b"boundary"],
+        {
+            "on_part_begin": on_part_begin,
+            "on_header_field": on_header_field,
+            "on_header_value": on_header_value,
+            "on_header_end": on_header_end,
+            "on_headers_finished": on_headers_finished,
+            "on_part_data": on_part_data,
+            "on_part_end": on_part_end,
+        },
+    )
+    digest, size = hashlib.sha256(), 0
+    fd, temporary = await anyio.to_thread.run_sync(_temporary_file)
+    try:
+        async with await anyio.open_file(fd, "wb", closefd=True) as f:
+            async for chunk in request.stream():
+                parser.write(chunk)
+                for data in pending:
+                    size += len(data)
+                    if size > max_bytes:
+                        raise AvatarTooLarge(f"The avatar must be at most {max_bytes} bytes.")
+                    digest.update(data)
+                    await f.write(data)
+                pending.clear()
+        parser.finalize()
+        if not state["done"]:
+            raise AvatarError(f"The request has no '{field}' file.")
+        if Image is not None:
+            ext = await anyio.to_thread.run_sync(detect_extension, temporary)
+        else:
+            ext = extension(info["filename"])
+        if ext is None:
+            raise AvatarError("The avatar must be a PNG, JPEG, WEBP or GIF picture.")
+        avatar = Avatar(digest.hexdigest(), ext, size)
+        if await anyio.to_thread.run_sync(os.path.exists, avatar.path):
+            # the same picture was uploaded before
+            await anyio.to_thread.run_sync(os.remove, temporary)
+        else:
+            await anyio.to_thread.run_sync(os.replace, temporary, avatar.path)
+        return avatar
+    except BaseException:
+        if os.path.exists(temporary):
+            os.remove(temporary)
+        raise
+
+
+def _temporary_file():
+    return tempfile.mkstemp(dir=AVATAR_DIRECTORY, suffix=".part")
+
+
+def make_variants(avatar: Avatar) -> bool:
+    """
+    Writes the resized variants of an avatar that don't exist yet, returns
+    False when that isn't possible (no Pillow or not a picture).
+    """
+    if Image is None:
+        return False
+    try:
+        with Image.open(avatar.path) as image:
+            image.load()
+            for size in AVATAR_SIZES:
+                resized = image.copy()
+                resized.thumbnail((size, size))
+                for ext, format in AVATAR_FORMATS.items():
+                    path = avatar.variant_path(size, ext)
+                    if os.path.exists(path):
+                        continue
+                    variant = resized.convert("RGB") if format == "JPEG" else resized
+                    # a file of its own, the same avatar can be uploaded twice at once
+                    fd, temporary = _temporary_file()
+                    try:
+                        with os.fdopen(fd, "wb") as f:
+                            variant.save(f, format=format, quality=85)
+                        os.replace(temporary, path)
+                    except BaseException:
+                        if os.path.exists(temporary):
+                            os.remove(temporary)
+                        raise
+    except Exception:
+        return False
+    return True
@@ -0,0 +1,68 @@
+"""
+Load test of the authentication dependency: CPU time spent authenticating a
+request (`get_current_user`) without caches, with the verified token cache and
+with the token and user caches together. Run from the 01_USER_API directory:
+
+    python -m benchmarks.bench_auth --requests 5000
+"""
+
+import argparse
+import asyncio
+import os
+import time
+import utils
+from auth import get_current_user, token_cache, user_cache
+from benchmarks.common import async_engine_for, make_users_db
+from db import new_session
+
+
+async def authenticate(engine, tokens: list[str], requests: int) -> float:
+    """Returns the CPU time of one authentication in microseconds."""
+    async with new_session(engine) as session:
+        start = time.process_time()
+        for i in range(requests):
+            me = await get_current_user(session, f"Bearer {tokens[i % len(tokens)]}")
+            assert me is not None
+            # a new request would get a new session
+            session.expunge_all()
+        return (time.process_time() - start) / requests * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=5000)
+    parser.add_argument("--tokens", type=int, default=100, help="distinct users sending requests")
+    args = parser.parse_args()
+
+    engine, path = make_users_db(args.tokens)
+    bench_engine = async_engine_for(engine)
+    tokens = [utils.encode_jwt({"email": f"user{i}@gmail.com", "id": i}) for i in range(1, args.tokens + 1)]
+    token_ttl, user_ttl = token_cache.ttl, user_cache.ttl
+
+    decode, verifications = utils.decode_jwt, 0
+
+    def counting_decode(token):
+        nonlocal verifications
+        verifications += 1
+        return decode(token)
+
+    utils.decode_jwt = counting_decode
+    try:
+        print(f"{'caches':>14} {'auth cpu us':>12} {'verifications':>15}")
+        for name, ttls in (("none", (0, 0)), ("token", (300, 0)), ("token + user", (300, 5))):
+            token_cache.ttl, user_cache.ttl = ttls
+            token_cache.clear()
+            user_cache.clear()
+            verifications = 0
+            auth = asyncio.run(authenticate(bench_engine, tokens, args.requests))
+            print(f"{name:>14} {auth:>12.1f} {verifications:>15}")
+    finally:
+        utils.decode_jwt = decode
+        token_cache.ttl, user_cache.ttl = token_ttl, user_ttl
+        asyncio.run(bench_engine.dispose())
+        engine.dispose()
+        os.remove(path)
+
+
+if __name__ == "__main__":
+    main()
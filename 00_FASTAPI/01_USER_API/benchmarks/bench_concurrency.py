@@ -0,0 +1,78 @@
+"""
+Requests per second of the read routes (`GET /api/v1/user/{id}` and a cursor
+page of `GET /api/v1/user/`) with 1, 64 and 512 concurrent clients, served by
+uvicorn. Run from the 01_USER_API directory:
+
+    python -m benchmarks.bench_concurrency --seconds 10
+
+With `--database-url postgresql://...` the users are copied to that database
+(psycopg2 is needed for the copy) and the app serves it through asyncpg.
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import time
+import httpx
+from benchmarks.common import copy_database, make_users_db, percentile, serve
+
+
+async def load(url: str, clients: int, seconds: float, rows: int):
+    latencies, errors = [], 0
+    limits = httpx.Limits(max_connections=clients, max_keepalive_connections=clients)
+
+    async with httpx.AsyncClient(base_url=url, limits=limits, timeout=60) as client:
+        async def run(seed: int):
+            nonlocal errors
+            rnd = random.Random(seed)
+            while time.perf_counter() < deadline:
+                if rnd.random() < 0.5:
+                    path, params = f"/api/v1/user/{rnd.randint(1, rows)}", None
+                else:
+                    path, params = "/api/v1/user/", {"limit": 10}
+                start = time.perf_counter()
+                try:
+                    res = await client.get(path, params=params)
+                    if res.status_code != 200:
+                        errors += 1
+                except httpx.TransportError:
+                    errors += 1
+                latencies.append((time.perf_counter() - start) * 1000)
+
+        deadline = time.perf_counter() + seconds
+        start = time.perf_counter()
+        await asyncio.gather(*[run(i) for i in range(clients)])
+        elapsed = time.perf_counter() - start
+    return len(latencies) / elapsed, latencies, errors
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=10_000)
+    parser.add_argument("--seconds", type=float, default=10)
+    parser.add_argument("--clients", type=int, nargs="+", default=[1, 64, 512])
+    parser.add_argument("--database-url", help="serve this database rather than SQLite")
+    args = parser.parse_args()
+
+    engine, path = make_users_db(args.rows)
+    env = {}
+    if args.database_url:
+        copy_database(engine, args.database_url)
+        env["DATABASE_URL"] = args.database_url
+    engine.dispose()
+    try:
+        with serve(path, **env) as url:
+            print(f"{'clients':>8} {'req/s':>10} {'p50 ms':>10} {'p99 ms':>10} {'errors':>8}")
+            for clients in args.clients:
+                rps, latencies, errors = asyncio.run(load(url, clients, args.seconds, args.rows))
+                print(
+                    f"{clients:>8} {rps:>10.0f} {percentile(latencies, 50):>10.2f}"
+                    f" {percentile(latencies, 99):>10.2f} {errors:>8}"
+                )
+    finally:
+        os.remove(path)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+"""
+Compares the buffered `GET /api/v1/user/users` export with the streamed one
+(`?stream=json` / `?stream=ndjson`): time to the first byte, total time and
+peak python memory. Run from the 01_USER_API directory:
+
+    python -m benchmarks.bench_export --rows 1000000
+"""
+
+import argparse
+import asyncio
+import os
+import time
+import tracemalloc
+from benchmarks.common import async_engine_for, make_users_db
+from db import new_session
+from routers.user import all as export_all, stream_users
+
+
+def measure(fn):
+    tracemalloc.start()
+    start = time.perf_counter()
+    first = fn()
+    total = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return first * 1000, total * 1000, peak / 2**20
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    args = parser.parse_args()
+
+    print(f"creating {args.rows} users...")
+    engine, path = make_users_db(args.rows)
+    bench_engine = async_engine_for(engine)
+    try:
+        async def export():
+            async with new_session(bench_engine) as session:
+                await export_all(session)
+
+        def buffered():
+            start = time.perf_counter()
+            asyncio.run(export())
+            # nothing can be sent before the whole body is built
+            return time.perf_counter() - start
+
+        def streamed(format):
+            async def stream():
+                start = time.perf_counter()
+                first = None
+                async for _ in stream_users(bench_engine, format):
+                    if first is None:
+                        first = time.perf_counter() - start
+                return first
+
+            return lambda: asyncio.run(stream())
+
+        print(f"{'mode':>10} {'first byte ms':>15} {'total ms':>12} {'peak MiB':>10}")
+        for name, fn in (
+            ("buffered", buffered),
+            ("json", streamed("json")),
+            ("ndjson", streamed("ndjson")),
+        ):
+            first, total, peak = measure(fn)
+            print(f"{name:>10} {first:>15.2f} {total:>12.2f} {peak:>10.2f}")
+    finally:
+        asyncio.run(bench_engine.dispose())
+        engine.dispose()
+        os.remove(path)
+
+
+if __name__ == "__main__":
+    main()
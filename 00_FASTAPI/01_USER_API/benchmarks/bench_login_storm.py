@@ -0,0 +1,77 @@
+"""
+Measures the latency of `GET /api/v1/user/{id}` while other clients keep
+logging in. Hashing on the request threadpool (HASHING_WORKERS=0, the way it
+used to work) is compared with the hashing process pool. Run from the
+01_USER_API directory:
+
+    python -m benchmarks.bench_login_storm --storm 64 --seconds 10
+"""
+
+import argparse
+import asyncio
+import os
+import time
+import httpx
+from benchmarks.common import add_user, make_users_db, percentile, serve
+
+
+async def storm(url: str, clients: int, probes: int, seconds: float):
+    latencies, logins, busy = [], 0, 0
+    deadline = time.perf_counter() + seconds
+    limits = httpx.Limits(max_connections=clients + probes)
+
+    async with httpx.AsyncClient(base_url=url, limits=limits, timeout=60) as client:
+        async def login():
+            nonlocal logins, busy
+            while time.perf_counter() < deadline:
+                res = await client.post(
+                    "/api/v1/auth/login",
+                    json={"usernameOrEmail": "stormuser", "password": "Password@15"},
+                )
+                if res.status_code == 429:
+                    busy += 1
+                else:
+                    logins += 1
+
+        async def probe():
+            while time.perf_counter() < deadline:
+                start = time.perf_counter()
+                await client.get("/api/v1/user/1")
+                latencies.append((time.perf_counter() - start) * 1000)
+                await asyncio.sleep(0.01)
+
+        await asyncio.gather(
+            *[login() for _ in range(clients)], *[probe() for _ in range(probes)]
+        )
+    return latencies, logins, busy
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--storm", type=int, default=64, help="concurrent login clients")
+    parser.add_argument("--probes", type=int, default=4)
+    parser.add_argument("--seconds", type=float, default=10)
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    args = parser.parse_args()
+
+    engine, path = make_users_db(1_000)
+    engine.dispose()
+    add_user(path, "stormuser", "storm@gmail.com", "Password@15")
+    try:
+        print(f"{'hashing':>14} {'p50 ms':>10} {'p99 ms':>10} {'logins/s':>10} {'429s':>8}")
+        for name, workers in (("threadpool", 0), (f"{args.workers} processes", args.workers)):
+            # the storm comes from one client, which the rate limiter would stop
+            with serve(path, HASHING_WORKERS=workers, RATE_LIMIT=0) as url:
+                latencies, logins, busy = asyncio.run(
+                    storm(url, args.storm, args.probes, args.seconds)
+                )
+            print(
+                f"{name:>14} {percentile(latencies, 50):>10.2f} {percentile(latencies, 99):>10.2f}"
+                f" {logins / args.seconds:>10.1f} {busy:>8}"
+            )
+    finally:
+        os.remove(path)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+"""
+Compares sending every email on a new connection (the old `send_email`) with
+the `MailDispatcher` connection pool. By default the server is simulated with
+a transport that sleeps to pretend a TLS handshake + login and a send, pass
+--smtp host:port to use a real local server instead, e.g.:
+
+    python -m aiosmtpd -n -l localhost:8025
+    python -m benchmarks.bench_mail --smtp localhost:8025
+
+Run from the 01_USER_API directory:
+
+    python -m benchmarks.bench_mail --messages 500
+"""
+
+import argparse
+import time
+from mail import MailDispatcher, MemoryTransport, SMTPTransport, build_message
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--messages", type=int, default=500)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--connect-ms", type=float, default=150)
+    parser.add_argument("--send-ms", type=float, default=5)
+    parser.add_argument("--smtp", default=None, help="host:port of a local smtp server")
+    args = parser.parse_args()
+
+    if args.smtp is not None:
+        host, port = args.smtp.split(":")
+
+        def transport():
+            return SMTPTransport(host, int(port), None, None, use_ssl=False)
+    else:
+        def transport():
+            return MemoryTransport(
+                connect_delay=args.connect_ms / 1000, send_delay=args.send_ms / 1000
+            )
+
+    start = time.perf_counter()
+    for i in range(args.messages):
+        t = transport()
+        t.send(build_message("Verify Email", f"user{i}@gmail.com", "<p>hi</p>"))
+        t.close()
+    per_message = time.perf_counter() - start
+
+    dispatcher = MailDispatcher(transport, workers=args.workers)
+    start = time.perf_counter()
+    for i in range(args.messages):
+        dispatcher.enqueue("Verify Email", f"user{i}@gmail.com", "<p>hi</p>")
+    enqueued = time.perf_counter() - start
+    dispatcher.stop()
+    pooled = time.perf_counter() - start
+
+    print(f"{'mode':>24} {'seconds':>10} {'messages/s':>12}")
+    print(f"{'connection per message':>24} {per_message:>10.2f} {args.messages / per_message:>12.1f}")
+    print(f"{f'{args.workers} pooled connections':>24} {pooled:>10.2f} {args.messages / pooled:>12.1f}")
+    print(f"time spent enqueuing (what a request waits for): {enqueued * 1000 / args.messages:.3f} ms/message")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+"""
+Compares OFFSET pagination with cursor (keyset) pagination on a large user
+table. Run from the 01_USER_API directory:
+
+    python -m benchmarks.bench_pagination --rows 1000000
+"""
+
+import argparse
+import os
+from sqlalchemy import text
+from benchmarks.common import client_for, make_users_db, timed
+from pagination import encode_cursor
+
+
+def cursor_at(engine, sort: str, row: int) -> str | None:
+    # the cursor a client following `next` links would hold after `row` rows,
+    # computed once up front so that it is not part of the timings
+    if row == 0:
+        return None
+    if sort == "id":
+        return encode_cursor("id", "asc", (row,))
+    with engine.connect() as conn:
+        key = conn.execute(
+            text(
+                'SELECT "lastName", "firstName", id FROM user '
+                'ORDER BY "lastName", "firstName", id LIMIT 1 OFFSET :row'
+            ),
+            {"row": row - 1},
+        ).one()
+    return encode_cursor("name", "asc", tuple(key))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--per-page", type=int, default=20)
+    args = parser.parse_args()
+
+    print(f"creating {args.rows} users...")
+    engine, path = make_users_db(args.rows)
+    client = client_for(engine)
+    try:
+        last_page = args.rows // args.per_page
+        pages = [p for p in (1, 10, 100, 1_000, 10_000) if p < last_page] + [last_page]
+        print(f"{'page':>10} {'offset ms':>12} {'cursor(id) ms':>15} {'cursor(name) ms':>17}")
+        for page in pages:
+            row = (page - 1) * args.per_page
+            by_id, by_name = cursor_at(engine, "id", row), cursor_at(engine, "name", row)
+            offset_ms = timed(
+                lambda: client.get(
+                    "/api/v1/user/", params={"page": page, "per_page": args.per_page}
+                )
+            )
+            id_ms = timed(
+                lambda: client.get(
+                    "/api/v1/user/", params={"limit": args.per_page, "after": by_id}
+                )
+            )
+            name_ms = timed(
+                lambda: client.get(
+                    "/api/v1/user/",
+                    params={"limit": args.per_page, "sort": "name", "after": by_name},
+                )
+            )
+            print(f"{page:>10} {offset_ms:>12.2f} {id_ms:>15.2f} {name_ms:>17.2f}")
+    finally:
+        client.app.dependency_overrides.clear()
+        engine.dispose()
+        os.remove(path)
+
+
+if __name__ == "__main__":
+    main()
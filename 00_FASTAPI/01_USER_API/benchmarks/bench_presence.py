@@ -0,0 +1,79 @@
+"""
+Throughput and latency of `POST /api/v1/auth/logout`, then of
+`POST /api/v1/auth/login`, with the login state written on every request
+(PRESENCE_MODE=write-through, the way it used to work) and written behind in
+batches. Logout does no password hashing, so it shows the cost of the write
+itself. The server syncs every commit (SQLITE_SYNCHRONOUS=FULL) unless
+--synchronous says otherwise. Run from the 01_USER_API directory:
+
+    python -m benchmarks.bench_presence --clients 4 --login-clients 2 --seconds 10
+"""
+
+import argparse
+import asyncio
+import os
+import time
+import httpx
+from benchmarks.common import add_user, make_users_db, percentile, serve
+
+
+async def load(url: str, clients: int, seconds: float, login: bool):
+    latencies = []
+    limits = httpx.Limits(max_connections=clients, max_keepalive_connections=clients)
+    credentials = {"usernameOrEmail": "presenceuser", "password": "Password@15"}
+
+    async with httpx.AsyncClient(base_url=url, limits=limits, timeout=60) as client:
+        jwt = (await client.post("/api/v1/auth/login", json=credentials)).json()["jwt"]
+        headers = {"Authorization": f"Bearer {jwt}"}
+
+        async def run():
+            while time.perf_counter() < deadline:
+                start = time.perf_counter()
+                if login:
+                    res = await client.post("/api/v1/auth/login", json=credentials)
+                else:
+                    res = await client.post("/api/v1/auth/logout", headers=headers)
+                assert res.status_code == 200, res.text
+                latencies.append((time.perf_counter() - start) * 1000)
+
+        deadline = time.perf_counter() + seconds
+        start = time.perf_counter()
+        await asyncio.gather(*[run() for _ in range(clients)])
+        elapsed = time.perf_counter() - start
+    return len(latencies) / elapsed, latencies
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--clients", type=int, default=4, help="concurrent logout clients")
+    parser.add_argument("--login-clients", type=int, default=2)
+    parser.add_argument("--seconds", type=float, default=10)
+    parser.add_argument("--synchronous", default="FULL", help="SQLITE_SYNCHRONOUS of the server")
+    args = parser.parse_args()
+
+    print(
+        f"{'presence':>13} {'logout/s':>9} {'logout p50':>11} {'logout p99':>11}"
+        f" {'login/s':>8} {'login p50':>10} {'login p99':>10}"
+    )
+    for mode in ("write-through", "write-behind"):
+        engine, path = make_users_db(1_000)
+        engine.dispose()
+        add_user(path, "presenceuser", "presence@gmail.com", "Password@15")
+        try:
+            with serve(
+                path, PRESENCE_MODE=mode, SQLITE_SYNCHRONOUS=args.synchronous, RATE_LIMIT=0
+            ) as url:
+                logout_rps, logouts = asyncio.run(load(url, args.clients, args.seconds, False))
+                login_rps, logins = asyncio.run(load(url, args.login_clients, args.seconds, True))
+            print(
+                f"{mode:>13} {logout_rps:>9.0f} {percentile(logouts, 50):>11.2f} {percentile(logouts, 99):>11.2f}"
+                f" {login_rps:>8.0f} {percentile(logins, 50):>10.2f} {percentile(logins, 99):>10.2f}"
+            )
+        finally:
+            for suffix in ("", "-wal", "-shm"):
+                if os.path.exists(path + suffix):
+                    os.remove(path + suffix)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,136 @@
+"""
+Logins of legitimate users while attackers try wrong passwords on other
+accounts from a few IPs (credential stuffing), with the rate limiter off and
+on. Every attempt on an existing account costs an Argon2 verify unless the
+limiter rejects it first. The attack runs for --warmup seconds before the
+legitimate users are measured, so that the attackers have used up what the
+limits allow at once. Each account and each legitimate user has its own IP
+(X-Forwarded-For, trusted by the server). Run from the 01_USER_API directory:
+
+    python -m benchmarks.bench_ratelimit --attackers 32 --users 2 --seconds 20
+"""
+
+import argparse
+import asyncio
+import itertools
+import os
+import sqlite3
+import time
+import httpx
+from argon2 import PasswordHasher
+from benchmarks.common import make_users_db, percentile, serve
+
+LIMITS = {
+    "RATE_LIMIT_LOGIN_IP": "10/60",
+    "RATE_LIMIT_LOGIN_ACCOUNT": "10/60",
+    "RATE_LIMIT_TRUST_FORWARDED": 1,
+}
+
+
+def add_accounts(path: str, prefix: str, count: int, password: str):
+    hashed = PasswordHasher().hash(password)
+    conn = sqlite3.connect(path)
+    conn.executemany(
+        'INSERT INTO user ("firstName", "lastName", password, email, username,'
+        ' avatar, verified, "loggedIn", "verificationToken") VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+        [
+            ("Jonh", "Doe", hashed, f"{prefix}{i}@gmail.com", f"{prefix}{i}",
+             "http://127.0.0.1:8000/storage/default.png", True, False, "000000")
+            for i in range(count)
+        ],
+    )
+    conn.commit()
+    conn.close()
+
+
+async def load(url: str, attackers: int, attack_ips: int, users: int, accounts: int,
+               warmup: float, seconds: float, think: float):
+    latencies, failed = [], 0
+    attacks = {"hashed": 0, "rejected": 0}
+    limits = httpx.Limits(max_connections=attackers + users)
+    victims = itertools.cycle(range(accounts))
+    logins = itertools.cycle(range(accounts))
+
+    async with httpx.AsyncClient(base_url=url, limits=limits, timeout=60) as client:
+        async def attack(i: int):
+            headers = {"X-Forwarded-For": f"10.66.0.{i % attack_ips}"}
+            while time.perf_counter() < deadline:
+                res = await client.post(
+                    "/api/v1/auth/login",
+                    json={"usernameOrEmail": f"victim{next(victims)}", "password": "Guess@1234"},
+                    headers=headers,
+                )
+                if res.status_code == 200:
+                    attacks["hashed"] += 1
+                else:
+                    attacks["rejected"] += 1
+
+        async def user():
+            nonlocal failed
+            await asyncio.sleep(warmup)
+            while time.perf_counter() < deadline:
+                i = next(logins)
+                start = time.perf_counter()
+                res = await client.post(
+                    "/api/v1/auth/login",
+                    json={"usernameOrEmail": f"member{i}", "password": "Password@15"},
+                    headers={"X-Forwarded-For": f"10.1.0.{i}"},
+                )
+                if res.status_code == 200 and res.json()["jwt"]:
+                    latencies.append((time.perf_counter() - start) * 1000)
+                else:
+                    failed += 1
+                await asyncio.sleep(think)
+
+        deadline = time.perf_counter() + warmup + seconds
+        await asyncio.gather(
+            *[attack(i) for i in range(attackers)], *[user() for _ in range(users)]
+        )
+    return latencies, failed, attacks
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--attackers", type=int, default=32, help="concurrent attacking clients")
+    parser.add_argument("--attack-ips", type=int, default=4)
+    parser.add_argument("--users", type=int, default=2, help="concurrent legitimate clients")
+    parser.add_argument("--accounts", type=int, default=20)
+    parser.add_argument("--think", type=float, default=0.5, help="seconds between the logins of a user")
+    parser.add_argument("--warmup", type=float, default=10)
+    parser.add_argument("--seconds", type=float, default=20)
+    args = parser.parse_args()
+
+    engine, path = make_users_db(1_000)
+    engine.dispose()
+    add_accounts(path, "member", args.accounts, "Password@15")
+    add_accounts(path, "victim", args.accounts, "Password@15")
+    cases = (
+        ("no attack", 0, {"RATE_LIMIT": 0}),
+        ("limiter off", args.attackers, {"RATE_LIMIT": 0}),
+        ("limiter on", args.attackers, {"RATE_LIMIT": 1, **LIMITS}),
+    )
+    try:
+        print(
+            f"{'case':>12} {'logins/s':>9} {'p50 ms':>8} {'p99 ms':>8} {'failed':>7}"
+            f" {'attacks hashed':>15} {'attacks rejected':>17}"
+        )
+        for name, attackers, env in cases:
+            with serve(path, **env) as url:
+                latencies, failed, attacks = asyncio.run(
+                    load(url, attackers, args.attack_ips, args.users, args.accounts,
+                         args.warmup if attackers else 0, args.seconds, args.think)
+                )
+            print(
+                f"{name:>12} {len(latencies) / args.seconds:>9.2f}"
+                f" {percentile(latencies, 50) if latencies else 0:>8.0f}"
+                f" {percentile(latencies, 99) if latencies else 0:>8.0f} {failed:>7}"
+                f" {attacks['hashed']:>15} {attacks['rejected']:>17}"
+            )
+    finally:
+        for suffix in ("", "-wal", "-shm"):
+            if os.path.exists(path + suffix):
+                os.remove(path + suffix)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+"""
+Cost of fetching a large listing as `User` ORM objects (every column, added
+to the identity map of the session) against the returned columns selected as
+rows, the way the GET routes read users: fetch time and python memory per
+row while the rows are held. Run from the 01_USER_API directory:
+
+    python -m benchmarks.bench_read_model --rows 100000
+"""
+
+import argparse
+import asyncio
+import os
+import time
+import tracemalloc
+from sqlmodel import select
+from benchmarks.common import async_engine_for, make_users_db
+from db import new_session
+from models import User
+from routers.user import user_fields
+
+CASES = {
+    "orm entities": lambda: select(User),
+    "projected rows": lambda: select(*user_fields.columns()),
+}
+
+
+async def measure(engine, statement, repeat: int):
+    best = float("inf")
+    for _ in range(repeat):
+        async with new_session(engine) as session:
+            start = time.perf_counter()
+            rows = (await session.exec(statement())).all()
+            best = min(best, time.perf_counter() - start)
+        del rows
+
+    async with new_session(engine) as session:
+        tracemalloc.start()
+        rows = (await session.exec(statement())).all()
+        held, _ = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        count = len(rows)
+    return best * 1000, held / count, count
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=100_000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    engine, path = make_users_db(args.rows)
+    engine.dispose()
+
+    async def run():
+        bench_engine = async_engine_for(engine)
+        try:
+            print(f"{'fetch':>15} {'ms':>8} {'bytes/row':>10}")
+            for name, statement in CASES.items():
+                ms, per_row, count = await measure(bench_engine, statement, args.repeat)
+                assert count == args.rows
+                print(f"{name:>15} {ms:>8.0f} {per_row:>10.0f}")
+        finally:
+            await bench_engine.dispose()
+
+    try:
+        asyncio.run(run())
+    finally:
+        for suffix in ("", "-wal", "-shm"):
+            if os.path.exists(path + suffix):
+                os.remove(path + suffix)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+"""
+CPU time and peak python memory of building the `GET /api/v1/user/users`
+response for a list of users, from the query to the rendered body:
+
+    - dicts + json: ORM objects, a dict built by hand per user and the
+      standard `JSONResponse` (the way it used to be).
+    - dicts + orjson: the same dicts rendered by `FastJSONResponse`.
+    - rows + orjson: the mapped columns selected as rows, no ORM objects.
+
+Run from the 01_USER_API directory:
+
+    python -m benchmarks.bench_serialization --rows 10000 --repeat 20
+"""
+
+import argparse
+import asyncio
+import os
+import statistics
+import time
+import tracemalloc
+from fastapi.responses import JSONResponse
+from sqlmodel import select
+from benchmarks.common import async_engine_for, make_users_db
+from db import new_session
+from models import User
+from routers.user import collect_fields_from_rows, collect_fields_from_users, user_fields
+from serializers import FastJSONResponse
+
+
+async def dicts_json(session):
+    users = (await session.exec(select(User))).all()
+    return JSONResponse([collect_fields_from_users(u) for u in users]).body
+
+
+async def dicts_orjson(session):
+    users = (await session.exec(select(User))).all()
+    return FastJSONResponse([collect_fields_from_users(u) for u in users]).body
+
+
+async def rows_orjson(session):
+    rows = (await session.exec(select(*user_fields.columns()))).all()
+    return FastJSONResponse(collect_fields_from_rows(rows)).body
+
+
+CASES = {
+    "dicts + json": dicts_json,
+    "dicts + orjson": dicts_orjson,
+    "rows + orjson": rows_orjson,
+}
+
+
+async def measure(engine, build, repeat: int):
+    times = []
+    for _ in range(repeat):
+        async with new_session(engine) as session:
+            start = time.process_time()
+            await build(session)
+            times.append((time.process_time() - start) * 1000)
+
+    tracemalloc.start()
+    async with new_session(engine) as session:
+        body = await build(session)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return statistics.median(times), peak / 2**20, len(body)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=10_000)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    engine, path = make_users_db(args.rows)
+    engine.dispose()
+
+    async def run():
+        # a single event loop, the pooled aiosqlite connections belong to it
+        bench_engine = async_engine_for(engine)
+        try:
+            print(f"{'path':>16} {'cpu ms':>8} {'peak MiB':>9} {'body KiB':>9}")
+            for name, build in CASES.items():
+                cpu, peak, size = await measure(bench_engine, build, args.repeat)
+                print(f"{name:>16} {cpu:>8.1f} {peak:>9.1f} {size / 1024:>9.0f}")
+        finally:
+            await bench_engine.dispose()
+
+    try:
+        asyncio.run(run())
+    finally:
+        for suffix in ("", "-wal", "-shm"):
+            if os.path.exists(path + suffix):
+                os.remove(path + suffix)
+
+
+if __name__ == "__main__":
+    main()
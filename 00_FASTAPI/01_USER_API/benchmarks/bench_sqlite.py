@@ -0,0 +1,138 @@
+"""
+Mixed read/write load with the SQLite tuning off (SQLITE_TUNING=0: rollback
+journal, full syncs, one shared pool) and on (WAL, synchronous=NORMAL, busy
+timeout, separate read pool). It is measured twice: on the engines directly
+(primary key SELECTs and UPDATEs from concurrent tasks) and through uvicorn
+(`GET /api/v1/user/{id}` and `PUT /api/v1/user/{id}`). Run from the
+01_USER_API directory:
+
+    python -m benchmarks.bench_sqlite --clients 32 --writes 0.2 --seconds 10
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import time
+import httpx
+from sqlalchemy import text
+from benchmarks.common import make_users_db, percentile, serve
+from db import make_engine
+
+NAMES = ["Jonh", "Peter", "Mary", "Anna"]
+
+
+async def load_engines(path: str, tuned: bool, tasks: int, writes: float, seconds: float, rows: int):
+    engine = make_engine(f"sqlite:///{path}", tuned=tuned)
+    read_engine = make_engine(f"sqlite:///{path}", read_only=True, tuned=tuned) if tuned else engine
+    done, errors = 0, 0
+
+    async def run(seed: int):
+        nonlocal done, errors
+        rnd = random.Random(seed)
+        while time.perf_counter() < deadline:
+            params = {"id": rnd.randint(1, rows), "firstName": rnd.choice(NAMES)}
+            try:
+                if rnd.random() < writes:
+                    async with engine.begin() as conn:
+                        await conn.execute(
+                            text('UPDATE user SET "firstName" = :firstName WHERE id = :id'), params
+                        )
+                else:
+                    async with read_engine.connect() as conn:
+                        (await conn.execute(text("SELECT * FROM user WHERE id = :id"), params)).all()
+                done += 1
+            except Exception:
+                errors += 1
+
+    try:
+        deadline = time.perf_counter() + seconds
+        start = time.perf_counter()
+        await asyncio.gather(*[run(i) for i in range(tasks)])
+        return done / (time.perf_counter() - start), errors
+    finally:
+        await engine.dispose()
+        if read_engine is not engine:
+            await read_engine.dispose()
+
+
+async def load(url: str, clients: int, writes: float, seconds: float, rows: int):
+    reads, updates, errors = [], [], 0
+    limits = httpx.Limits(max_connections=clients, max_keepalive_connections=clients)
+
+    async with httpx.AsyncClient(base_url=url, limits=limits, timeout=60) as client:
+        async def run(seed: int):
+            nonlocal errors
+            rnd = random.Random(seed)
+            while time.perf_counter() < deadline:
+                id = rnd.randint(1, rows)
+                write = rnd.random() < writes
+                start = time.perf_counter()
+                try:
+                    if write:
+                        res = await client.put(
+                            f"/api/v1/user/{id}", json={"firstName": rnd.choice(NAMES)}
+                        )
+                    else:
+                        res = await client.get(f"/api/v1/user/{id}")
+                    if res.status_code != 200:
+                        errors += 1
+                except httpx.TransportError:
+                    errors += 1
+                (updates if write else reads).append((time.perf_counter() - start) * 1000)
+
+        deadline = time.perf_counter() + seconds
+        start = time.perf_counter()
+        await asyncio.gather(*[run(i) for i in range(clients)])
+        elapsed = time.perf_counter() - start
+    return (len(reads) + len(updates)) / elapsed, reads, updates, errors
+
+
+def remove(path: str):
+    for suffix in ("", "-wal", "-shm"):
+        if os.path.exists(path + suffix):
+            os.remove(path + suffix)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=10_000)
+    parser.add_argument("--clients", type=int, default=32)
+    parser.add_argument("--writes", type=float, default=0.2, help="share of PUT requests")
+    parser.add_argument("--seconds", type=float, default=10)
+    args = parser.parse_args()
+
+    cases = (("default", 0), ("tuned", 1))
+    print("engines")
+    print(f"{'sqlite':>8} {'ops/s':>8} {'errors':>7}")
+    for name, tuning in cases:
+        engine, path = make_users_db(args.rows)
+        engine.dispose()
+        try:
+            ops, errors = asyncio.run(
+                load_engines(path, bool(tuning), args.clients, args.writes, args.seconds, args.rows)
+            )
+            print(f"{name:>8} {ops:>8.0f} {errors:>7}")
+        finally:
+            remove(path)
+
+    print("http")
+    print(f"{'sqlite':>8} {'req/s':>8} {'read p50':>9} {'read p99':>9} {'write p50':>10} {'write p99':>10} {'errors':>7}")
+    for name, tuning in cases:
+        engine, path = make_users_db(args.rows)
+        engine.dispose()
+        try:
+            with serve(path, SQLITE_TUNING=tuning) as url:
+                rps, reads, updates, errors = asyncio.run(
+                    load(url, args.clients, args.writes, args.seconds, args.rows)
+                )
+            print(
+                f"{name:>8} {rps:>8.0f} {percentile(reads, 50):>9.2f} {percentile(reads, 99):>9.2f}"
+                f" {percentile(updates, 50):>10.2f} {percentile(updates, 99):>10.2f} {errors:>7}"
+            )
+        finally:
+            remove(path)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+"""
+Requests per second for a hot set of avatars served by starlette's
+StaticFiles and by `files.StorageFiles` (from disk, from memory, and clients
+revalidating their cached copy with If-None-Match). Run from the 01_USER_API
+directory:
+
+    python -m benchmarks.bench_storage --files 200 --requests 5000
+"""
+
+import argparse
+import asyncio
+import hashlib
+import os
+import random
+import shutil
+import tempfile
+import time
+import httpx
+from fastapi import FastAPI
+from fastapi.staticfiles import StaticFiles
+from files import StorageFiles
+
+
+def make_avatars(directory: str, count: int, size: int) -> list[str]:
+    rnd = random.Random(0)
+    names = []
+    for _ in range(count):
+        content = rnd.randbytes(size)
+        name = f"{hashlib.sha256(content).hexdigest()}-256.webp"
+        with open(os.path.join(directory, name), "wb") as f:
+            f.write(content)
+        names.append(name)
+    return names
+
+
+async def run(files, names: list[str], requests: int, concurrency: int, revalidate: bool) -> float:
+    app = FastAPI()
+    app.mount("/storage", files, name="storage")
+    transport = httpx.ASGITransport(app=app)
+    rnd = random.Random(1)
+    paths = [rnd.choice(names) for _ in range(requests)]
+    etags = {}
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        if revalidate:
+            for name in names:
+                etags[name] = (await client.get(f"/storage/{name}")).headers["etag"]
+
+        async def worker(share: list[str]):
+            for name in share:
+                headers = {"If-None-Match": etags[name]} if revalidate else {}
+                res = await client.get(f"/storage/{name}", headers=headers)
+                assert res.status_code == (304 if revalidate else 200)
+
+        start = time.perf_counter()
+        await asyncio.gather(*[worker(paths[i::concurrency]) for i in range(concurrency)])
+        return requests / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--files", type=int, default=200)
+    parser.add_argument("--size", type=int, default=16 * 1024)
+    parser.add_argument("--requests", type=int, default=5000)
+    parser.add_argument("--concurrency", type=int, default=16)
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp()
+    try:
+        names = make_avatars(directory, args.files, args.size)
+        cases = (
+            ("StaticFiles", lambda: StaticFiles(directory=directory), False),
+            ("StorageFiles disk", lambda: StorageFiles(directory=directory, cache_max_bytes=0), False),
+            ("StorageFiles memory", lambda: StorageFiles(directory=directory), False),
+            ("StorageFiles 304", lambda: StorageFiles(directory=directory), True),
+        )
+        print(f"{args.files} files of {args.size} bytes, {args.requests} requests")
+        print(f"{'server':>20} {'req/s':>10}")
+        for name, factory, revalidate in cases:
+            files = factory()
+            # warm up, the hot set is in memory before it is measured
+            asyncio.run(run(files, names, args.files, 1, False))
+            rps = asyncio.run(run(files, names, args.requests, args.concurrency, revalidate))
+            print(f"{name:>20} {rps:>10.0f}")
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == "__main__":
+    main()
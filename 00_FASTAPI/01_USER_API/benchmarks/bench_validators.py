@@ -0,0 +1,120 @@
+"""
+Microbenchmarks for the validators in `utils`, over realistic and adversarial
+inputs, and a scaling check that every pattern stays linear in the length of
+its input (a backtracking pattern would grow quadratically or worse). Run from
+the 01_USER_API directory:
+
+    python -m benchmarks.bench_validators --records 100000
+"""
+
+import argparse
+import random
+import re
+import string
+import time
+from utils import (
+    EMAIL_REGEX,
+    NAME_REGEX,
+    PASSWORD_REGEX,
+    USERNAME_REGEX,
+    USER_FIELDS,
+    validate_many,
+)
+
+
+def corpus(records: int) -> list[dict]:
+    rnd = random.Random(0)
+    letters = string.ascii_letters + string.digits
+    result = []
+    for i in range(records):
+        kind = i % 4
+        if kind == 0:  # valid
+            record = {
+                "username": f"user.{i:08d}",
+                "email": f"user{i}@gmail.com",
+                "firstName": rnd.choice(["Jonh", "Mary", "Peter"]),
+                "lastName": rnd.choice(["Doe", "Smith", "Brown"]),
+                "password": f"Password@{i}",
+            }
+        elif kind == 1:  # typos
+            record = {
+                "username": f"user__{i}",
+                "email": f"user{i}gmail.com",
+                "firstName": "J0hn",
+                "lastName": "D",
+                "password": "password",
+            }
+        elif kind == 2:  # random noise
+            record = {
+                f: "".join(rnd.choice(letters + "@._-!") for _ in range(rnd.randint(1, 40)))
+                for f in USER_FIELDS
+            }
+        else:  # adversarial, long inputs that only fail at the very end
+            record = {
+                "username": "a" * 1000 + "!",
+                "email": "a" * 1000 + "@" + "a-" * 500,
+                "firstName": "a" * 1000 + "0",
+                "lastName": "a." * 500,
+                "password": "a1" * 500 + " ",
+            }
+        result.append(record)
+    return result
+
+
+def compile_every_call(records: list[dict]):
+    # how the validators used to work, re.compile on every call
+    patterns = {
+        "username": USERNAME_REGEX.pattern,
+        "email": EMAIL_REGEX.pattern,
+        "firstName": NAME_REGEX.pattern,
+        "lastName": NAME_REGEX.pattern,
+        "password": PASSWORD_REGEX.pattern,
+    }
+    out = []
+    for record in records:
+        errors = {}
+        for field, (_, normalize, error) in USER_FIELDS.items():
+            if re.compile(patterns[field]).match(normalize(record[field])) is None:
+                errors[field] = error
+        out.append(errors)
+    return out
+
+
+def scaling(regex, make, sizes=(10_000, 40_000, 160_000)) -> list[float]:
+    times = []
+    for n in sizes:
+        text = make(n)
+        start = time.perf_counter()
+        regex.match(text)
+        times.append(time.perf_counter() - start)
+    return times
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--records", type=int, default=100_000)
+    args = parser.parse_args()
+
+    records = corpus(args.records)
+    for name, fn in (("compile every call", compile_every_call), ("precompiled", validate_many)):
+        start = time.perf_counter()
+        fn(records)
+        elapsed = time.perf_counter() - start
+        print(f"{name:>20}: {elapsed:.3f}s ({args.records / elapsed:,.0f} records/s)")
+
+    print("\nscaling (time for 10k, 40k, 160k chars, each step is 4x the input)")
+    cases = {
+        "email": (EMAIL_REGEX, lambda n: "a" * n + "@" + "a-" * n),
+        "username": (USERNAME_REGEX, lambda n: "a" * n + "!"),
+        "password": (PASSWORD_REGEX, lambda n: "a1" * n + " "),
+        "name": (NAME_REGEX, lambda n: "a" * n + "0"),
+    }
+    for name, (regex, make) in cases.items():
+        times = scaling(regex, make)
+        ratio = max(b / a for a, b in zip(times, times[1:]) if a > 0)
+        verdict = "linear" if ratio < 8 else "SUPERLINEAR"
+        print(f"{name:>10}: " + ", ".join(f"{t * 1000:.2f}ms" for t in times) + f"  max step x{ratio:.1f} {verdict}")
+
+
+if __name__ == "__main__":
+    main()
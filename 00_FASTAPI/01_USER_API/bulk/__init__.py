@@ -0,0 +1,164 @@
+"""
+Registers many users at once, used by `POST /api/v1/auth/register/bulk` and
+by the command line (`python -m bulk users.json`).
+
+The records are validated in one pass, then handled in chunks: one query
+checks the usernames and emails of a whole chunk, the passwords of the chunk
+are hashed in parallel by the hashing pool, and the users of the chunk and
+their verification tokens are inserted in a single transaction.
+
+Chunks are smaller than CHUNK_SIZE when the database limits the parameters of
+a statement: SQLite before 3.32 allows 999 (SQLITE_MAX_VARIABLE_NUMBER), and
+the tokens of a chunk are written by one INSERT with three per user.
+"""
+
+import time
+from sqlalchemy import insert
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.exc import IntegrityError
+from sqlmodel import select, or_
+from sqlmodel.ext.asyncio.session import AsyncSession
+from db import release_connection
+from hashing import hashing_pool, HashingPoolSaturated
+from models import User
+from utils import validate_many
+from verification import tokens
+
+CHUNK_SIZE = 500
+# the most parameters a statement of a chunk binds per user: the tokens
+# upsert binds the user id, the token and the expiry, `taken` two
+PARAMETERS_PER_USER = 3
+DEFAULT_AVATAR = "http://127.0.0.1:8000/storage/default.png"
+
+
+def normalize(record: dict) -> dict:
+    return {
+        "username": record["username"].strip().lower(),
+        "email": record["email"].strip().lower(),
+        "firstName": record["firstName"].strip().capitalize(),
+        "lastName": record["lastName"].strip().capitalize(),
+        "password": record["password"].strip(),
+    }
+
+
+def max_chunk_size(session: AsyncSession) -> int:
+    # SQLAlchemy lowers this to 999 for the SQLite versions that have the limit
+    return session.bind.dialect.insertmanyvalues_max_parameters // PARAMETERS_PER_USER
+
+
+async def taken(session: AsyncSession, rows: list[dict]) -> tuple[set, set]:
+    usernames = [row["username"] for row in rows]
+    emails = [row["email"] for row in rows]
+    found = (
+        await session.exec(
+            select(User.username, User.email).where(
+                or_(User.username.in_(usernames), User.email.in_(emails))
+            )
+        )
+    ).all()
+    return {u for u, _ in found}, {e for _, e in found}
+
+
+async def insert_rows(session: AsyncSession, rows: list[dict]) -> list[int | None]:
+    """
+    Inserts the rows and returns their ids, None for the ones that failed.
+    The caller commits.
+    """
+    statement = insert(User).returning(User.id, sort_by_parameter_order=True)
+    try:
+        return list((await session.exec(statement, params=rows)).scalars())
+    except IntegrityError:
+        # someone registered one of the usernames or emails since the check,
+        # fall back to inserting the chunk row by row and skip the taken ones.
+        # Nothing else was written in this transaction yet
+        await session.rollback()
+    dialect = postgresql if session.bind.dialect.name == "postgresql" else sqlite
+    statement = dialect.insert(User).on_conflict_do_nothing().returning(User.id)
+    return [(await session.exec(statement, params=[row])).scalar_one_or_none() for row in rows]
+
+
+async def register_many(
+    session: AsyncSession,
+    records: list[dict],
+    chunk_size: int | None = None,
+    on_registered=None,
+) -> dict:
+    """
+    Returns a report with the id or the error of every record, in the order
+    they were given. `on_registered(row)` is called for every inserted user.
+    `chunk_size` defaults to CHUNK_SIZE and is capped by the parameter limit.
+    """
+    start = time.perf_counter()
+    chunk_size = max(1, min(chunk_size or CHUNK_SIZE, max_chunk_size(session)))
+    results = [{"index": i, "id": None, "error": None} for i in range(len(records))]
+
+    valid = []
+    for i, errors in enumerate(validate_many(records)):
+        if errors:
+            results[i]["error"] = next(iter(errors.values()))
+            results[i]["errors"] = errors
+        else:
+            valid.append((i, normalize(records[i])))
+
+    # duplicates inside the payload itself, the first one wins
+    seen_usernames, seen_emails, unique = set(), set(), []
+    for i, row in valid:
+        if row["username"] in seen_usernames:
+            results[i]["error"] = "The username is already in use."
+        elif row["email"] in seen_emails:
+            results[i]["error"] = "The email is already in use."
+        else:
+            seen_usernames.add(row["username"])
+            seen_emails.add(row["email"])
+            unique.append((i, row))
+
+    for offset in range(0, len(unique), chunk_size):
+        chunk = unique[offset : offset + chunk_size]
+        usernames, emails = await taken(session, [row for _, row in chunk])
+        rows, indexes = [], []
+        for i, row in chunk:
+            if row["username"] in usernames:
+                results[i]["error"] = "The username is already in use."
+            elif row["email"] in emails:
+                results[i]["error"] = "The email is already in use."
+            else:
+                rows.append(row)
+                indexes.append(i)
+        if not rows:
+            continue
+        await release_connection(session)
+        try:
+            hashes = await hashing_pool.hash_many([row["password"] for row in rows])
+        except HashingPoolSaturated:
+            # keep what was inserted so far, the rest can be sent again
+            for i, _ in unique[offset:]:
+                if results[i]["error"] is None:
+                    results[i]["error"] = "The server is busy, please try again later."
+            break
+        for row, hash in zip(rows, hashes):
+            row.update(
+                password=hash,
+                avatar=DEFAULT_AVATAR,
+                verified=False,
+                loggedIn=False,
+            )
+        ids = await insert_rows(session, rows)
+        otps = await tokens.issue_many(session, [id for id in ids if id is not None])
+        await session.commit()
+        for i, row, id in zip(indexes, rows, ids):
+            if id is None:
+                results[i]["error"] = "The username or email is already in use."
+                continue
+            results[i]["id"] = id
+            if on_registered is not None:
+                on_registered({**row, "id": id, "verificationToken": otps[id]})
+
+    seconds = time.perf_counter() - start
+    inserted = sum(1 for r in results if r["id"] is not None)
+    return {
+        "inserted": inserted,
+        "failed": len(records) - inserted,
+        "seconds": round(seconds, 4),
+        "usersPerSecond": round(inserted / seconds, 1) if seconds > 0 else None,
+        "results": results,
+    }
@@ -0,0 +1,61 @@
+"""
+Registers the users of a JSON file (an array of users) or a NDJSON file (one
+user per line) and prints a report. Run from the 01_USER_API directory:
+
+    python -m bulk users.json
+"""
+
+import argparse
+import asyncio
+import json
+from bulk import CHUNK_SIZE, register_many
+from db import engine, new_session
+from hashing import hashing_pool
+
+
+def read_users(path: str) -> list[dict]:
+    with open(path) as f:
+        text = f.read()
+    if text.lstrip().startswith("["):
+        return json.loads(text)
+    return [json.loads(line) for line in text.splitlines() if line.strip()]
+
+
+async def register(users: list[dict], chunk_size: int) -> dict:
+    try:
+        async with new_session() as session:
+            return await register_many(session, users, chunk_size)
+    finally:
+        await engine.dispose()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Register many users at once.")
+    parser.add_argument("file", help="a JSON array of users or a NDJSON file")
+    parser.add_argument(
+        "--chunk-size", type=int, default=CHUNK_SIZE,
+        help="users per transaction, capped by the parameter limit of the database",
+    )
+    parser.add_argument("--errors", action="store_true", help="print every failed row")
+    args = parser.parse_args()
+
+    users = read_users(args.file)
+    # there is no request to answer here, so wait for the pool instead of
+    # rejecting work
+    hashing_pool.max_pending = max(hashing_pool.max_pending, hashing_pool.max_workers)
+    try:
+        report = asyncio.run(register(users, args.chunk_size))
+    finally:
+        hashing_pool.shutdown()
+    print(
+        f"inserted {report['inserted']} of {len(users)} users in {report['seconds']}s"
+        f" ({report['usersPerSecond']} users/s), {report['failed']} failed"
+    )
+    if args.errors:
+        for result in report["results"]:
+            if result["error"] is not None:
+                print(f"  row {result['index']}: {result['error']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,5 @@
+import os
+
+# the tests register users, which queues verification emails: keep them in
+# memory rather than sending them through gmail
+os.environ.setdefault("MAIL_TRANSPORT", "memory")
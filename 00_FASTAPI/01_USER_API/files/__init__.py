@@ -0,0 +1,159 @@
+"""
+Serves `/storage`. On top of what starlette's StaticFiles does:
+
+    - files named after the sha256 of their content (the avatars, see
+      `avatars`) never change, they are sent with an immutable
+      `Cache-Control` and their hash as a strong ETag. Other files (e.g.
+      `default.png`) get the sha256 of their content as ETag and must be
+      revalidated, which is a `304 Not Modified` when they didn't change.
+    - small files are kept in memory (keyed by path, mtime and size so that a
+      changed file is read again) and sent without touching the disk.
+    - when the server supports the ASGI zero copy extension the other files
+      are sent with `sendfile`.
+
+Range requests, `If-Range` and HEAD are handled by starlette's FileResponse,
+which reads the file from the disk for them.
+
+Configuration (environment variables):
+    - STORAGE_MAX_AGE: max-age of the content hashed files, defaults to a year.
+    - STORAGE_CACHE_FILES: how many files are remembered, defaults to 512.
+    - STORAGE_CACHE_MAX_BYTES: files up to this size are kept in memory,
+      defaults to 128 KiB. 0 keeps none.
+"""
+
+import hashlib
+import os
+import re
+import stat
+import anyio
+from starlette.datastructures import Headers
+from starlette.responses import FileResponse
+from starlette.staticfiles import NotModifiedResponse, StaticFiles
+from starlette.types import Receive, Scope, Send
+from cache import TTLCache
+
+STORAGE_MAX_AGE = int(os.environ.get("STORAGE_MAX_AGE", 365 * 24 * 3600))
+STORAGE_CACHE_FILES = int(os.environ.get("STORAGE_CACHE_FILES", 512))
+STORAGE_CACHE_MAX_BYTES = int(os.environ.get("STORAGE_CACHE_MAX_BYTES", 128 * 1024))
+
+# <sha256>.<ext> or <sha256>-<variant>.<ext>
+HASHED_NAME = re.compile(r"([0-9a-f]{64})(?:-[0-9a-z]+)?\.[0-9a-z]+")
+ZEROCOPY = "http.response.zerocopysend"
+
+
+class StoredFile:
+    def __init__(self, etag: str, immutable: bool, content: bytes | None):
+        self.etag = etag
+        self.immutable = immutable
+        self.content = content
+
+
+class StorageFileResponse(FileResponse):
+    """
+    A FileResponse that sends `content` instead of reading the file when it
+    is given, and uses the zero copy extension when the server has it. Only
+    whole files are sent that way, HEAD and range requests are left to
+    FileResponse.
+    """
+
+    def __init__(self, path: str, content: bytes | None = None, **kwargs):
+        super().__init__(path, **kwargs)
+        self.content = content
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        zerocopy = ZEROCOPY in scope.get("extensions", {})
+        if (
+            (self.content is None and not zerocopy)
+            or scope["method"] != "GET"
+            or any(name == b"range" for name, _ in scope["headers"])
+        ):
+            return await super().__call__(scope, receive, send)
+        await send({"type": "http.response.start", "status": self.status_code, "headers": self.raw_headers})
+        if self.content is not None:
+            await send({"type": "http.response.body", "body": self.content, "more_body": False})
+        else:
+            async with await anyio.open_file(self.path, mode="rb") as file:
+                await send(
+                    {
+                        "type": ZEROCOPY,
+                        "file": file.wrapped,
+                        "offset": 0,
+                        "count": self.stat_result.st_size,
+                        "more_body": False,
+                    }
+                )
+        if self.background is not None:
+            await self.background()
+
+
+class StorageFiles(StaticFiles):
+    def __init__(
+        self,
+        *,
+        directory: str,
+        max_age: int = STORAGE_MAX_AGE,
+        cache_files: int = STORAGE_CACHE_FILES,
+        cache_max_bytes: int = STORAGE_CACHE_MAX_BYTES,
+        **kwargs,
+    ):
+        super().__init__(directory=directory, **kwargs)
+        self.max_age = max_age
+        self.cache_max_bytes = cache_max_bytes
+        # the keys change with the file, entries never have to be invalidated
+        self.files = TTLCache(maxsize=cache_files, ttl=24 * 3600)
+
+    def lookup_path(self, path: str) -> tuple[str, os.stat_result | None]:
+        # runs in a thread, which is where the files are read and hashed
+        full_path, stat_result = super().lookup_path(path)
+        if stat_result is not None and stat.S_ISREG(stat_result.st_mode):
+            self.load(full_path, stat_result)
+        return full_path, stat_result
+
+    def load(self, full_path: str, stat_result: os.stat_result) -> StoredFile:
+        key = (full_path, stat_result.st_mtime_ns, stat_result.st_size)
+        stored = self.files.get(key)
+        if stored is not None:
+            return stored
+        name = os.path.basename(full_path)
+        content = None
+        if stat_result.st_size <= self.cache_max_bytes:
+            with open(full_path, "rb") as f:
+                content = f.read()
+        if HASHED_NAME.fullmatch(name):
+            stored = StoredFile(f'"{name.rsplit(".", 1)[0]}"', True, content)
+        else:
+            if content is not None:
+                digest = hashlib.sha256(content)
+            else:
+                digest = hashlib.sha256()
+                with open(full_path, "rb") as f:
+                    for chunk in iter(lambda: f.read(64 * 1024), b""):
+                        digest.update(chunk)
+            stored = StoredFile(f'"{digest.hexdigest()}"', False, content)
+        self.files.set(key, stored)
+        return stored
+
+    def file_response(
+        self,
+        full_path: str,
+        stat_result: os.stat_result,
+        scope: Scope,
+        status_code: int = 200,
+    ):
+        stored = self.files.get((full_path, stat_result.st_mtime_ns, stat_result.st_size))
+        if stored is None:
+            return super().file_response(full_path, stat_result, scope, status_code)
+        if stored.immutable:
+            cache_control = f"public, max-age={self.max_age}, immutable"
+        else:
+            cache_control = "no-cache"
+        response = StorageFileResponse(
+            full_path,
+            content=stored.content,
+            status_code=status_code,
+            headers={"etag": stored.etag, "cache-control": cache_control},
+            stat_result=stat_result,
+        )
+        if self.is_not_modified(response.headers, Headers(scope=scope)):
+            return NotModifiedResponse(response.headers)
+        return response
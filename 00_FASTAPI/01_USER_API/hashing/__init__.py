@@ -0,0 +1,139 @@
+"""
+Argon2 hashing is slow on purpose (tens of milliseconds of CPU per call), so
+running it inside a request handler starves every other request. The
+`HashingPool` sends that work to a pool of worker processes, limits how many
+calls can be pending at the same time and keeps a few metrics about it.
+
+Configuration (environment variables):
+    - HASHING_WORKERS: number of worker processes, defaults to the number of
+      CPUs. 0 runs the hashing on the shared request threadpool instead.
+    - HASHING_MAX_PENDING: how many hash/verify calls can be queued or running
+      at once before new ones are rejected, defaults to 8 per worker.
+"""
+
+import asyncio
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from argon2 import PasswordHasher
+from argon2.exceptions import VerifyMismatchError
+from starlette.concurrency import run_in_threadpool
+
+hasher = PasswordHasher()
+
+
+class HashingPoolSaturated(Exception):
+    pass
+
+
+def _hash(password: str) -> str:
+    return hasher.hash(password)
+
+
+def _hash_many(passwords: list[str]) -> list[str]:
+    return [hasher.hash(password) for password in passwords]
+
+
+def _verify(hash: str, password: str) -> bool:
+    try:
+        return hasher.verify(hash, password)
+    except VerifyMismatchError:
+        return False
+
+
+class HashingPool:
+    def __init__(self, max_workers: int, max_pending: int):
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self._executor: ProcessPoolExecutor | None = None
+        self.pending = 0
+        self.peak_pending = 0
+        self.submitted = 0
+        self.completed = 0
+        self.rejected = 0
+        self.failed = 0
+        self.busy_seconds = 0.0
+
+    async def hash(self, password: str) -> str:
+        return await self._submit(_hash, password)
+
+    async def verify(self, hash: str, password: str) -> bool:
+        return await self._submit(_verify, hash, password)
+
+    async def hash_many(self, passwords: list[str]) -> list[str]:
+        """
+        Hashes many passwords at once, split in one chunk per worker so that
+        every core is used. Each chunk counts as one pending call, and the
+        slots of all the chunks are reserved before any of them is sent, so
+        either every chunk runs or none does.
+        """
+        if not passwords:
+            return []
+        chunks = max(1, min(self.max_workers, len(passwords)))
+        size = -(-len(passwords) // chunks)
+        parts = [passwords[i : i + size] for i in range(0, len(passwords), size)]
+        self._reserve(len(parts))
+        results = await asyncio.gather(*[self._run(_hash_many, part) for part in parts])
+        return [hash for chunk in results for hash in chunk]
+
+    def _reserve(self, calls: int):
+        # no await between the check and the increment, so concurrent callers
+        # can't both see the same free slots
+        if self.pending + calls > self.max_pending:
+            self.rejected += 1
+            raise HashingPoolSaturated("The hashing pool is saturated.")
+        self.pending += calls
+        self.submitted += calls
+        self.peak_pending = max(self.peak_pending, self.pending)
+
+    async def _submit(self, fn, *args):
+        self._reserve(1)
+        return await self._run(fn, *args)
+
+    async def _run(self, fn, *args):
+        """Runs a call reserved by `_reserve` and frees its slot."""
+        start = time.perf_counter()
+        try:
+            if self.max_workers == 0:
+                result = await run_in_threadpool(fn, *args)
+            else:
+                loop = asyncio.get_running_loop()
+                result = await loop.run_in_executor(self._get_executor(), fn, *args)
+            self.completed += 1
+            return result
+        except Exception:
+            self.failed += 1
+            raise
+        finally:
+            self.pending -= 1
+            self.busy_seconds += time.perf_counter() - start
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=self.max_workers)
+        return self._executor
+
+    def metrics(self) -> dict:
+        return {
+            "workers": self.max_workers,
+            "maxPending": self.max_pending,
+            "pending": self.pending,
+            "peakPending": self.peak_pending,
+            "submitted": self.submitted,
+            "completed": self.completed,
+            "rejected": self.rejected,
+            "failed": self.failed,
+            "busySeconds": round(self.busy_seconds, 6),
+        }
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=True, cancel_futures=True)
+            self._executor = None
+
+
+_workers = int(os.environ.get("HASHING_WORKERS", os.cpu_count() or 1))
+hashing_pool = HashingPool(
+    max_workers=_workers,
+    max_pending=int(os.environ.get("HASHING_MAX_PENDING", 8 * max(_workers, 1))),
+)
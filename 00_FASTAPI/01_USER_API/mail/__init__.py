@@ -7,31 +7,239 @@
     - ONCE THAT IS THERE GO TO '2-STEP VERIFICATION' THEN   APP PASSWORDS
     - GIVE YOUR APP A NAME AND GENERATE THE PASSWORD STORE IT SAFE.
 # READ MORE ABOUT ENVIRONMENTAL VARIABLES HERE: https://fastapi.tiangolo.com/environment-variables/#create-and-use-env-vars
+
+# BACKGROUND DELIVERY
+    - `mail_dispatcher.enqueue(...)` puts a message on a queue and returns at once.
+    - worker threads take up to `batch_size` queued messages at a time and
+      send them over one logged in connection each (the connection pool). The
+      connection stays open while messages keep coming and is closed once the
+      queue is empty, before the server drops it as idle. Failed sends are
+      retried with an exponential backoff.
+    - the transport is pluggable: "smtp" talks to MAIL_HOST:MAIL_PORT (gmail by
+      default, or a local server such as `python -m aiosmtpd -n -l localhost:8025`
+      with MAIL_USE_SSL=0), "memory" keeps the messages in a list for tests.
 """
 
+import os
+import queue
 import smtplib
-from email.mime.text import MIMEText
 import ssl
+import threading
+import time
+from email.mime.text import MIMEText
 
 YOUR_GOOGLE_EMAIL = (
     "crispendev@gmail.com"  # The email you setup to send the email using app password
 )
 YOUR_GOOGLE_EMAIL_APP_PASSWORD = "bhdk sytc kkso wdey"  # The app password you generated
 
+MAIL_TRANSPORT = os.environ.get("MAIL_TRANSPORT", "smtp")
+MAIL_HOST = os.environ.get("MAIL_HOST", "smtp.gmail.com")
+MAIL_PORT = int(os.environ.get("MAIL_PORT", 465))
+MAIL_USE_SSL = os.environ.get("MAIL_USE_SSL", "1") == "1"
+MAIL_WORKERS = int(os.environ.get("MAIL_WORKERS", 2))
+
+
+def build_message(subject: str, to: str, html: str) -> MIMEText:
+    message = MIMEText(html, "html")
+    message["Subject"] = subject
+    message["From"] = YOUR_GOOGLE_EMAIL
+    message["To"] = to
+    return message
+
+
+class SMTPTransport:
+    def __init__(
+        self,
+        host: str = MAIL_HOST,
+        port: int = MAIL_PORT,
+        username: str | None = YOUR_GOOGLE_EMAIL,
+        password: str | None = YOUR_GOOGLE_EMAIL_APP_PASSWORD,
+        use_ssl: bool = MAIL_USE_SSL,
+        timeout: float = 10,
+    ):
+        self.host = host
+        self.port = port
+        self.username = username
+        self.password = password
+        self.use_ssl = use_ssl
+        self.timeout = timeout
+        self.server: smtplib.SMTP | None = None
+
+    def open(self):
+        if self.server is not None:
+            return
+        if self.use_ssl:
+            # Create secure connection with server and send email
+            context = ssl.create_default_context()
+            server = smtplib.SMTP_SSL(
+                self.host, self.port, context=context, timeout=self.timeout
+            )
+        else:
+            server = smtplib.SMTP(self.host, self.port, timeout=self.timeout)
+        if self.username is not None and self.password is not None:
+            server.login(self.username, self.password)
+        self.server = server
+
+    def send(self, message: MIMEText):
+        self.open()
+        self.server.sendmail(message["From"], message["To"], message.as_string())
+
+    def close(self):
+        if self.server is None:
+            return
+        try:
+            self.server.quit()
+        except Exception:
+            pass
+        self.server = None
+
+
+class MemoryTransport:
+    """
+    Keeps the sent messages in `outbox` (shared by every connection of the
+    same dispatcher), the delays can be used to pretend to be a slow server.
+    """
+
+    def __init__(self, outbox: list | None = None, connect_delay: float = 0, send_delay: float = 0):
+        self.outbox = outbox if outbox is not None else []
+        self.connect_delay = connect_delay
+        self.send_delay = send_delay
+        self.connected = False
+        self.connections = 0
+
+    def open(self):
+        if not self.connected:
+            time.sleep(self.connect_delay)
+            self.connected = True
+            self.connections += 1
+
+    def send(self, message: MIMEText):
+        self.open()
+        time.sleep(self.send_delay)
+        self.outbox.append(message)
+
+    def close(self):
+        self.connected = False
+
+
+def default_transport():
+    if MAIL_TRANSPORT == "memory":
+        return MemoryTransport()
+    return SMTPTransport()
+
+
+_STOP = object()
+
+
+class MailDispatcher:
+    def __init__(
+        self,
+        transport_factory=default_transport,
+        workers: int = MAIL_WORKERS,
+        batch_size: int = 20,
+        max_retries: int = 3,
+        backoff: float = 0.5,
+    ):
+        self.transport_factory = transport_factory
+        self.workers = workers
+        self.batch_size = batch_size
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.queue: queue.Queue = queue.Queue()
+        self.threads: list[threading.Thread] = []
+        self.lock = threading.Lock()
+        self.sent = 0
+        self.failed = 0
+        self.retried = 0
+
+    def enqueue(self, subject: str, to: str, html: str):
+        self.start()
+        self.queue.put(build_message(subject, to, html))
+
+    def start(self):
+        with self.lock:
+            if self.threads:
+                return
+            for i in range(self.workers):
+                thread = threading.Thread(
+                    target=self._work, name=f"mail-worker-{i}", daemon=True
+                )
+                thread.start()
+                self.threads.append(thread)
+
+    def stop(self, timeout: float | None = None):
+        """Sends what is left in the queue and stops the workers."""
+        with self.lock:
+            threads, self.threads = self.threads, []
+        for _ in threads:
+            self.queue.put(_STOP)
+        for thread in threads:
+            thread.join(timeout)
+
+    def join(self):
+        """Blocks until every queued message was sent or given up on."""
+        self.queue.join()
+
+    def _work(self):
+        transport = self.transport_factory()
+        try:
+            while True:
+                batch = [self.queue.get()]
+                while len(batch) < self.batch_size and batch[-1] is not _STOP:
+                    try:
+                        batch.append(self.queue.get_nowait())
+                    except queue.Empty:
+                        break
+                for message in batch:
+                    if message is not _STOP:
+                        self._deliver(transport, message)
+                if batch[-1] is not _STOP and self.queue.empty():
+                    transport.close()
+                for _ in batch:
+                    self.queue.task_done()
+                if batch[-1] is _STOP:
+                    return
+        finally:
+            transport.close()
+
+    def _deliver(self, transport, message: MIMEText):
+        for attempt in range(self.max_retries + 1):
+            try:
+                transport.send(message)
+                with self.lock:
+                    self.sent += 1
+                return
+            except Exception:
+                # the connection may be dead, open a new one on the next try
+                transport.close()
+                if attempt == self.max_retries:
+                    with self.lock:
+                        self.failed += 1
+                    return
+                with self.lock:
+                    self.retried += 1
+                time.sleep(self.backoff * 2**attempt)
+
+    def metrics(self) -> dict:
+        return {
+            "workers": self.workers,
+            "queued": self.queue.qsize(),
+            "sent": self.sent,
+            "failed": self.failed,
+            "retried": self.retried,
+        }
+
+
+mail_dispatcher = MailDispatcher()
+
+
 def send_email(subject: str, to: str, html: str):
+    transport = SMTPTransport()
     try:
-        message = MIMEText(html, "html")
-        message["Subject"] = subject
-        message["From"] = YOUR_GOOGLE_EMAIL
-        message["To"] = to
-        # Create secure connection with server and send email
-        context = ssl.create_default_context()
-        with smtplib.SMTP_SSL("smtp.gmail.com", 465, context=context) as server:
-            server.login(YOUR_GOOGLE_EMAIL, YOUR_GOOGLE_EMAIL_APP_PASSWORD)
-            server.sendmail(YOUR_GOOGLE_EMAIL, to, message.as_string())
+        transport.send(build_message(subject, to, html))
     except Exception:
         return False
+    finally:
+        transport.close()
     return True
-
-
-
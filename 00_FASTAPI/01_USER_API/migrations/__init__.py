@@ -0,0 +1,52 @@
+"""
+A minimal migration runner. `SQLModel.metadata.create_all` creates missing
+tables (with their indexes) but never changes a table that already exists, so
+every schema change made after a table was first created is also added here
+as a numbered list of statements. The applied versions are recorded in the
+`schema_migrations` table and each migration runs once, in its own
+transaction, on the async engine of `db`. Run it with `python -m migrations`
+or let the app run it on startup.
+"""
+
+from sqlalchemy import text
+
+MIGRATIONS: list[tuple[int, str, list[str]]] = [
+    (
+        1,
+        "index the name filters and the (lastName, firstName, id) sort",
+        [
+            'CREATE INDEX IF NOT EXISTS "ix_user_lastName_firstName_id" ON "user" ("lastName", "firstName", id)',
+            'CREATE INDEX IF NOT EXISTS "ix_user_firstName_id" ON "user" ("firstName", id)',
+        ],
+    ),
+]
+
+
+def applied_versions(conn) -> set[int]:
+    conn.execute(
+        text("CREATE TABLE IF NOT EXISTS schema_migrations (version INTEGER PRIMARY KEY)")
+    )
+    return set(conn.execute(text("SELECT version FROM schema_migrations")).scalars())
+
+
+def apply(conn, version: int, statements: list[str]):
+    for statement in statements:
+        conn.execute(text(statement))
+    conn.execute(
+        text("INSERT INTO schema_migrations (version) VALUES (:version)"),
+        {"version": version},
+    )
+
+
+async def migrate(engine) -> list[int]:
+    """Applies the pending migrations and returns their versions."""
+    async with engine.begin() as conn:
+        done = await conn.run_sync(applied_versions)
+    applied = []
+    for version, _, statements in MIGRATIONS:
+        if version in done:
+            continue
+        async with engine.begin() as conn:
+            await conn.run_sync(apply, version, statements)
+        applied.append(version)
+    return applied
@@ -0,0 +1,20 @@
+import asyncio
+from sqlmodel import SQLModel
+from db import engine
+from migrations import MIGRATIONS, migrate
+import models  # noqa: F401, registers the tables
+
+
+async def main():
+    async with engine.begin() as conn:
+        await conn.run_sync(SQLModel.metadata.create_all)
+    applied = await migrate(engine)
+    await engine.dispose()
+    descriptions = {version: description for version, description, _ in MIGRATIONS}
+    for version in applied:
+        print(f"applied {version}: {descriptions[version]}")
+    if not applied:
+        print("the database is up to date")
+
+
+asyncio.run(main())
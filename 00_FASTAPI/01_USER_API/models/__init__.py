@@ -1,8 +1,14 @@
-from sqlmodel import Field, SQLModel, TIMESTAMP, Column, text
+from sqlmodel import Field, SQLModel, TIMESTAMP, Column, Index, text
 from typing import Optional
 from datetime import datetime
 
 class User(SQLModel, table=True):
+    # keep in sync with the migrations, create_all only adds them to new tables
+    __table_args__ = (
+        Index("ix_user_lastName_firstName_id", "lastName", "firstName", "id"),
+        Index("ix_user_firstName_id", "firstName", "id"),
+    )
+
     id: int | None = Field(default=None, primary_key=True, unique=True, nullable=False)
     firstName: str = Field(nullable=False, min_length=3, max_length=15)
     lastName: str = Field(nullable=False, min_length=3, max_length=15)
@@ -13,7 +19,8 @@ class User(SQLModel, table=True):
     verified: bool = Field(nullable=False, default=False)
     loggedIn: bool = Field(nullable=False, default=False)
     
-    # verification
+    # unused since the tokens moved to verification_token (see verification),
+    # kept for the existing databases
     verificationToken: str = Field(nullable=False, default='000000')
     verificationTokenCreateTimestamp: Optional[datetime] = Field(sa_column=Column(
         TIMESTAMP(timezone=True),
@@ -35,3 +42,13 @@ class User(SQLModel, table=True):
     ))
 
 
+
+
+class VerificationToken(SQLModel, table=True):
+    # the pending email verification of a user, see verification
+    __tablename__ = "verification_token"
+
+    userId: int = Field(primary_key=True, foreign_key="user.id", ondelete="CASCADE")
+    token: str = Field(nullable=False)
+    # unix time, indexed for the purge of the expired tokens
+    expiresAt: int = Field(nullable=False, index=True)
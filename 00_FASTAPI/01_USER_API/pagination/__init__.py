@@ -0,0 +1,90 @@
+import base64
+import json
+from typing import Literal
+from sqlalchemy import tuple_
+from models import User
+
+ORDER = Literal["desc", "asc"]
+SORT = Literal["id", "name"]
+
+# the columns each sort mode seeks on, the last one is always the primary key
+# so that the key is unique and the seek never skips or repeats a row
+SORT_KEYS = {
+    "id": ("id",),
+    "name": ("lastName", "firstName", "id"),
+}
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(sort: SORT, order: ORDER, key: tuple) -> str:
+    raw = json.dumps({"s": sort, "o": order, "k": list(key)}, separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, sort: SORT, order: ORDER) -> tuple:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        data = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        key = tuple(data["k"])
+    except Exception:
+        raise InvalidCursor("The cursor is invalid.")
+    if data.get("s") != sort or data.get("o") != order:
+        raise InvalidCursor("The cursor does not match the sort and order.")
+    if len(key) != len(SORT_KEYS[sort]):
+        raise InvalidCursor("The cursor is invalid.")
+    return key
+
+
+def row_key(user, sort: SORT) -> tuple:
+    # a User or a row that selected the sort columns
+    return tuple(getattr(user, name) for name in SORT_KEYS[sort])
+
+
+async def keyset_page(
+    statement,
+    session,
+    sort: SORT = "id",
+    order: ORDER = "asc",
+    limit: int = 10,
+    after: str | None = None,
+    before: str | None = None,
+):
+    """
+    Seeks to the page after (or before) a cursor instead of using an OFFSET,
+    so the cost of a page does not depend on how deep it is. Returns the users
+    of the page together with the cursors of the next and previous pages.
+    """
+    columns = [getattr(User, name) for name in SORT_KEYS[sort]]
+    key = tuple_(*columns)
+    backwards = before is not None
+    # when paging backwards we walk the index in the opposite direction and
+    # flip the rows back afterwards
+    descending = (order == "desc") != backwards
+
+    if after is not None:
+        value = decode_cursor(after, sort, order)
+        statement = statement.where(key < value if order == "desc" else key > value)
+    elif before is not None:
+        value = decode_cursor(before, sort, order)
+        statement = statement.where(key > value if order == "desc" else key < value)
+
+    statement = statement.order_by(
+        *[c.desc() if descending else c.asc() for c in columns]
+    ).limit(limit + 1)
+    users = (await session.exec(statement)).all()
+    has_more = len(users) > limit
+    users = users[:limit]
+    if backwards:
+        users.reverse()
+
+    next_cursor = prev_cursor = None
+    if users:
+        first, last = row_key(users[0], sort), row_key(users[-1], sort)
+        if has_more or backwards:
+            next_cursor = encode_cursor(sort, order, last)
+        if (has_more and backwards) or after is not None:
+            prev_cursor = encode_cursor(sort, order, first)
+    return users, next_cursor, prev_cursor
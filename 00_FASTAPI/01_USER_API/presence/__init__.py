@@ -0,0 +1,121 @@
+"""
+Keeps track of which users are logged in. `login`, `logout` and `verify` only
+record the change in memory, and a background task writes the changes to
+`user.loggedIn` every PRESENCE_FLUSH_MS milliseconds, in one transaction per
+flush whatever the number of logins. The routes read the flag through
+`presence.logged_in`, so they see a change before it was written.
+
+Configuration (environment variables):
+    - PRESENCE_MODE: "write-behind" (default) or "write-through", which writes
+      every change before the request is answered (the changes of the last
+      flush interval are lost if the process dies in write-behind mode).
+    - PRESENCE_FLUSH_MS: the flush interval, defaults to 200.
+"""
+
+import asyncio
+import os
+from sqlalchemy import update
+from sqlmodel.ext.asyncio.session import AsyncSession
+from db import engine
+from models import User
+
+PRESENCE_MODE = os.environ.get("PRESENCE_MODE", "write-behind")
+PRESENCE_FLUSH_MS = int(os.environ.get("PRESENCE_FLUSH_MS", 200))
+FLUSH_CHUNK_SIZE = 500
+
+
+class Presence:
+    def __init__(self, engine, mode: str = PRESENCE_MODE, interval: float = PRESENCE_FLUSH_MS / 1000):
+        self.engine = engine
+        self.mode = mode
+        self.interval = interval
+        # changes not written yet, and the ones being written
+        self.pending: dict[int, bool] = {}
+        self.flushing: dict[int, bool] = {}
+        self.task: asyncio.Task | None = None
+        self.flushes = 0
+        self.written = 0
+        self.failed = 0
+
+    async def set(self, id: int, logged_in: bool, session: AsyncSession | None = None):
+        """
+        Records a change. In write-through mode it is written with `session`
+        (the one of the request, so that it doesn't wait for a second
+        connection) or a connection of its own.
+        """
+        if self.mode != "write-through":
+            self.pending[id] = logged_in
+            return
+        if session is None:
+            await self.write({id: logged_in})
+            return
+        await session.exec(update(User).where(User.id == id).values(loggedIn=logged_in))
+        await session.commit()
+        self.written += 1
+
+    def logged_in(self, id: int, default: bool) -> bool:
+        """The flag of a user, `default` is the value read from the database."""
+        if id in self.pending:
+            return self.pending[id]
+        return self.flushing.get(id, default)
+
+    async def flush(self):
+        if not self.pending:
+            return
+        self.flushing, self.pending = self.pending, {}
+        written = False
+        try:
+            await self.write(self.flushing)
+            written = True
+        except Exception:
+            self.failed += 1
+        finally:
+            if not written:
+                # try again on the next flush, unless the flag changed since
+                self.pending = {**self.flushing, **self.pending}
+            self.flushing = {}
+
+    async def write(self, changes: dict[int, bool]):
+        async with self.engine.begin() as conn:
+            for value in (True, False):
+                ids = [id for id, logged_in in changes.items() if logged_in is value]
+                for i in range(0, len(ids), FLUSH_CHUNK_SIZE):
+                    await conn.execute(
+                        update(User)
+                        .where(User.id.in_(ids[i : i + FLUSH_CHUNK_SIZE]))
+                        .values(loggedIn=value)
+                    )
+        self.flushes += 1
+        self.written += len(changes)
+
+    async def run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            await self.flush()
+
+    def start(self):
+        if self.task is None and self.mode != "write-through":
+            self.task = asyncio.get_running_loop().create_task(self.run())
+
+    async def stop(self):
+        """Stops the background task and writes what is left."""
+        if self.task is not None:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+            self.task = None
+        await self.flush()
+
+    def metrics(self) -> dict:
+        return {
+            "mode": self.mode,
+            "pending": len(self.pending),
+            "flushes": self.flushes,
+            "written": self.written,
+            "failed": self.failed,
+        }
+
+
+presence = Presence(engine)
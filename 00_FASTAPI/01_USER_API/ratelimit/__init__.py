@@ -0,0 +1,403 @@
+"""
+Rate limiting of the auth routes, so that a burst of login attempts is
+rejected before it reaches the password hasher.
+
+`RateLimitMiddleware` checks the routes it has rules for before the app sees
+the request: first the limit of the client IP, then the limits keyed by the
+user of the bearer token (verify) or by a field of the JSON body (the
+`usernameOrEmail` of a login). A rule path ending in `/*` covers one more
+path segment, e.g. the token of `/verify/{otp}`. A rejected
+request is answered with `429 Too Many Requests` and a `Retry-After` header.
+The body is only read for the rules keyed by one of its fields, and at most
+RATE_LIMIT_MAX_BODY bytes of it: a larger one gets `413 Payload Too Large`.
+
+Every key has a token bucket: a limit of `<hits>/<seconds>` allows `hits`
+requests at once, then one more every `seconds / hits`. A bucket is stored as
+the time it is full again, one number per key whatever the number of hits,
+and a full bucket is not stored at all. The storage is pluggable:
+    - `MemoryStorage`: a dict in the process, the keys of full buckets are
+      swept once per `sweep_interval`.
+    - `RedisStorage`: shared between the processes, e.g. with
+      `redis.asyncio.from_url(REDIS_URL)` (`pip install redis`) or
+      `LocalRedis`, an in-process stand-in with the same commands. A bucket
+      is read and written by one Lua script, and expires once it is full.
+
+Configuration (environment variables):
+    - RATE_LIMIT: 0 disables the middleware.
+    - RATE_LIMIT_STORAGE: "memory" (default) or "redis", with REDIS_URL.
+    - RATE_LIMIT_LOGIN_IP, RATE_LIMIT_LOGIN_ACCOUNT, RATE_LIMIT_REGISTER_IP,
+      RATE_LIMIT_REGISTER_BULK_IP, RATE_LIMIT_VERIFY_IP,
+      RATE_LIMIT_VERIFY_USER: "<hits>/<seconds>", default to 60/60, 20/60,
+      30/60, 2/60, 30/60 and 5/60. A bulk registration hashes up to 500
+      passwords, and a verification token has only 6 digits.
+    - RATE_LIMIT_MAX_BODY: the largest body read for a rule, in bytes,
+      defaults to 64 KiB.
+    - RATE_LIMIT_TRUST_FORWARDED: 1 takes the client IP from
+      X-Forwarded-For, only behind a proxy that sets it.
+"""
+
+import json
+import math
+import os
+import time
+from dataclasses import dataclass
+from utils import decode_jwt
+
+RATE_LIMIT = os.environ.get("RATE_LIMIT", "1") != "0"
+RATE_LIMIT_STORAGE = os.environ.get("RATE_LIMIT_STORAGE", "memory")
+RATE_LIMIT_TRUST_FORWARDED = os.environ.get("RATE_LIMIT_TRUST_FORWARDED", "0") == "1"
+RATE_LIMIT_MAX_BODY = int(os.environ.get("RATE_LIMIT_MAX_BODY", 64 * 1024))
+SWEEP_INTERVAL = 60
+
+
+@dataclass(frozen=True)
+class Limit:
+    hits: int
+    window: float
+
+    @classmethod
+    def parse(cls, value: str) -> "Limit":
+        hits, window = value.split("/")
+        return cls(int(hits), float(window))
+
+
+@dataclass(frozen=True)
+class Rule:
+    name: str
+    limit: Limit
+    # the JSON body field the rule is keyed by, None for the client IP
+    field: str | None = None
+    # keyed by the id of the bearer token's user instead
+    user: bool = False
+    method: str = "POST"
+
+
+def take(full_at: float | None, limit: Limit, now: float) -> tuple[float, float]:
+    """
+    Takes a token from the bucket of a key, `full_at` being when its bucket is
+    full again (None when it is). Returns the new `full_at` and 0 when a token
+    was left, or `full_at` unchanged and the seconds until one is back.
+    """
+    interval = limit.window / limit.hits
+    taken = max(full_at or now, now) + interval
+    if taken - now > limit.window:
+        return full_at, taken - now - limit.window
+    return taken, 0
+
+
+class MemoryStorage:
+    def __init__(self, sweep_interval: float = SWEEP_INTERVAL):
+        # key -> when its bucket is full again, a full bucket has no entry
+        self.buckets: dict[str, float] = {}
+        self.sweep_interval = sweep_interval
+        self.next_sweep = 0.0
+
+    async def take(self, key: str, limit: Limit, now: float) -> float:
+        """Takes a token, returns 0 or the seconds until one is back."""
+        full_at, wait = take(self.buckets.get(key), limit, now)
+        self.buckets[key] = full_at
+        if now >= self.next_sweep:
+            self.sweep(now)
+        return wait
+
+    def sweep(self, now: float):
+        self.buckets = {k: v for k, v in self.buckets.items() if v > now}
+        self.next_sweep = now + self.sweep_interval
+
+    def clear(self):
+        self.buckets.clear()
+
+    def __len__(self):
+        return len(self.buckets)
+
+
+# `take` in Lua, so that the read and the write of a bucket are atomic. The
+# numbers are returned as strings, Redis would truncate them to integers
+TAKE_SCRIPT = """
+local now = tonumber(ARGV[1])
+local window = tonumber(ARGV[2])
+local taken = math.max(tonumber(redis.call("GET", KEYS[1]) or now), now) + window / tonumber(ARGV[3])
+if taken - now > window then
+    return tostring(taken - now - window)
+end
+redis.call("SET", KEYS[1], tostring(taken), "PX", math.ceil((taken - now) * 1000))
+return "0"
+"""
+
+
+class RedisStorage:
+    def __init__(self, client, prefix: str = "ratelimit:"):
+        self.client = client
+        self.prefix = prefix
+
+    async def take(self, key: str, limit: Limit, now: float) -> float:
+        wait = await self.client.eval(
+            TAKE_SCRIPT, 1, f"{self.prefix}{key}", repr(now), repr(limit.window), limit.hits
+        )
+        return float(wait)
+
+
+class LocalRedis:
+    """The redis commands `RedisStorage` sends, kept in the process."""
+
+    def __init__(self, sweep_interval: float = SWEEP_INTERVAL):
+        # key -> [value, expiry or None]
+        self.data: dict[str, list] = {}
+        self.sweep_interval = sweep_interval
+        self.next_sweep = 0.0
+
+    def live(self, key: str) -> list | None:
+        entry = self.data.get(key)
+        if entry is not None and entry[1] is not None and entry[1] <= time.time():
+            del self.data[key]
+            return None
+        return entry
+
+    def get(self, key: str) -> bytes | None:
+        entry = self.live(key)
+        return None if entry is None else str(entry[0]).encode()
+
+    def set(self, key: str, value, px: int | None = None) -> bool:
+        now = time.time()
+        self.data[key] = [value, None if px is None else now + px / 1000]
+        if now >= self.next_sweep:
+            self.data = {
+                k: v for k, v in self.data.items() if v[1] is None or v[1] > now
+            }
+            self.next_sweep = now + self.sweep_interval
+        return True
+
+    async def eval(self, script: str, numkeys: int, *keys_and_args) -> bytes:
+        """Runs `TAKE_SCRIPT`, the only script sent, as `take` does."""
+        if script != TAKE_SCRIPT:
+            raise NotImplementedError("LocalRedis only runs TAKE_SCRIPT.")
+        key, now, window, hits = keys_and_args
+        now = float(now)
+        stored = self.get(key)
+        full_at, wait = take(
+            None if stored is None else float(stored), Limit(int(hits), float(window)), now
+        )
+        if not wait:
+            self.set(key, repr(full_at), px=math.ceil((full_at - now) * 1000))
+        return repr(wait).encode()
+
+
+class RateLimiter:
+    def __init__(self, storage, clock=time.time):
+        self.storage = storage
+        self.clock = clock
+        self.allowed = 0
+        self.rejected = 0
+
+    async def hit(self, key: str, limit: Limit) -> float:
+        """Counts a hit, returns 0 when it is allowed or the seconds to wait."""
+        wait = await self.storage.take(key, limit, self.clock())
+        if wait:
+            self.rejected += 1
+        else:
+            self.allowed += 1
+        return wait
+
+    def metrics(self) -> dict:
+        return {"allowed": self.allowed, "rejected": self.rejected}
+
+
+def bearer_user(scope) -> str | None:
+    for name, value in scope["headers"]:
+        if name == b"authorization":
+            scheme, _, token = value.decode("latin-1").partition(" ")
+            if scheme.lower() != "bearer" or not token:
+                return None
+            try:
+                return str(decode_jwt(token)["id"])
+            except Exception:
+                # the route rejects the request as unauthorized
+                return None
+    return None
+
+
+def client_ip(scope, trust_forwarded: bool) -> str:
+    if trust_forwarded:
+        for name, value in scope["headers"]:
+            if name == b"x-forwarded-for":
+                return value.decode("latin-1").split(",")[0].strip()
+    client = scope.get("client")
+    return client[0] if client else "unknown"
+
+
+class RateLimitMiddleware:
+    def __init__(
+        self,
+        app,
+        limiter: RateLimiter,
+        rules: dict[str, list[Rule]],
+        trust_forwarded: bool = RATE_LIMIT_TRUST_FORWARDED,
+        max_body: int = RATE_LIMIT_MAX_BODY,
+    ):
+        self.app = app
+        self.limiter = limiter
+        self.rules = rules
+        self.prefixes = [
+            (path[:-1], path_rules) for path, path_rules in rules.items() if path.endswith("/*")
+        ]
+        self.trust_forwarded = trust_forwarded
+        self.max_body = max_body
+
+    def rules_for(self, scope) -> list[Rule]:
+        path = scope["path"]
+        rules = self.rules.get(path)
+        if rules is None:
+            for prefix, prefix_rules in self.prefixes:
+                if path.startswith(prefix) and "/" not in path[len(prefix) :]:
+                    rules = prefix_rules
+                    break
+            else:
+                return []
+        return [rule for rule in rules if rule.method == scope["method"]]
+
+    async def __call__(self, scope, receive, send):
+        rules = self.rules_for(scope) if scope["type"] == "http" else None
+        if not rules:
+            await self.app(scope, receive, send)
+            return
+
+        body = None
+        for rule in rules:
+            if rule.user:
+                key = bearer_user(scope)
+                if key is None:
+                    continue
+            elif rule.field is None:
+                key = client_ip(scope, self.trust_forwarded)
+            else:
+                if body is None:
+                    try:
+                        body, receive = await read_body(receive, self.max_body)
+                    except BodyTooLarge:
+                        await payload_too_large(send, self.max_body)
+                        return
+                key = body_field(body, rule.field)
+                if key is None:
+                    # the route rejects the request without a hash
+                    continue
+            wait = await self.limiter.hit(f"{rule.name}:{key}", rule.limit)
+            if wait:
+                await too_many_requests(send, wait)
+                return
+        await self.app(scope, receive, send)
+
+
+class BodyTooLarge(Exception):
+    pass
+
+
+async def read_body(receive, max_size: int = RATE_LIMIT_MAX_BODY):
+    """
+    Reads the whole body, returns it with a `receive` that replays it. Raises
+    `BodyTooLarge` as soon as more than `max_size` bytes came in.
+    """
+    chunks, size, more = [], 0, True
+    while more:
+        message = await receive()
+        if message["type"] != "http.request":
+            break
+        chunk = message.get("body", b"")
+        size += len(chunk)
+        if size > max_size:
+            raise BodyTooLarge
+        chunks.append(chunk)
+        more = message.get("more_body", False)
+    body = b"".join(chunks)
+    replayed = False
+
+    async def replay():
+        nonlocal replayed
+        if not replayed:
+            replayed = True
+            return {"type": "http.request", "body": body, "more_body": False}
+        return await receive()
+
+    return body, replay
+
+
+def body_field(body: bytes, field: str) -> str | None:
+    try:
+        value = json.loads(body).get(field)
+    except (ValueError, AttributeError):
+        return None
+    if not isinstance(value, str) or not value.strip():
+        return None
+    return value.strip().lower()
+
+
+async def send_error(send, status: int, error: str, headers: list = ()):
+    body = json.dumps({"error": error, "jwt": None}).encode()
+    await send(
+        {
+            "type": "http.response.start",
+            "status": status,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode()),
+                *headers,
+            ],
+        }
+    )
+    await send({"type": "http.response.body", "body": body})
+
+
+async def too_many_requests(send, wait: float):
+    await send_error(
+        send,
+        429,
+        "Too many attempts, please try again later.",
+        [(b"retry-after", str(math.ceil(wait)).encode())],
+    )
+
+
+async def payload_too_large(send, max_size: int):
+    await send_error(send, 413, f"The request body is larger than {max_size} bytes.")
+
+
+def make_storage():
+    if RATE_LIMIT_STORAGE == "redis":
+        import redis.asyncio
+
+        return RedisStorage(redis.asyncio.from_url(os.environ["REDIS_URL"]))
+    return MemoryStorage()
+
+
+AUTH_RULES = {
+    "/api/v1/auth/login": [
+        Rule("login-ip", Limit.parse(os.environ.get("RATE_LIMIT_LOGIN_IP", "60/60"))),
+        Rule(
+            "login-account",
+            Limit.parse(os.environ.get("RATE_LIMIT_LOGIN_ACCOUNT", "20/60")),
+            field="usernameOrEmail",
+        ),
+    ],
+    "/api/v1/auth/register": [
+        Rule("register-ip", Limit.parse(os.environ.get("RATE_LIMIT_REGISTER_IP", "30/60"))),
+    ],
+    "/api/v1/auth/register/bulk": [
+        Rule(
+            "register-bulk-ip",
+            Limit.parse(os.environ.get("RATE_LIMIT_REGISTER_BULK_IP", "2/60")),
+        ),
+    ],
+    "/api/v1/auth/verify/*": [
+        Rule(
+            "verify-ip",
+            Limit.parse(os.environ.get("RATE_LIMIT_VERIFY_IP", "30/60")),
+            method="GET",
+        ),
+        Rule(
+            "verify-user",
+            Limit.parse(os.environ.get("RATE_LIMIT_VERIFY_USER", "5/60")),
+            user=True,
+            method="GET",
+        ),
+    ],
+}
+
+limiter = RateLimiter(make_storage())
@@ -1,14 +1,20 @@
-from fastapi import APIRouter, Body, Header, status
+from fastapi import APIRouter, Body, Header, Query, status
 
 from fastapi.responses import JSONResponse
 from  models import User
-from  db import SessionDep
-from argon2 import PasswordHasher
+from  db import SessionDep, release_connection
+from sqlalchemy.exc import IntegrityError
 from sqlmodel import select, or_
 from typing import Annotated
-from  utils import encode_jwt, validate_email, validate_name, validate_password, validate_username, generate_otp, decode_jwt
-from argon2.exceptions import VerifyMismatchError
-from  mail import send_email
+from  utils import encode_jwt, validate_user
+from auth import CurrentUser, bearer_token, invalidate_user
+from hashing import hashing_pool, HashingPoolSaturated
+from  mail import mail_dispatcher
+from bulk import register_many
+from presence import presence
+from writes import conflict_message, insert_user, update_user_by_id
+from stats import user_stats
+from verification import tokens
 
 
 verificationEmailTemplate = """
@@ -31,27 +37,33 @@ verificationEmailTemplate = """
 </div>
 """
 
-hasher = PasswordHasher()
 authRouter = APIRouter(prefix="/api/v1/auth")
+# a request holds the hashing pool for every password it registers, larger
+# imports go through `python -m bulk`
+BULK_MAX_USERS = 500
+
+
+def busy_response():
+    return JSONResponse(
+        {"error": "The server is busy, please try again later.", "jwt": None},
+        status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+        headers={"Retry-After": "1"},
+    )
+
 
 # logout
 
 @authRouter.post("/logout")
-def logout(
-    authorization: Annotated[str | None, Header()] = None, session: SessionDep = None
+async def logout(
+    me: CurrentUser,
+    session: SessionDep,
+    authorization: Annotated[str | None, Header()] = None,
 ):
     try:
-        if authorization is None:
-            return JSONResponse({"error": "You are not authorized.", 'jwt': None}, status_code=status.HTTP_401_UNAUTHORIZED)
-        _, jwt = authorization.split(" ")
-        payload = decode_jwt(jwt)
-        if payload is None:
+        if me is None:
             return JSONResponse({"error": "You are not authorized.", 'jwt': None}, status_code=status.HTTP_401_UNAUTHORIZED)
-        me = session.get(User, payload["id"])
-        me.loggedIn = False
-        session.add(me)
-        session.commit()
-        session.refresh(me)
+        await presence.set(me.id, False, session)
+        invalidate_user(me.id, bearer_token(authorization))
         return JSONResponse({"jwt": None, "error": None}, status_code=200)
     except Exception:
         return JSONResponse(
@@ -62,27 +74,21 @@ def logout(
 
 
 @authRouter.get("/verify/{otp}")
-def verify(otp: str,
-             authorization: Annotated[str | None, Header()] = None, session: SessionDep = None):
+async def verify(otp: str, me: CurrentUser, session: SessionDep):
     try:
-        if authorization is None:
+        if me is None:
             return JSONResponse({"error": "You are not authorized.", 'jwt': None}, status_code=status.HTTP_401_UNAUTHORIZED)
-        _, jwt = authorization.split(" ")
-        payload = decode_jwt(jwt)
-        if payload is None:
-            return JSONResponse({"error": "You are not authorized.", 'jwt': None}, status_code=status.HTTP_401_UNAUTHORIZED)
-        
-        me = session.get(User, payload["id"])
 
-        if me.verificationToken != otp:
+        if not await tokens.consume(session, me.id, otp):
             return JSONResponse({"error": "Invalid verification token.", 'jwt': None}, status_code=status.HTTP_401_UNAUTHORIZED)
         
-        me.loggedIn = True
-        me.verificationToken = '000000'
-        me.verified = True
-        session.add(me)
-        session.commit()
-        session.refresh(me)
+        wasVerified = me.verified
+        me = await update_user_by_id(session, me.id, {"verified": True})
+        await session.commit()
+        if not wasVerified:
+            user_stats.verify(me.firstName, me.lastName)
+        await presence.set(me.id, True, session)
+        invalidate_user(me.id)
         jwt = encode_jwt({"email": me.email, "id": me.id})
         return JSONResponse({"jwt": jwt, "error": None}, status_code=200)
     except Exception:
@@ -91,77 +97,98 @@ def verify(otp: str,
         )
 
 
+@authRouter.post("/verify/resend")
+async def resend_verification(me: CurrentUser, session: SessionDep):
+    if me is None:
+        return JSONResponse({"error": "You are not authorized."}, status_code=status.HTTP_401_UNAUTHORIZED)
+    if me.verified:
+        return JSONResponse({"error": "The email is already verified."}, status_code=200)
+    otp = await tokens.issue(session, me.id)
+    await session.commit()
+    send_verification_email({**me.model_dump(), "verificationToken": otp})
+    return JSONResponse({"error": None}, status_code=200)
+
+
+def send_verification_email(user: dict):
+    verificationLink = f'http://127.0.0.1:8000/api/v1/auth/verify/{user["verificationToken"]}'
+    mail_dispatcher.enqueue("Verify Email", user["email"], verificationEmailTemplate.format(
+        fullName = f'{user["firstName"]} {user["lastName"]}',
+        email = user["email"],
+        verificationLink = verificationLink
+    ))
+
+
 @authRouter.post("/register")
-def register(user: User, session: SessionDep):
+async def register(user: User, session: SessionDep):
     # validation
-    if validate_username(user.username.strip().lower()) is False:
-        return JSONResponse(
-            {"error": "The username is invalid.", "jwt": None}, status_code=200
-        )
-    if validate_email(user.email.strip().lower()) is False:
-        return JSONResponse(
-            {"error": "The email address is invalid.", "jwt": None}, status_code=200
-        )
-    if validate_name(user.firstName.strip()) is False:
-        return JSONResponse(
-            {"error": "The first name is invalid.", "jwt": None}, status_code=200
-        )
-    if validate_name(user.lastName.strip()) is False:
-        return JSONResponse(
-            {"error": "The last name is invalid.", "jwt": None}, status_code=200
-        )
-    if validate_password(user.password.strip()) is False:
-        return JSONResponse(
-            {"error": "The password must contain at least one letter, one number and one special character.", "jwt": None}, status_code=200
-        )
-    otp = generate_otp()
-    hashedPassword = hasher.hash(user.password.strip())
-    user.verificationToken = otp
-    user.password = hashedPassword
-    user.username = user.username.strip().lower()
-    user.email = user.email.strip().lower()
-    user.firstName = user.firstName.strip().capitalize()
-    user.lastName = user.lastName.strip().capitalize()
-    me = session.exec(
-        select(User).where(User.username == user.username.strip().lower())
-    ).first()
-    if me:
+    errors = validate_user(user)
+    if errors:
         return JSONResponse(
-            {"error": "The username is already in use.", "jwt": None}, status_code=200
+            {"error": next(iter(errors.values())), "errors": errors, "jwt": None},
+            status_code=200,
         )
-    me = session.exec(
-        select(User).where(User.email == user.email.strip().lower())
-    ).first()
-    if me:
+    try:
+        hashedPassword = await hashing_pool.hash(user.password.strip())
+    except HashingPoolSaturated:
+        return busy_response()
+    try:
+        user = await insert_user(session, {
+            "username": user.username.strip().lower(),
+            "email": user.email.strip().lower(),
+            "firstName": user.firstName.strip().capitalize(),
+            "lastName": user.lastName.strip().capitalize(),
+            "password": hashedPassword,
+        })
+        otp = await tokens.issue(session, user.id)
+        await session.commit()
+    except IntegrityError as e:
+        await session.rollback()
         return JSONResponse(
-            {"error": "The email is already in use.", "jwt": None}, status_code=200
+            {"error": conflict_message(e), "jwt": None}, status_code=200
         )
-    session.add(user)
-    session.commit()
-    session.refresh(user)
+    user_stats.added(user.firstName, user.lastName)
     jwt = encode_jwt({"email": user.email, "id": user.id})
     # send email with otp to the user
     # 
-    verificationLink = f'http://127.0.0.1:8000/api/v1/auth/verify/{otp}'
-    send_email("Verify Email", user.email, verificationEmailTemplate.format(
-        fullName = f'{user.firstName} {user.lastName}',
-        email = user.email,
-        verificationLink = verificationLink
-    ))
+    send_verification_email({**user.model_dump(), "verificationToken": otp})
     return JSONResponse({"jwt": jwt, "error": None}, status_code=200)
 
+@authRouter.post("/register/bulk")
+async def register_bulk(
+    users: Annotated[list[dict], Body()],
+    me: CurrentUser,
+    session: SessionDep,
+    sendEmails: Annotated[bool, Query()] = False,
+):
+    if me is None:
+        return JSONResponse({"error": "You are not authorized."}, status_code=status.HTTP_401_UNAUTHORIZED)
+    if len(users) > BULK_MAX_USERS:
+        return JSONResponse(
+            {"error": f"At most {BULK_MAX_USERS} users can be registered at once."},
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+        )
+    def on_registered(user: dict):
+        user_stats.added(user["firstName"], user["lastName"])
+        if sendEmails:
+            send_verification_email(user)
+
+    report = await register_many(session, users, on_registered=on_registered)
+    return JSONResponse(report, status_code=status.HTTP_200_OK)
+
 @authRouter.post("/login")
-def login(
+async def login(
     usernameOrEmail: Annotated[str, Body()],
     password: Annotated[str, Body()],
     session: SessionDep,
 ):
-    me = session.exec(
-        select(User).where(
-            or_(
-                User.username == usernameOrEmail.strip().lower(),
-                User.email == usernameOrEmail.strip().lower(),
-            ),
+    me = (
+        await session.exec(
+            select(User).where(
+                or_(
+                    User.username == usernameOrEmail.strip().lower(),
+                    User.email == usernameOrEmail.strip().lower(),
+                ),
+            )
         )
     ).first()
     if me is None:
@@ -169,15 +196,16 @@ def login(
             {"error": "Invalid username or email address.", "jwt": None},
             status_code=200,
         )
+    hashedPassword = me.password
+    await release_connection(session)
     try:
-        hasher.verify(me.password, password.strip())
-    except VerifyMismatchError:
+        valid = await hashing_pool.verify(hashedPassword, password.strip())
+    except HashingPoolSaturated:
+        return busy_response()
+    if not valid:
         return JSONResponse(
             {"error": "Invalid account password.", "jwt": None}, status_code=200
         )
-    me.loggedIn = True
-    session.add(me)
-    session.commit()
-    session.refresh(me)
+    await presence.set(me.id, True, session)
     jwt = encode_jwt({"email": me.email, "id": me.id})
     return JSONResponse({"jwt": jwt, "error": None}, status_code=200)
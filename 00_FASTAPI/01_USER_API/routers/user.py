@@ -1,24 +1,55 @@
-from fastapi import APIRouter, Header, status, Body, Query, UploadFile
+from fastapi import APIRouter, BackgroundTasks, Request, status, Body, Query
 
 from models import User
-from db import SessionDep
+from db import ReadSessionDep, SessionDep, new_session, release_connection
+import anyio
 from typing import Annotated, Literal
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, StreamingResponse
+from sqlalchemy.exc import IntegrityError
 from sqlmodel import select, and_
-from utils import (
-    validate_email,
-    validate_name,
-    validate_password,
-    validate_username,
-    decode_jwt,
-)
-from argon2.exceptions import VerifyMismatchError
-from argon2 import PasswordHasher
+from utils import validate_user
+from auth import CurrentUser, CurrentUserId, invalidate_user, load_user, user_cache
+from hashing import hashing_pool, HashingPoolSaturated
+from presence import presence
+from pagination import ORDER, SORT, InvalidCursor, keyset_page
+from avatars import Avatar, AvatarError, AvatarTooLarge, make_variants, receive_avatar
+from writes import conflict_message, delete_user_by_id, update_user_by_id
+from serializers import FastJSONResponse, FieldMapper, dumps
+from stats import user_stats
 
-hasher = PasswordHasher()
 userRouter = APIRouter(prefix="/api/v1/user")
 
 
+def busy_response():
+    return JSONResponse(
+        {"error": "The server is busy, please try again later."},
+        status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+        headers={"Retry-After": "1"},
+    )
+
+
+user_fields = FieldMapper(
+    User,
+    (
+        "id",
+        "username",
+        "email",
+        "firstName",
+        "lastName",
+        "verified",
+        "loggedIn",
+        "avatar",
+        "createdAt",
+        "updatedAt",
+    ),
+)
+
+
+def with_presence(fields: dict) -> dict:
+    fields["loggedIn"] = presence.logged_in(fields["id"], fields["loggedIn"])
+    return fields
+
+
 def collect_fields_from_users(user: User):
     return {
         "id": user.id,
@@ -27,98 +58,162 @@ def collect_fields_from_users(user: User):
         "firstName": user.firstName,
         "lastName": user.lastName,
         "verified": user.verified,
-        "loggedIn": user.loggedIn,
+        "loggedIn": presence.logged_in(user.id, user.loggedIn),
         "avatar": user.avatar,
         "createdAt": str(user.createdAt),
         "updatedAt": str(user.updatedAt),
     }
 
 
+def collect_fields_from_rows(rows) -> list[dict]:
+    return [with_presence(user_fields.row(row)) for row in rows]
+
+
 # Bearer authorization
 @userRouter.get("/me")
-def me(
-    authorization: Annotated[str | None, Header()] = None, session: SessionDep = None
-):
+async def me(id: CurrentUserId, session: ReadSessionDep):
     try:
-        if authorization is None:
+        if id is None:
             return JSONResponse({"me": None}, status_code=status.HTTP_401_UNAUTHORIZED)
-
-        _, jwt = authorization.split(" ")
-        payload = decode_jwt(jwt)
-        if payload is None:
+        if user_cache.ttl > 0:
+            # the cached user, see auth
+            me = await load_user(session, id)
+            me = None if me is None else collect_fields_from_users(me)
+        else:
+            row = (
+                await session.exec(select(*user_fields.columns()).where(User.id == id))
+            ).first()
+            me = None if row is None else collect_fields_from_rows([row])[0]
+        if me is None:
             return JSONResponse({"me": None}, status_code=status.HTTP_401_UNAUTHORIZED)
-        me = session.get(User, payload["id"])
-        me = collect_fields_from_users(me)
-        return JSONResponse({"me": me}, status_code=status.HTTP_200_OK)
+        return FastJSONResponse({"me": me}, status_code=status.HTTP_200_OK)
     except Exception:
         return JSONResponse(
             {"me": None}, status_code=status.HTTP_500_INTERNAL_SERVER_ERROR
         )
 
 
+EXPORT_FORMAT = Literal["json", "ndjson"]
+EXPORT_BATCH_SIZE = 1000
+
+
+async def stream_users(bind, format: EXPORT_FORMAT, batch_size: int = EXPORT_BATCH_SIZE):
+    # a new session is opened here because the one from SessionDep is closed
+    # before the body of a StreamingResponse is sent
+    async with new_session(bind) as session:
+        result = await session.stream(
+            select(*user_fields.columns())
+            .order_by(User.id)
+            .execution_options(yield_per=batch_size)
+        )
+        first = True
+        if format == "json":
+            yield b"["
+        async for rows in result.partitions():
+            rows = [dumps(fields) for fields in collect_fields_from_rows(rows)]
+            if format == "ndjson":
+                yield b"\n".join(rows) + b"\n"
+            else:
+                yield (b"" if first else b",") + b",".join(rows)
+            first = False
+        if format == "json":
+            yield b"]"
+
+
 @userRouter.get("/users")
-def all(session: SessionDep):
+async def all(
+    session: ReadSessionDep,
+    stream: Annotated[EXPORT_FORMAT | None, Query()] = None,
+):
+    if stream is not None:
+        return StreamingResponse(
+            stream_users(session.bind, stream),
+            media_type="application/x-ndjson" if stream == "ndjson" else "application/json",
+            status_code=status.HTTP_200_OK,
+        )
     try:
-        users = session.exec(select(User)).all()
-        users = [collect_fields_from_users(u) for u in users]
-        return JSONResponse(users, status_code=status.HTTP_200_OK)
+        rows = (await session.exec(select(*user_fields.columns()))).all()
+        return FastJSONResponse(collect_fields_from_rows(rows), status_code=status.HTTP_200_OK)
     except Exception:
         return JSONResponse([], status_code=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 
-ORDER = Literal["desc", "asc"]
-
-
 @userRouter.get("/")
-def users(
-    session: SessionDep,
+async def users(
+    session: ReadSessionDep,
     firstName: Annotated[str | None, Query()] = None,
     lastName: Annotated[str | None, Query()] = None,
     page: Annotated[int | None, Query()] = None,
     per_page: Annotated[int | None, Query()] = None,
     order: Annotated[ORDER, Query()] = "asc",
+    sort: Annotated[SORT, Query()] = "id",
+    after: Annotated[str | None, Query()] = None,
+    before: Annotated[str | None, Query()] = None,
+    limit: Annotated[int | None, Query(ge=1, le=100)] = None,
 ):
     # page=2&per_page=2
-    #
+    # limit=10&after=<cursor>
     try:
-        offset = None if per_page is None or page is None else (page - 1) * per_page
         lastName = lastName.strip().capitalize() if lastName is not None else None
         firstName = firstName.strip().capitalize() if firstName is not None else None
-        order = User.id.desc() if order == "desc" else User.id.asc()
 
+        # only the returned columns, as rows: no ORM objects for a listing
+        statement = select(*user_fields.columns())
         if firstName is not None and lastName is not None:
-            users = session.exec(
-                select(User)
-                .where(and_(User.firstName == firstName, User.lastName == lastName))
-                .offset(offset)
-                .limit(per_page)
-                .order_by(order)
-            ).all()
+            statement = statement.where(
+                and_(User.firstName == firstName, User.lastName == lastName)
+            )
         elif firstName is not None and lastName is None:
-            users = session.exec(
-                select(User)
-                .where(User.firstName == firstName)
-                .offset(offset)
-                .limit(per_page)
-                .order_by(order)
-            ).all()
+            statement = statement.where(User.firstName == firstName)
         elif firstName is None and lastName is not None:
-            users = session.exec(
-                select(User)
-                .where(User.lastName == lastName)
-                .offset(offset)
-                .limit(per_page)
-                .order_by(order)
-            ).all()
-        else:
-            users = session.exec(
-                select(User).offset(offset).limit(per_page).order_by(order)
-            ).all()
-        users = [collect_fields_from_users(u) for u in users]
-        return JSONResponse(
-            users
-            if offset is None
-            else {
+            statement = statement.where(User.lastName == lastName)
+
+        if limit is not None or after is not None or before is not None:
+            if after is not None and before is not None:
+                return JSONResponse(
+                    {"error": "Use either 'after' or 'before', not both."},
+                    status_code=status.HTTP_400_BAD_REQUEST,
+                )
+            try:
+                users, next_cursor, prev_cursor = await keyset_page(
+                    statement,
+                    session,
+                    sort=sort,
+                    order=order,
+                    limit=limit or 10,
+                    after=after,
+                    before=before,
+                )
+            except InvalidCursor as e:
+                return JSONResponse(
+                    {"error": str(e)}, status_code=status.HTTP_400_BAD_REQUEST
+                )
+            total = await user_stats.count(session, firstName, lastName)
+            return FastJSONResponse(
+                {
+                    "total": total,
+                    "limit": limit or 10,
+                    "order": order,
+                    "sort": sort,
+                    "next": next_cursor,
+                    "prev": prev_cursor,
+                    "users": collect_fields_from_rows(users),
+                },
+                status_code=status.HTTP_200_OK,
+            )
+
+        offset = None if per_page is None or page is None else (page - 1) * per_page
+        order = User.id.desc() if order == "desc" else User.id.asc()
+        rows = (
+            await session.exec(statement.offset(offset).limit(per_page).order_by(order))
+        ).all()
+        users = collect_fields_from_rows(rows)
+        if offset is None:
+            return FastJSONResponse(users, status_code=status.HTTP_200_OK)
+        total = await user_stats.count(session, firstName, lastName)
+        return FastJSONResponse(
+            {
+                "total": total,
                 "offset": offset,
                 "limit": per_page,
                 "pageNumber": page,
@@ -131,24 +226,28 @@ def users(
 
 
 @userRouter.get("/{id}")
-def user(id: int, session: SessionDep):
+async def user(id: int, session: ReadSessionDep):
     try:
-        me = session.get(User, id)
-        me = collect_fields_from_users(me)
-        return JSONResponse(me, status_code=status.HTTP_200_OK)
+        row = (
+            await session.exec(select(*user_fields.columns()).where(User.id == id))
+        ).one()
+        return FastJSONResponse(
+            collect_fields_from_rows([row])[0], status_code=status.HTTP_200_OK
+        )
     except Exception:
         return JSONResponse(None, status_code=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 
 @userRouter.delete("/{id}")
-def delete_user(id: int, session: SessionDep):
-    me = session.get(User, id)
+async def delete_user(id: int, session: SessionDep):
+    me = await delete_user_by_id(session, id)
     if me is None:
         return JSONResponse(
             {"error": f"The user with id '{id}' does not exists"}, status_code=200
         )
-    session.delete(me)
-    session.commit()
+    await session.commit()
+    user_stats.removed(me.firstName, me.lastName, me.verified)
+    invalidate_user(id)
     return JSONResponse(
         {"message": f"The user with id '{id}' was deleted."},
         status_code=status.HTTP_200_OK,
@@ -156,7 +255,7 @@ def delete_user(id: int, session: SessionDep):
 
 
 @userRouter.put("/{id}")
-def update_user(
+async def update_user(
     id: int,
     session: SessionDep,
     password: Annotated[str | None, Body()] = None,
@@ -165,107 +264,120 @@ def update_user(
     email: Annotated[str | None, Body()] = None,
     lastName: Annotated[str | None, Body()] = None,
 ):
-    me = session.get(User, id)
-    if me is None:
-        return JSONResponse(
-            {"error": f"The user with id '{id}' does not exists"}, status_code=200
-        )
-    if username is not None and validate_username(username.strip().lower()) is False:
-        return JSONResponse({"error": "The username is invalid."}, status_code=200)
-    if email is not None and validate_email(email.strip().lower()) is False:
-        return JSONResponse({"error": "The email address is invalid."}, status_code=200)
-    if firstName is not None and validate_name(firstName.strip()) is False:
-        return JSONResponse({"error": "The first name is invalid."}, status_code=200)
-    if lastName is not None and validate_name(lastName.strip()) is False:
-        return JSONResponse({"error": "The last name is invalid."}, status_code=200)
-    if password is not None and validate_password(password.strip()) is False:
+    errors = validate_user(
+        {
+            "username": username,
+            "email": email,
+            "firstName": firstName,
+            "lastName": lastName,
+            "password": password,
+        },
+        partial=True,
+    )
+    if errors:
         return JSONResponse(
-            {
-                "error": "The password must contain at least one letter, one number and one special character."
-            },
-            status_code=200,
+            {"error": next(iter(errors.values())), "errors": errors}, status_code=200
         )
-    if password is not None:
-        try:
-            hasher.verify(me.password, password.strip())
-            return JSONResponse(
-                {"error": "You can not set your new password as old password."},
-                status_code=200,
-            )
-        except VerifyMismatchError:
-            pass
+    values = {}
     if username is not None:
-        username_taken = session.exec(
-            select(User).where(User.username == username.strip().lower())
-        ).first()
-        if username_taken:
-            return JSONResponse(
-                {"error": "The username is already in use.", "jwt": None},
-                status_code=200,
-            )
+        values["username"] = username.strip().lower()
     if email is not None:
-        email_taken = session.exec(
-            select(User).where(User.email == email.strip().lower())
+        values["email"] = email.strip().lower()
+    if firstName is not None:
+        values["firstName"] = firstName.strip().capitalize()
+    if lastName is not None:
+        values["lastName"] = lastName.strip().capitalize()
+    if password is not None:
+        currentPassword = (
+            await session.exec(select(User.password).where(User.id == id))
         ).first()
-        if email_taken:
+        if currentPassword is None:
             return JSONResponse(
-                {"error": "The email is already in use.", "jwt": None}, status_code=200
+                {"error": f"The user with id '{id}' does not exists"}, status_code=200
             )
-    me.password = hasher.hash(password.strip()) if password is not None else me.password
-    me.username = username.strip().lower() if username is not None else me.username
-    me.email = email.strip().lower() if email is not None else me.email
-    me.firstName = (
-        firstName.strip().capitalize() if firstName is not None else me.firstName
-    )
-    me.lastName = lastName.strip().capitalize() if lastName is not None else me.lastName
-
-    session.add(me)
-    session.commit()
-    session.refresh(me)
+        await release_connection(session)
+        try:
+            if await hashing_pool.verify(currentPassword, password.strip()):
+                return JSONResponse(
+                    {"error": "You can not set your new password as old password."},
+                    status_code=200,
+                )
+            values["password"] = await hashing_pool.hash(password.strip())
+        except HashingPoolSaturated:
+            return busy_response()
+    try:
+        me = await update_user_by_id(session, id, values)
+        await session.commit()
+    except IntegrityError as e:
+        await session.rollback()
+        return JSONResponse(
+            {"error": conflict_message(e), "jwt": None},
+            status_code=200,
+        )
+    if me is None:
+        return JSONResponse(
+            {"error": f"The user with id '{id}' does not exists"}, status_code=200
+        )
+    if "firstName" in values or "lastName" in values:
+        user_stats.renamed()
+    invalidate_user(me.id)
     me = collect_fields_from_users(me)
-    return JSONResponse(me, status_code=status.HTTP_200_OK)
+    return FastJSONResponse(me, status_code=status.HTTP_200_OK)
+
+
+async def finish_avatar(bind, id: int, avatar: Avatar):
+    # runs after the response was sent, swaps the original picture for the
+    # resized variant once it exists
+    if not await anyio.to_thread.run_sync(make_variants, avatar):
+        return
+    async with new_session(bind) as session:
+        me = await update_user_by_id(
+            session, id, {"avatar": avatar.default_variant_url()}, User.avatar == avatar.url
+        )
+        await session.commit()
+        if me is None:
+            return
+    invalidate_user(id)
 
 
 @userRouter.patch("/update-profile")
-def update_avatar(
-    avatar: UploadFile,
-    authorization: Annotated[str | None, Header()] = None,
-    session: SessionDep = None,
+async def update_avatar(
+    request: Request,
+    me: CurrentUser,
+    session: SessionDep,
+    background_tasks: BackgroundTasks,
 ):
     try:
-        if authorization is None:
+        if me is None:
             return JSONResponse(
                 {"success": False, "url": None},
                 status_code=status.HTTP_401_UNAUTHORIZED,
             )
-
-        _, jwt = authorization.split(" ")
-        payload = decode_jwt(jwt)
-        if payload is None:
+        await release_connection(session)
+        try:
+            avatar = await receive_avatar(request)
+        except AvatarTooLarge as e:
             return JSONResponse(
-                {"success": False, "url": None},
-                status_code=status.HTTP_401_UNAUTHORIZED,
+                {"success": False, "url": None, "error": str(e)},
+                status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
             )
-        me = session.get(User, payload["id"])
-        if me is None:
+        except AvatarError as e:
             return JSONResponse(
-                {"success": False, "url": None},
-                status_code=status.HTTP_401_UNAUTHORIZED,
+                {"success": False, "url": None, "error": str(e)},
+                status_code=status.HTTP_400_BAD_REQUEST,
             )
-        # hello.jpge
-        ext = avatar.filename.split(".")[-1]
-        save_name = f"storage/{str(me.id)}-avatar.{ext}"
-        # print(avatar)
-        with open(save_name, "wb+") as file_object:
-            file_object.write(avatar.file.read())
-
-        avatar = f"http://127.0.0.1:8000/{save_name}"
-        me.avatar = avatar
-        session.add(me)
-        session.commit()
-        session.refresh(me)
+
+        if avatar.has_variants():
+            url = avatar.default_variant_url()
+        else:
+            url = avatar.url
+            background_tasks.add_task(finish_avatar, session.bind, me.id, avatar)
+        me = await update_user_by_id(session, me.id, {"avatar": url})
+        await session.commit()
+        invalidate_user(me.id)
         return JSONResponse(
-            {"success": False, "url": me.avatar}, status_code=status.HTTP_200_OK
+            {"success": True, "url": me.avatar, "variants": avatar.variant_urls()},
+            status_code=status.HTTP_200_OK,
         )
     except Exception:
         return JSONResponse(
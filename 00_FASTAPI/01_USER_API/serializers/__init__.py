@@ -0,0 +1,59 @@
+"""
+Serialization of the payloads of the routes.
+
+`FieldMapper` gives the columns to select for the fields a route returns,
+and maps the rows of those columns to the dict of fields: no ORM object is
+built per row. Routes which have an ORM object already build their dict by
+hand, mapping it through the fields isn't any faster.
+
+`FastJSONResponse` renders with orjson, several times faster than
+`json.dumps`, and falls back to the standard library without it. Datetimes
+are rendered as `str()` renders them (`2025-02-26 16:42:35`), the format the
+routes have always returned, rather than in the ISO 8601 of orjson. Its
+rendering time is counted by the request metrics (see `metrics`).
+"""
+
+import json
+from datetime import date, datetime
+from typing import Any, Iterable
+from fastapi.responses import JSONResponse
+from metrics import timed_render
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover
+    orjson = None
+
+
+def default(value):
+    if isinstance(value, (date, datetime)):
+        return str(value)
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def dumps(content: Any) -> bytes:
+    if orjson is not None:
+        # datetimes go to `default` instead of the ISO 8601 of orjson
+        return orjson.dumps(content, default=default, option=orjson.OPT_PASSTHROUGH_DATETIME)
+    return json.dumps(
+        content, default=default, ensure_ascii=False, separators=(",", ":")
+    ).encode("utf-8")
+
+
+class FastJSONResponse(JSONResponse):
+    @timed_render
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
+
+
+class FieldMapper:
+    def __init__(self, model, fields: Iterable[str]):
+        self.model = model
+        self.fields = tuple(fields)
+
+    def row(self, row: tuple) -> dict:
+        return dict(zip(self.fields, row))
+
+    def columns(self) -> list:
+        """The columns to select for `row`, in the order of the fields."""
+        return [getattr(self.model, name) for name in self.fields]
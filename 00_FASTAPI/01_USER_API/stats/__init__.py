@@ -0,0 +1,133 @@
+"""
+User counts for `GET /` (`totalUsers`, `verifiedUsers`) and the `total` of
+the paginated listings, without counting the table on every request.
+
+The number of users by `verified` is read with one query when first needed,
+then kept up to date in memory by the routes that register, verify or delete
+users, and recounted every STATS_REFRESH_SECONDS (300) by a background task
+to pick up other writers (e.g. `python -m bulk`). Counts filtered on
+`firstName`/`lastName` run on the name indexes and are cached for STATS_TTL
+seconds (300), being updated in place as well. Between two recounts the
+counts are approximate if other processes write; `exact=True` recounts.
+Clients can't ask for exact counts, which would count the table on every
+request.
+"""
+
+import asyncio
+import os
+from itertools import product
+from sqlalchemy import func
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
+from cache import TTLCache
+from db import new_session, read_engine
+from models import User
+
+STATS_TTL = float(os.environ.get("STATS_TTL", 300))
+STATS_REFRESH_SECONDS = float(os.environ.get("STATS_REFRESH_SECONDS", 300))
+STATS_CACHE_SIZE = 10_000
+
+
+class UserStats:
+    def __init__(self, engine, ttl: float = STATS_TTL, interval: float = STATS_REFRESH_SECONDS):
+        self.engine = engine
+        self.interval = interval
+        # the number of users by verified, None until counted
+        self.totals: dict[bool, int] | None = None
+        # (firstName, lastName, verified) -> count, at least one name is set
+        self.filtered = TTLCache(maxsize=STATS_CACHE_SIZE, ttl=ttl)
+        self.task: asyncio.Task | None = None
+        self.recounts = 0
+
+    async def load(self, session: AsyncSession):
+        rows = await session.exec(
+            select(User.verified, func.count()).group_by(User.verified)
+        )
+        totals = {True: 0, False: 0}
+        for verified, count in rows:
+            totals[bool(verified)] = count
+        self.totals = totals
+        self.recounts += 1
+
+    async def count(
+        self,
+        session: AsyncSession,
+        firstName: str | None = None,
+        lastName: str | None = None,
+        verified: bool | None = None,
+        exact: bool = False,
+    ) -> int:
+        if firstName is None and lastName is None:
+            if exact or self.totals is None:
+                await self.load(session)
+            if verified is None:
+                return self.totals[True] + self.totals[False]
+            return self.totals[verified]
+
+        key = (firstName, lastName, verified)
+        if not exact:
+            count = self.filtered.get(key)
+            if count is not None:
+                return count
+        statement = select(func.count()).select_from(User)
+        if firstName is not None:
+            statement = statement.where(User.firstName == firstName)
+        if lastName is not None:
+            statement = statement.where(User.lastName == lastName)
+        if verified is not None:
+            statement = statement.where(User.verified == verified)
+        count = (await session.exec(statement)).one()
+        self.filtered.set(key, count)
+        return count
+
+    def adjust(self, firstName: str, lastName: str, verified: bool, delta: int):
+        if self.totals is not None:
+            self.totals[verified] += delta
+        # every cached filter the user matches
+        for key in product((firstName, None), (lastName, None), (verified, None)):
+            if key[0] is not None or key[1] is not None:
+                self.filtered.update(key, lambda count: count + delta)
+
+    def added(self, firstName: str, lastName: str, verified: bool = False):
+        self.adjust(firstName, lastName, verified, 1)
+
+    def removed(self, firstName: str, lastName: str, verified: bool):
+        self.adjust(firstName, lastName, verified, -1)
+
+    def verify(self, firstName: str, lastName: str):
+        self.adjust(firstName, lastName, False, -1)
+        self.adjust(firstName, lastName, True, 1)
+
+    def clear(self):
+        # the next counts are read from the table
+        self.totals = None
+        self.filtered.clear()
+
+    def renamed(self):
+        # the previous name isn't known, the filtered counts are recounted
+        self.filtered.clear()
+
+    async def run(self):
+        while True:
+            try:
+                async with new_session(self.engine) as session:
+                    await self.load(session)
+            except Exception:
+                pass
+            await asyncio.sleep(self.interval)
+
+    def start(self):
+        if self.task is None:
+            self.task = asyncio.get_running_loop().create_task(self.run())
+
+    async def stop(self):
+        if self.task is not None:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+            self.task = None
+
+
+user_stats = UserStats(read_engine)
@@ -1,11 +1,18 @@
 from fastapi.testclient import TestClient
 from app import app
+from stats import user_stats
 
 client = TestClient(app)
 
 
 class TestApp:
     def test_default(self):
+        user_stats.clear()
         res = client.get("/")
         assert res.status_code == 200
-        assert res.json() == {"message": "This is a users API", "totalUsers": 0}
+        users = client.get("api/v1/user/users").json()
+        assert res.json() == {
+            "message": "This is a users API",
+            "totalUsers": len(users),
+            "verifiedUsers": len([u for u in users if u["verified"]]),
+        }
@@ -1,6 +1,10 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
 from fastapi.testclient import TestClient
 from app import app
 from random import randint
+from hashing import hashing_pool, HashingPoolSaturated
+from ratelimit import limiter
 
 client = TestClient(app)
 
@@ -35,3 +39,111 @@ class TestAuth:
         data = res.json()
         assert data["jwt"] is not None
         assert data["error"] is None
+
+    def test_login_when_hashing_pool_is_saturated(self, monkeypatch):
+        monkeypatch.setattr(hashing_pool, "max_pending", 0)
+        res = client.post(
+            "api/v1/auth/login",
+            json={
+                "usernameOrEmail": "crispengari@gmail.com",
+                "password": "Password@15",
+            },
+        )
+        assert res.status_code == 429
+        assert res.headers["retry-after"] == "1"
+        assert res.json()["jwt"] is None
+        assert client.get("/metrics/hashing").json()["rejected"] >= 1
+
+    def test_hash_many_reserves_every_chunk_at_once(self, monkeypatch):
+        executor = ThreadPoolExecutor(2)
+        monkeypatch.setattr(hashing_pool, "_get_executor", lambda: executor)
+        monkeypatch.setattr(hashing_pool, "max_workers", 2)
+        monkeypatch.setattr(hashing_pool, "max_pending", 2)
+
+        async def both():
+            return await asyncio.gather(
+                hashing_pool.hash_many(["Password@15", "Password@16"]),
+                hashing_pool.hash_many(["Password@17", "Password@18"]),
+                return_exceptions=True,
+            )
+
+        submitted = hashing_pool.submitted
+        first, second = asyncio.run(both())
+        executor.shutdown()
+        # the second call is rejected as a whole, none of its chunks ran
+        assert len(first) == 2
+        assert isinstance(second, HashingPoolSaturated)
+        assert hashing_pool.submitted == submitted + 2
+        assert hashing_pool.pending == 0
+
+    def test_login_wrong_password(self):
+        res = client.post(
+            "api/v1/auth/login",
+            json={
+                "usernameOrEmail": "crispengari@gmail.com",
+                "password": "Password@16",
+            },
+        )
+        assert res.status_code == 200
+        assert res.json() == {"error": "Invalid account password.", "jwt": None}
+
+    def test_register_returns_every_field_error(self):
+        res = client.post(
+            "api/v1/auth/register",
+            json={
+                "firstName": "Jonh",
+                "password": "password",
+                "username": "a_",
+                "email": "hello",
+                "lastName": "Doe",
+            },
+        )
+        assert res.status_code == 200
+        data = res.json()
+        assert data["jwt"] is None
+        assert data["error"] == "The username is invalid."
+        assert set(data["errors"]) == {"username", "email", "password"}
+
+    def test_register_bulk(self):
+        r = randint(0, 10000000)
+        user = {
+            "firstName": "Jonh",
+            "password": "Password@15",
+            "lastName": "Doe",
+        }
+        # the few bulk registrations an IP gets are shared with the other tests
+        limiter.storage.clear()
+        res = client.post("api/v1/auth/register/bulk", json=[])
+        assert res.status_code == 401
+        jwt = client.post(
+            "api/v1/auth/register",
+            json={**user, "username": f"bulkowner{r}", "email": f"bulkowner{r}@gmail.com"},
+        ).json()["jwt"]
+        res = client.post(
+            "api/v1/auth/register/bulk",
+            headers={"Authorization": f"Bearer {jwt}"},
+            json=[
+                {**user, "username": f"bulkuser{r}", "email": f"bulk{r}@gmail.com"},
+                {**user, "username": f"bulkuser{r}", "email": f"bulk{r}x@gmail.com"},
+                {**user, "username": "username35", "email": f"bulk{r}y@gmail.com"},
+                {**user, "username": "a_", "email": f"bulk{r}z@gmail.com"},
+                {**user, "username": f"bulkuser{r}b", "email": f"BULK{r}B@gmail.com "},
+            ],
+        )
+        assert res.status_code == 200
+        data = res.json()
+        assert data["inserted"] == 2
+        assert data["failed"] == 3
+        errors = [row["error"] for row in data["results"]]
+        assert errors == [
+            None,
+            "The username is already in use.",
+            "The username is already in use.",
+            "The username is invalid.",
+            None,
+        ]
+        res = client.post(
+            "api/v1/auth/login",
+            json={"usernameOrEmail": f"bulk{r}b@gmail.com", "password": "Password@15"},
+        )
+        assert res.json()["jwt"] is not None
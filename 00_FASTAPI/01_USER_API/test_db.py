@@ -0,0 +1,52 @@
+import asyncio
+import os
+import tempfile
+import pytest
+from sqlalchemy import text
+from sqlalchemy.exc import OperationalError
+from db import make_engine
+
+
+class TestDb:
+    @classmethod
+    def setup_class(cls):
+        fd, cls.path = tempfile.mkstemp(suffix=".db")
+        os.close(fd)
+
+    @classmethod
+    def teardown_class(cls):
+        for suffix in ("", "-wal", "-shm"):
+            if os.path.exists(cls.path + suffix):
+                os.remove(cls.path + suffix)
+
+    def test_pragmas(self):
+        async def pragmas():
+            engine = make_engine(f"sqlite:///{self.path}")
+            try:
+                async with engine.connect() as conn:
+                    return [
+                        (await conn.execute(text(f"PRAGMA {name}"))).scalar()
+                        for name in ("journal_mode", "synchronous", "busy_timeout", "foreign_keys")
+                    ]
+            finally:
+                await engine.dispose()
+
+        assert asyncio.run(pragmas()) == ["wal", 1, 5000, 1]
+
+    def test_read_engine_is_read_only(self):
+        async def run():
+            engine = make_engine(f"sqlite:///{self.path}")
+            read_engine = make_engine(f"sqlite:///{self.path}", read_only=True)
+            try:
+                async with engine.begin() as conn:
+                    await conn.execute(text("CREATE TABLE IF NOT EXISTS t (x INTEGER)"))
+                    await conn.execute(text("INSERT INTO t VALUES (1)"))
+                async with read_engine.connect() as conn:
+                    assert (await conn.execute(text("SELECT count(*) FROM t"))).scalar() == 1
+                    with pytest.raises(OperationalError, match="readonly"):
+                        await conn.execute(text("INSERT INTO t VALUES (2)"))
+            finally:
+                await engine.dispose()
+                await read_engine.dispose()
+
+        asyncio.run(run())
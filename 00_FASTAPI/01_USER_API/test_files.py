@@ -0,0 +1,103 @@
+import asyncio
+import hashlib
+import os
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from files import StorageFiles, ZEROCOPY
+
+DIGEST = hashlib.sha256(b"avatar").hexdigest()
+
+
+def make_client(directory, **kwargs):
+    app = FastAPI()
+    app.mount("/storage", StorageFiles(directory=directory, **kwargs), name="storage")
+    return TestClient(app)
+
+
+class TestFiles:
+    def test_hashed_files_are_immutable(self, tmp_path):
+        (tmp_path / f"{DIGEST}-64.webp").write_bytes(b"0123456789")
+        client = make_client(tmp_path)
+        res = client.get(f"/storage/{DIGEST}-64.webp")
+        assert res.status_code == 200
+        assert res.content == b"0123456789"
+        assert res.headers["etag"] == f'"{DIGEST}-64"'
+        assert "immutable" in res.headers["cache-control"]
+
+        res = client.get(
+            f"/storage/{DIGEST}-64.webp", headers={"If-None-Match": res.headers["etag"]}
+        )
+        assert res.status_code == 304
+        assert res.content == b""
+
+    def test_other_files_are_revalidated(self, tmp_path):
+        path = tmp_path / "default.png"
+        path.write_bytes(b"default")
+        client = make_client(tmp_path)
+        res = client.get("/storage/default.png")
+        etag = res.headers["etag"]
+        assert etag == f'"{hashlib.sha256(b"default").hexdigest()}"'
+        assert res.headers["cache-control"] == "no-cache"
+        assert client.get("/storage/default.png", headers={"If-None-Match": etag}).status_code == 304
+
+        # a changed file has a new etag and is read again
+        path.write_bytes(b"changed!")
+        os.utime(path, ns=(0, 10**9))
+        res = client.get("/storage/default.png", headers={"If-None-Match": etag})
+        assert res.status_code == 200
+        assert res.content == b"changed!"
+
+    def test_range_requests(self, tmp_path):
+        (tmp_path / f"{DIGEST}.png").write_bytes(b"0123456789")
+        (tmp_path / "big.bin").write_bytes(b"0123456789")
+        for cache_max_bytes in (1024, 0):
+            client = make_client(tmp_path, cache_max_bytes=cache_max_bytes)
+            for name in (f"{DIGEST}.png", "big.bin"):
+                res = client.get(f"/storage/{name}", headers={"Range": "bytes=2-5"})
+                assert res.status_code == 206
+                assert res.content == b"2345"
+                assert res.headers["content-range"] == "bytes 2-5/10"
+            res = client.get(f"/storage/{DIGEST}.png", headers={"Range": "bytes=20-"})
+            assert res.status_code == 416
+
+    def test_head_requests(self, tmp_path):
+        (tmp_path / f"{DIGEST}.png").write_bytes(b"0123456789")
+        res = make_client(tmp_path).head(f"/storage/{DIGEST}.png")
+        assert res.status_code == 200
+        assert res.headers["content-length"] == "10"
+        assert res.content == b""
+
+    def zerocopy(self, directory, headers: list) -> list[dict]:
+        files = StorageFiles(directory=directory, cache_max_bytes=0)
+        messages = []
+
+        async def receive():
+            return {"type": "http.request", "body": b"", "more_body": False}
+
+        async def send(message):
+            if message["type"] == ZEROCOPY:
+                message["file"].seek(message["offset"])
+                message = {**message, "body": message["file"].read(message["count"])}
+            messages.append(message)
+
+        scope = {
+            "type": "http",
+            "method": "GET",
+            "path": "/big.bin",
+            "root_path": "",
+            "headers": headers,
+            "extensions": {ZEROCOPY: {}},
+        }
+        asyncio.run(files(scope, receive, send))
+        return messages
+
+    def test_zerocopy(self, tmp_path):
+        (tmp_path / "big.bin").write_bytes(b"0123456789")
+        messages = self.zerocopy(tmp_path, [])
+        assert messages[0]["status"] == 200
+        assert messages[1]["type"] == ZEROCOPY
+        assert messages[1]["body"] == b"0123456789"
+        # ranges are read by FileResponse
+        messages = self.zerocopy(tmp_path, [(b"range", b"bytes=2-5")])
+        assert messages[0]["status"] == 206
+        assert b"".join(m.get("body", b"") for m in messages[1:]) == b"2345"
@@ -0,0 +1,63 @@
+from mail import MailDispatcher, MemoryTransport, build_message
+
+
+class FlakyTransport(MemoryTransport):
+    # fails every other send, like a server that drops idle connections
+    calls = 0
+
+    def send(self, message):
+        FlakyTransport.calls += 1
+        if FlakyTransport.calls % 2 == 1:
+            raise ConnectionError("connection lost")
+        super().send(message)
+
+
+class TestMail:
+    def test_dispatcher_sends_queued_messages(self):
+        outbox = []
+        dispatcher = MailDispatcher(lambda: MemoryTransport(outbox), workers=2)
+        for i in range(50):
+            dispatcher.enqueue("Verify Email", f"user{i}@gmail.com", "<p>hi</p>")
+        dispatcher.stop()
+        assert sorted(m["To"] for m in outbox) == sorted(
+            f"user{i}@gmail.com" for i in range(50)
+        )
+        assert dispatcher.metrics()["sent"] == 50
+
+    def test_dispatcher_retries_failed_sends(self):
+        outbox = []
+        dispatcher = MailDispatcher(
+            lambda: FlakyTransport(outbox), workers=1, backoff=0
+        )
+        for i in range(5):
+            dispatcher.enqueue("Verify Email", f"user{i}@gmail.com", "<p>hi</p>")
+        dispatcher.stop()
+        assert len(outbox) == 5
+        assert dispatcher.metrics()["retried"] == 5
+        assert dispatcher.metrics()["failed"] == 0
+
+    def test_dispatcher_gives_up_after_max_retries(self):
+        class DeadTransport(MemoryTransport):
+            def send(self, message):
+                raise ConnectionError("connection refused")
+
+        dispatcher = MailDispatcher(DeadTransport, workers=1, max_retries=2, backoff=0)
+        dispatcher.enqueue("Verify Email", "user@gmail.com", "<p>hi</p>")
+        dispatcher.stop()
+        assert dispatcher.metrics()["failed"] == 1
+        assert dispatcher.metrics()["retried"] == 2
+
+    def test_a_batch_is_sent_over_one_connection(self):
+        transport = MemoryTransport()
+        dispatcher = MailDispatcher(lambda: transport, workers=1, batch_size=5)
+        for i in range(10):
+            dispatcher.queue.put(build_message("Verify Email", f"user{i}@gmail.com", "<p>hi</p>"))
+        dispatcher.start()
+        dispatcher.join()
+        assert transport.connections == 1
+        # closed once the queue is empty, the next message opens a new one
+        assert not transport.connected
+        dispatcher.enqueue("Verify Email", "user10@gmail.com", "<p>hi</p>")
+        dispatcher.stop()
+        assert transport.connections == 2
+        assert len(transport.outbox) == 11
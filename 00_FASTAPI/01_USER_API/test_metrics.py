@@ -0,0 +1,91 @@
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from app import app
+from metrics import Histogram, MetricsMiddleware, Registry, SECONDS, registry as app_registry, server_error
+
+client = TestClient(app)
+
+
+def measured_client(sample_rate: float = 1, **options):
+    registry = Registry()
+    middleware = MetricsMiddleware(app, registry=registry, sample_rate=sample_rate, **options)
+
+    # TestClient tells ASGI 3 apps by a coroutine `__call__`
+    async def asgi(scope, receive, send):
+        await middleware(scope, receive, send)
+
+    return TestClient(asgi), registry
+
+
+class TestMetrics:
+    def test_histogram_buckets(self):
+        histogram = Histogram(0, 10)
+        for value in (0, 1, 2, 2, 3, 1000, 5000):
+            histogram.record(value)
+        # buckets include their upper bound
+        buckets = dict(histogram.buckets())
+        assert buckets[1] == 2
+        assert buckets[2] == 4
+        assert buckets[4] == 5
+        assert buckets[1024] == 6
+        assert histogram.count == 7 and histogram.max == 5000
+
+    def test_histogram_percentiles(self):
+        histogram = Histogram(*SECONDS)
+        values = [i / 10000 for i in range(1, 10001)]
+        for value in values:
+            histogram.record(value)
+        for q in (0.5, 0.9, 0.99):
+            exact = values[int(q * len(values)) - 1]
+            assert exact <= histogram.percentile(q) <= exact * 1.125
+
+    def test_db_statements_and_render_time_per_route(self):
+        measured, registry = measured_client(server_timing=True)
+        id = measured.get("api/v1/user/users").json()[0]["id"]
+        res = measured.get(f"api/v1/user/{id}")
+        assert res.status_code == 200
+        assert 'db;dur=' in res.headers["server-timing"]
+        assert '"1 statements"' in res.headers["server-timing"]
+        metrics = registry.routes[("GET", "/api/v1/user/{id}")]
+        assert metrics.db_statements.sum == 1
+        assert metrics.db_duration.sum > 0
+        assert metrics.render_duration.sum > 0
+        assert metrics.size.sum == len(res.content)
+        assert registry.responses[("GET", "/api/v1/user/{id}", 200)] == 1
+
+    def test_sampling(self):
+        measured, registry = measured_client(sample_rate=0.25)
+        for _ in range(8):
+            assert measured.get("/api/v1/user/users").status_code == 200
+        assert registry.routes[("GET", "/api/v1/user/users")].duration.count == 2
+        text = registry.render()
+        assert "metrics_sample_rate 0.25" in text
+        # every response is counted
+        assert 'http_responses_total{method="GET",route="/api/v1/user/users",status="200"} 8' in text
+        assert 'http_request_duration_seconds_count{method="GET",route="/api/v1/user/users"} 2' in text
+
+    def test_unhandled_errors_are_counted(self):
+        broken = FastAPI()
+        broken.add_middleware(MetricsMiddleware, registry=Registry(), sample_rate=0)
+        broken.add_exception_handler(Exception, server_error)
+
+        @broken.get("/broken")
+        def fail():
+            raise RuntimeError("broken")
+
+        key = ("GET", "/broken", 500)
+        before = app_registry.responses.get(key, 0)
+        res = TestClient(broken, raise_server_exceptions=False).get("/broken")
+        assert res.status_code == 500 and res.text == "Internal Server Error"
+        assert app_registry.responses[key] == before + 1
+
+    def test_metrics_endpoint(self):
+        measured, registry = measured_client()
+        measured.get("/")
+        res = client.get("/metrics")
+        assert res.status_code == 200
+        assert res.headers["content-type"].startswith("text/plain; version=0.0.4")
+        assert "# TYPE http_request_duration_seconds histogram" in res.text
+        text = registry.render()
+        assert 'http_request_duration_seconds_count{method="GET",route="/"} 1' in text
+        assert 'http_request_db_statements_bucket{method="GET",route="/",le="+Inf"} 1' in text
@@ -0,0 +1,104 @@
+import asyncio
+import os
+import tempfile
+from fastapi.testclient import TestClient
+from sqlalchemy import text
+from sqlmodel import SQLModel
+from app import app
+from db import make_engine
+from presence import Presence, presence
+
+client = TestClient(app)
+
+
+class TestPresence:
+    @classmethod
+    def setup_class(cls):
+        fd, cls.path = tempfile.mkstemp(suffix=".db")
+        os.close(fd)
+        cls.engine = make_engine(f"sqlite:///{cls.path}")
+
+        async def setup():
+            async with cls.engine.begin() as conn:
+                await conn.run_sync(SQLModel.metadata.create_all)
+                for id in (1, 2, 3):
+                    await conn.execute(
+                        text(
+                            'INSERT INTO user (id, "firstName", "lastName", password, email,'
+                            ' username, verified, "loggedIn", "verificationToken")'
+                            " VALUES (:id, 'Jonh', 'Doe', 'x', :email, :username, 0, 0, '000000')"
+                        ),
+                        {"id": id, "email": f"user{id}@gmail.com", "username": f"user{id}"},
+                    )
+
+        asyncio.run(setup())
+
+    @classmethod
+    def teardown_class(cls):
+        asyncio.run(cls.engine.dispose())
+        for suffix in ("", "-wal", "-shm"):
+            if os.path.exists(cls.path + suffix):
+                os.remove(cls.path + suffix)
+
+    async def read(self) -> dict:
+        async with self.engine.connect() as conn:
+            rows = await conn.execute(text('SELECT id, "loggedIn" FROM user'))
+            return {id: bool(value) for id, value in rows}
+
+    def logged_in(self) -> dict:
+        return asyncio.run(self.read())
+
+    def test_changes_are_written_in_one_flush(self):
+        tracker = Presence(self.engine, mode="write-behind")
+
+        async def run():
+            for id in (1, 2, 3):
+                await tracker.set(id, True)
+            await tracker.set(3, False)
+            assert await self.read() == {1: False, 2: False, 3: False}
+            assert tracker.logged_in(1, False) and not tracker.logged_in(3, True)
+            await tracker.flush()
+
+        asyncio.run(run())
+        assert self.logged_in() == {1: True, 2: True, 3: False}
+        assert tracker.metrics()["flushes"] == 1
+        assert tracker.metrics()["pending"] == 0
+
+    def test_write_through(self):
+        tracker = Presence(self.engine, mode="write-through")
+        asyncio.run(tracker.set(2, False))
+        assert self.logged_in()[2] is False
+        assert tracker.metrics()["pending"] == 0
+
+    def test_failed_flush_is_retried(self, monkeypatch):
+        tracker = Presence(self.engine, mode="write-behind")
+
+        async def fail(changes):
+            raise ConnectionError("database is gone")
+
+        async def run():
+            await tracker.set(1, False)
+            monkeypatch.setattr(tracker, "write", fail)
+            await tracker.flush()
+            assert tracker.pending == {1: False}
+            monkeypatch.undo()
+            await tracker.flush()
+
+        asyncio.run(run())
+        assert tracker.metrics()["failed"] == 1
+        assert self.logged_in()[1] is False
+
+    def test_login_is_served_from_memory(self):
+        presence.pending.clear()
+        res = client.post(
+            "api/v1/auth/login",
+            json={"usernameOrEmail": "crispengari@gmail.com", "password": "Password@15"},
+        )
+        assert res.json()["jwt"] is not None
+        assert presence.pending == {1: True}
+        assert client.get("api/v1/user/1").json()["loggedIn"] is True
+        headers = {"Authorization": f"Bearer {res.json()['jwt']}"}
+        client.post("api/v1/auth/logout", headers=headers)
+        assert presence.pending == {1: False}
+        assert client.get("api/v1/user/1").json()["loggedIn"] is False
+        presence.pending.clear()
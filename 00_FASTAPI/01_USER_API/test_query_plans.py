@@ -0,0 +1,109 @@
+import asyncio
+import os
+import sqlite3
+import tempfile
+from fastapi.testclient import TestClient
+from sqlalchemy import event
+from sqlmodel import SQLModel
+from app import app
+from db import get_read_session, get_session, make_engine, new_session
+from migrations import migrate
+from ratelimit import limiter
+from utils import encode_jwt
+
+client = TestClient(app)
+
+
+class TestQueryPlans:
+    """
+    Runs every route against a scratch database, records the statements they
+    send and fails if SQLite plans a full table scan for any statement that
+    filters rows. Statements without a WHERE clause (the exports and the
+    unfiltered listing) read the whole table by design.
+    """
+
+    @classmethod
+    def setup_class(cls):
+        fd, cls.path = tempfile.mkstemp(suffix=".db")
+        os.close(fd)
+        cls.engine = make_engine(f"sqlite:///{cls.path}")
+
+        async def setup():
+            async with cls.engine.begin() as conn:
+                await conn.run_sync(SQLModel.metadata.create_all)
+            await migrate(cls.engine)
+            await cls.engine.dispose()
+
+        asyncio.run(setup())
+        cls.statements = []
+
+        @event.listens_for(cls.engine.sync_engine, "before_cursor_execute")
+        def record(conn, cursor, statement, parameters, context, executemany):
+            if executemany:
+                parameters = parameters[0]
+            cls.statements.append((statement, parameters))
+
+        async def get_test_session():
+            async with new_session(cls.engine) as session:
+                yield session
+
+        app.dependency_overrides[get_session] = get_test_session
+        app.dependency_overrides[get_read_session] = get_test_session
+
+    @classmethod
+    def teardown_class(cls):
+        app.dependency_overrides.clear()
+        asyncio.run(cls.engine.dispose())
+        os.remove(cls.path)
+
+    def run_routes(self):
+        user = {"firstName": "Jonh", "lastName": "Doe", "password": "Password@15"}
+        client.post(
+            "api/v1/auth/register",
+            json={**user, "username": "planuser1", "email": "plan1@gmail.com"},
+        )
+        headers = {"Authorization": f"Bearer {encode_jwt({'id': 1, 'email': 'plan1@gmail.com'})}"}
+        limiter.storage.clear()
+        client.post(
+            "api/v1/auth/register/bulk",
+            headers=headers,
+            json=[{**user, "username": "planuser2", "email": "plan2@gmail.com"}],
+        )
+        client.post(
+            "api/v1/auth/login",
+            json={"usernameOrEmail": "planuser1", "password": "Password@15"},
+        )
+        client.get("api/v1/user/me", headers=headers)
+        client.get("api/v1/auth/verify/000000", headers=headers)
+        client.get("api/v1/user/1")
+        client.put("api/v1/user/1", json={"username": "planuser3", "email": "plan3@gmail.com"})
+        client.get("api/v1/user/users")
+        client.get("api/v1/user/users", params={"stream": "ndjson"})
+        for filters in ({}, {"firstName": "jonh"}, {"lastName": "doe"}, {"firstName": "jonh", "lastName": "doe"}):
+            client.get("api/v1/user/", params={**filters, "page": 2, "per_page": 1})
+            for sort in ("id", "name"):
+                for order in ("asc", "desc"):
+                    params = {**filters, "sort": sort, "order": order, "limit": 1}
+                    page = client.get("api/v1/user/", params=params).json()
+                    if page.get("next"):
+                        page = client.get("api/v1/user/", params={**params, "after": page["next"]}).json()
+                    if page.get("prev"):
+                        client.get("api/v1/user/", params={**params, "before": page["prev"]})
+        client.post("api/v1/auth/logout", headers=headers)
+        client.delete("api/v1/user/2")
+
+    def test_no_table_scans(self):
+        self.run_routes()
+        conn = sqlite3.connect(self.path)
+        scans, checked = [], 0
+        for statement, parameters in self.statements:
+            upper = statement.upper()
+            if "WHERE" not in upper.split() or not upper.lstrip().startswith(("SELECT", "UPDATE", "DELETE")):
+                continue
+            checked += 1
+            plan = [row[3] for row in conn.execute("EXPLAIN QUERY PLAN " + statement, parameters)]
+            if any(step.startswith("SCAN") and "INDEX" not in step for step in plan):
+                scans.append((statement, plan))
+        conn.close()
+        assert checked > 20
+        assert scans == []
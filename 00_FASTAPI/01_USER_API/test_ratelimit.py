@@ -0,0 +1,153 @@
+import asyncio
+from fastapi import Body, FastAPI
+from fastapi.testclient import TestClient
+from app import app as users_app
+from ratelimit import (
+    AUTH_RULES,
+    Limit,
+    LocalRedis,
+    MemoryStorage,
+    RateLimiter,
+    RateLimitMiddleware,
+    RedisStorage,
+    Rule,
+)
+from utils import encode_jwt
+
+
+class Clock:
+    def __init__(self, now: float = 1000.0):
+        self.now = now
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def make_client(storage, clock, calls, **options):
+    app = FastAPI()
+    rules = {
+        "/login": [
+            Rule("ip", Limit(10, 60)),
+            Rule("account", Limit(3, 60), field="usernameOrEmail"),
+        ],
+        "/verify/*": [
+            Rule("verify-ip", Limit(10, 60), method="GET"),
+            Rule("verify-user", Limit(3, 60), user=True, method="GET"),
+        ],
+    }
+    app.add_middleware(
+        RateLimitMiddleware,
+        limiter=RateLimiter(storage, clock=clock),
+        rules=rules,
+        trust_forwarded=True,
+        **options,
+    )
+
+    @app.post("/login")
+    async def login(usernameOrEmail: str = Body(embed=True)):
+        calls.append(usernameOrEmail)
+        return {"jwt": "token", "error": None}
+
+    @app.get("/verify/{otp}")
+    async def verify(otp: str):
+        calls.append(otp)
+        return {"jwt": "token", "error": None}
+
+    return TestClient(app)
+
+
+def login(client, username: str, ip: str = "10.0.0.1"):
+    return client.post(
+        "/login", json={"usernameOrEmail": username}, headers={"X-Forwarded-For": ip}
+    )
+
+
+class TestRateLimit:
+    def test_rejected_requests_dont_reach_the_route(self):
+        calls, clock = [], Clock()
+        client = make_client(MemoryStorage(), clock, calls)
+        codes = [login(client, "Jonh").status_code for _ in range(5)]
+        assert codes == [200, 200, 200, 429, 429]
+        assert calls == ["Jonh"] * 3
+        res = login(client, " jonh ", ip="10.0.0.2")
+        assert res.status_code == 429
+        assert 0 < int(res.headers["retry-after"]) <= 60
+        # the body is passed on untouched
+        assert login(client, "peter").json() == {"jwt": "token", "error": None}
+
+    def test_ip_limit(self):
+        calls, clock = [], Clock()
+        client = make_client(MemoryStorage(), clock, calls)
+        codes = [login(client, f"user{i}").status_code for i in range(12)]
+        assert codes.count(200) == 10
+        assert login(client, "user0", ip="10.0.0.2").status_code == 200
+
+    def test_large_bodies_are_not_buffered(self):
+        calls, clock = [], Clock()
+        client = make_client(MemoryStorage(), clock, calls, max_body=64)
+        assert login(client, "jonh").status_code == 200
+        res = login(client, "j" * 100)
+        assert res.status_code == 413
+        assert res.json()["jwt"] is None
+        assert calls == ["jonh"]
+
+    def test_bulk_registration_is_limited_harder(self):
+        bulk = AUTH_RULES["/api/v1/auth/register/bulk"][0].limit
+        single = AUTH_RULES["/api/v1/auth/register"][0].limit
+        assert bulk.hits / bulk.window < single.hits / single.window / 10
+
+    def test_token_bucket(self):
+        calls, clock = [], Clock()
+        client = make_client(MemoryStorage(), clock, calls)
+        for _ in range(3):
+            login(client, "jonh")
+        # 3 per 60 s: a token comes back every 20 s
+        res = login(client, "jonh")
+        assert res.status_code == 429
+        assert res.headers["retry-after"] == "20"
+        clock.now += 20
+        assert login(client, "jonh").status_code == 200
+        assert login(client, "jonh").status_code == 429
+        clock.now += 60
+        assert [login(client, "jonh").status_code for _ in range(4)] == [200, 200, 200, 429]
+
+    def test_full_buckets_are_swept(self):
+        storage = MemoryStorage(sweep_interval=10)
+        # a bucket of one token is full again 200 s after it was used
+        limit = Limit(1, 200)
+        asyncio.run(storage.take("a", limit, 0))
+        asyncio.run(storage.take("b", limit, 100))
+        assert len(storage) == 2
+        asyncio.run(storage.take("c", limit, 250))
+        assert set(storage.buckets) == {"b", "c"}
+
+    def test_redis_storage(self):
+        calls, clock = [], Clock()
+        redis = LocalRedis()
+        client = make_client(RedisStorage(redis), clock, calls)
+        codes = [login(client, "jonh").status_code for _ in range(4)]
+        assert codes == [200, 200, 200, 429]
+        assert all(entry[1] is not None for entry in redis.data.values())
+        clock.now += 20
+        assert login(client, "jonh").status_code == 200
+
+    def test_verify_is_limited_per_ip_and_per_user(self):
+        calls, clock = [], Clock()
+        client = make_client(MemoryStorage(), clock, calls)
+
+        def verify(otp: str, user: int, ip: str = "10.0.0.1"):
+            headers = {"X-Forwarded-For": ip, "Authorization": f"Bearer {encode_jwt({'id': user})}"}
+            return client.get(f"/verify/{otp}", headers=headers).status_code
+
+        assert [verify(f"00000{i}", 1) for i in range(4)] == [200, 200, 200, 429]
+        # the same user from another address
+        assert verify("000004", 1, ip="10.0.0.2") == 429
+        # other users of the first address, until it has used its 10 (the
+        # attempt rejected for the user counted for the address too)
+        assert [verify("000005", user) for user in range(2, 9)] == [200] * 6 + [429]
+        assert calls == ["000000", "000001", "000002"] + ["000005"] * 6
+
+    def test_pool_metrics_are_not_public(self):
+        client = TestClient(users_app)
+        assert client.get("/api/v1/auth/ratelimit/metrics").status_code == 404
+        assert client.get("/metrics/ratelimit").json().keys() == {"allowed", "rejected"}
@@ -0,0 +1,33 @@
+import json
+from datetime import datetime
+from fastapi.testclient import TestClient
+import serializers
+from app import app
+from models import User
+from routers.user import collect_fields_from_rows, collect_fields_from_users, user_fields
+from serializers import FastJSONResponse, dumps
+
+client = TestClient(app)
+CREATED = datetime(2025, 2, 26, 16, 42, 35)
+
+
+class TestSerializers:
+    def test_objects_and_rows_render_the_same(self):
+        user = User(id=1, firstName="Jonh", lastName="Doe", password="x", email="a@gmail.com",
+                    username="jonh", createdAt=CREATED, updatedAt=CREATED)
+        row = tuple(getattr(user, name) for name in user_fields.fields)
+        fields = collect_fields_from_rows([row])[0]
+        assert dumps(collect_fields_from_users(user)) == dumps(fields)
+        assert "password" not in fields
+
+    def test_datetimes_keep_their_str_format(self, monkeypatch):
+        content = {"createdAt": CREATED, "name": "Jonh Doé"}
+        expected = {"createdAt": "2025-02-26 16:42:35", "name": "Jonh Doé"}
+        assert json.loads(FastJSONResponse(content).body) == expected
+        # without orjson
+        monkeypatch.setattr(serializers, "orjson", None)
+        assert json.loads(FastJSONResponse(content).body) == expected
+
+    def test_list_matches_single_user(self):
+        users = client.get("api/v1/user/users").json()
+        assert users[0] == client.get(f"api/v1/user/{users[0]['id']}").json()
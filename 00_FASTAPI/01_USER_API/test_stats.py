@@ -0,0 +1,86 @@
+from random import randint
+from fastapi.testclient import TestClient
+from sqlalchemy import event
+from app import app
+from db import read_engine
+from stats import user_stats
+
+client = TestClient(app)
+
+
+class TestStats:
+    def setup_method(self):
+        # other tests count users of their scratch databases
+        user_stats.totals = None
+        user_stats.filtered.clear()
+
+    def register(self, firstName: str = "Jonh", lastName: str = "Doe") -> int:
+        r = randint(0, 10000000)
+        res = client.post(
+            "api/v1/auth/register",
+            json={
+                "firstName": firstName,
+                "lastName": lastName,
+                "password": "Password@15",
+                "username": f"statsuser{r}",
+                "email": f"stats{r}@gmail.com",
+            },
+        )
+        return client.get(
+            "api/v1/user/me", headers={"Authorization": f"Bearer {res.json()['jwt']}"}
+        ).json()["me"]["id"]
+
+    def test_counts_are_kept_up_to_date_without_counting(self):
+        user_stats.clear()
+        total = client.get("/").json()["totalUsers"]
+        page = client.get("api/v1/user/", params={"lastName": "Stats", "limit": 1})
+        filtered = page.json()["total"]
+        statements = []
+
+        def record(conn, cursor, statement, parameters, context, executemany):
+            statements.append(statement)
+
+        event.listen(read_engine.sync_engine, "before_cursor_execute", record)
+        try:
+            id = self.register(lastName="Stats")
+            assert client.get("/").json()["totalUsers"] == total + 1
+            page = client.get("api/v1/user/", params={"lastName": "stats", "limit": 1})
+            assert page.json()["total"] == filtered + 1
+            client.delete(f"api/v1/user/{id}")
+            assert client.get("/").json()["totalUsers"] == total
+            page = client.get("api/v1/user/", params={"lastName": "stats", "page": 1, "per_page": 1})
+            assert page.json()["total"] == filtered
+        finally:
+            event.remove(read_engine.sync_engine, "before_cursor_execute", record)
+        assert not any("count(" in s.lower() for s in statements)
+
+    def test_clients_cant_force_a_count(self):
+        client.get("/")
+        statements = []
+
+        def record(conn, cursor, statement, parameters, context, executemany):
+            statements.append(statement)
+
+        event.listen(read_engine.sync_engine, "before_cursor_execute", record)
+        try:
+            client.get("/", params={"exact": True})
+        finally:
+            event.remove(read_engine.sync_engine, "before_cursor_execute", record)
+        assert not any("count(" in s.lower() for s in statements)
+
+    def test_filtered_counts_match_the_listing(self):
+        self.register(firstName="Peter", lastName="Stats")
+        for filters in ({"firstName": "peter"}, {"lastName": "stats"}, {"firstName": "peter", "lastName": "stats"}):
+            users = client.get("api/v1/user/", params=filters).json()
+            page = client.get("api/v1/user/", params={**filters, "limit": 1}).json()
+            assert page["total"] == len(users)
+            user_stats.clear()
+            exact = client.get("api/v1/user/", params={**filters, "limit": 1}).json()
+            assert exact["total"] == len(users)
+
+    def test_renaming_drops_the_filtered_counts(self):
+        id = self.register(firstName="Peter", lastName="Stats")
+        client.get("api/v1/user/", params={"lastName": "stats", "limit": 1})
+        assert len(user_stats.filtered) > 0
+        client.put(f"api/v1/user/{id}", json={"lastName": "Renamed"})
+        assert len(user_stats.filtered) == 0
@@ -0,0 +1,293 @@
+import asyncio
+import io
+import json
+import os
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from PIL import Image
+from fastapi.testclient import TestClient
+from sqlalchemy import event
+from sqlmodel import SQLModel
+from app import app
+from auth import token_cache, user_cache
+import avatars
+import utils
+from db import get_read_session, get_session, make_engine, new_session, read_engine
+
+client = TestClient(app)
+
+
+class TestUser:
+    def walk(self, **params):
+        ids, cursor = [], None
+        while True:
+            query = {**params, "limit": 2}
+            if cursor is not None:
+                query["after"] = cursor
+            res = client.get("api/v1/user/", params=query)
+            assert res.status_code == 200
+            data = res.json()
+            ids.extend(u["id"] for u in data["users"])
+            cursor = data["next"]
+            if cursor is None:
+                return ids
+
+    def test_cursor_pagination(self):
+        res = client.get("api/v1/user/users")
+        all_ids = sorted(u["id"] for u in res.json())
+        assert self.walk(order="asc") == all_ids
+        assert self.walk(order="desc") == all_ids[::-1]
+        assert sorted(self.walk(sort="name")) == all_ids
+
+    def test_cursor_pagination_prev(self):
+        first = client.get("api/v1/user/", params={"limit": 1}).json()
+        assert first["prev"] is None
+        second = client.get(
+            "api/v1/user/", params={"limit": 1, "after": first["next"]}
+        ).json()
+        back = client.get(
+            "api/v1/user/", params={"limit": 1, "before": second["prev"]}
+        ).json()
+        assert back["users"] == first["users"]
+
+    def test_invalid_cursor(self):
+        res = client.get("api/v1/user/", params={"after": "not-a-cursor"})
+        assert res.status_code == 400
+        first = client.get("api/v1/user/", params={"limit": 1}).json()
+        res = client.get(
+            "api/v1/user/", params={"after": first["next"], "order": "desc"}
+        )
+        assert res.status_code == 400
+
+    def test_offset_pagination(self):
+        res = client.get("api/v1/user/", params={"page": 1, "per_page": 2})
+        assert res.status_code == 200
+        data = res.json()
+        assert data["offset"] == 0
+        assert len(data["users"]) <= 2
+
+    def test_stream_users(self):
+        expected = client.get("api/v1/user/users").json()
+        res = client.get("api/v1/user/users", params={"stream": "json"})
+        assert res.status_code == 200
+        assert res.json() == expected
+        res = client.get("api/v1/user/users", params={"stream": "ndjson"})
+        assert res.status_code == 200
+        assert res.headers["content-type"] == "application/x-ndjson"
+        lines = [json.loads(line) for line in res.text.splitlines()]
+        assert lines == expected
+
+    def test_reads_select_only_returned_columns(self):
+        statements = []
+
+        def record(conn, cursor, statement, parameters, context, executemany):
+            statements.append(statement)
+
+        event.listen(read_engine.sync_engine, "before_cursor_execute", record)
+        try:
+            jwt = self.login()
+            client.get("api/v1/user/me", headers={"Authorization": f"Bearer {jwt}"})
+            client.get("api/v1/user/1")
+            client.get("api/v1/user/users")
+            client.get("api/v1/user/", params={"limit": 2, "sort": "name"})
+            client.get("api/v1/user/", params={"page": 1, "per_page": 2})
+        finally:
+            event.remove(read_engine.sync_engine, "before_cursor_execute", record)
+        assert len(statements) == 5
+        assert not any("password" in s or "verificationToken" in s for s in statements)
+
+    def login(self):
+        res = client.post(
+            "api/v1/auth/login",
+            json={
+                "usernameOrEmail": "crispengari@gmail.com",
+                "password": "Password@15",
+            },
+        )
+        return res.json()["jwt"]
+
+    def test_me(self):
+        jwt = self.login()
+        res = client.get("api/v1/user/me", headers={"Authorization": f"Bearer {jwt}"})
+        assert res.status_code == 200
+        assert res.json()["me"]["email"] == "crispengari@gmail.com"
+
+    def test_me_unauthorized(self):
+        assert client.get("api/v1/user/me").status_code == 401
+        res = client.get("api/v1/user/me", headers={"Authorization": "Bearer nope"})
+        assert res.status_code == 401
+        assert res.json() == {"me": None}
+
+    def test_me_verifies_token_once(self, monkeypatch):
+        jwt = self.login()
+        token_cache.clear()
+        calls = []
+        decode = utils.decode_jwt
+        monkeypatch.setattr(
+            utils, "decode_jwt", lambda token: calls.append(token) or decode(token)
+        )
+        for _ in range(3):
+            res = client.get(
+                "api/v1/user/me", headers={"Authorization": f"Bearer {jwt}"}
+            )
+            assert res.status_code == 200
+        assert calls == [jwt]
+
+    def test_user_cache_is_invalidated_on_update(self, monkeypatch):
+        monkeypatch.setattr(user_cache, "ttl", 60)
+        jwt = self.login()
+        headers = {"Authorization": f"Bearer {jwt}"}
+        me = client.get("api/v1/user/me", headers=headers).json()["me"]
+        res = client.put(f"api/v1/user/{me['id']}", json={"firstName": "Peter"})
+        assert res.status_code == 200
+        assert client.get("api/v1/user/me", headers=headers).json()["me"]["firstName"] == "Peter"
+        client.put(f"api/v1/user/{me['id']}", json={"firstName": me["firstName"]})
+        user_cache.clear()
+
+
+class TestAvatar:
+    """
+    The avatar routes write the `avatar` of the signed in user, so they run
+    against a scratch database rather than users.db.
+    """
+
+    @classmethod
+    def setup_class(cls):
+        fd, cls.path = tempfile.mkstemp(suffix=".db")
+        os.close(fd)
+        cls.engine = make_engine(f"sqlite:///{cls.path}")
+
+        async def setup():
+            async with cls.engine.begin() as conn:
+                await conn.run_sync(SQLModel.metadata.create_all)
+
+        asyncio.run(setup())
+
+        async def get_test_session():
+            async with new_session(cls.engine) as session:
+                yield session
+
+        app.dependency_overrides[get_session] = get_test_session
+        app.dependency_overrides[get_read_session] = get_test_session
+        res = client.post(
+            "api/v1/auth/register",
+            json={
+                "firstName": "jonh",
+                "lastName": "doe",
+                "password": "Password@15",
+                "username": "avataruser",
+                "email": "avatar@gmail.com",
+            },
+        )
+        cls.jwt = res.json()["jwt"]
+
+    @classmethod
+    def teardown_class(cls):
+        app.dependency_overrides.clear()
+        user_cache.clear()
+        asyncio.run(cls.engine.dispose())
+        for suffix in ("", "-wal", "-shm"):
+            if os.path.exists(cls.path + suffix):
+                os.remove(cls.path + suffix)
+
+    def picture(self, color="red") -> bytes:
+        buffer = io.BytesIO()
+        Image.new("RGB", (600, 400), color).save(buffer, format="PNG")
+        return buffer.getvalue()
+
+    def test_update_avatar(self, monkeypatch, tmp_path):
+        monkeypatch.setattr(avatars, "AVATAR_DIRECTORY", str(tmp_path))
+        headers = {"Authorization": f"Bearer {self.jwt}"}
+        res = client.patch(
+            "api/v1/user/update-profile",
+            headers=headers,
+            files={"avatar": ("me.png", self.picture(), "image/png")},
+        )
+        assert res.status_code == 200
+        data = res.json()
+        assert data["success"]
+        assert set(data["variants"]) == {"64.webp", "64.jpeg", "256.webp", "256.jpeg"}
+        # the variants were written by the background task
+        assert len(list(tmp_path.glob("*-64.*"))) == 2
+        with Image.open(next(tmp_path.glob("*-256.webp"))) as variant:
+            assert max(variant.size) == 256
+        me = client.get("api/v1/user/me", headers=headers).json()["me"]
+        assert me["avatar"] == data["variants"]["256.webp"]
+
+    def test_update_avatar_is_stored_once(self, monkeypatch, tmp_path):
+        monkeypatch.setattr(avatars, "AVATAR_DIRECTORY", str(tmp_path))
+        headers = {"Authorization": f"Bearer {self.jwt}"}
+        picture = self.picture("blue")
+        variants = []
+        for name in ("a.png", "b.png"):
+            res = client.patch(
+                "api/v1/user/update-profile",
+                headers=headers,
+                files={"avatar": (name, picture, "image/png")},
+            )
+            assert res.status_code == 200
+            variants.append(res.json()["variants"])
+        assert variants[0] == variants[1]
+        assert len(list(tmp_path.glob("*.png"))) == 1
+        assert not list(tmp_path.glob("*.part"))
+
+    def test_update_avatar_too_large(self, monkeypatch, tmp_path):
+        monkeypatch.setattr(avatars, "AVATAR_DIRECTORY", str(tmp_path))
+        headers = {"Authorization": f"Bearer {self.jwt}"}
+        res = client.patch(
+            "api/v1/user/update-profile",
+            headers=headers,
+            files={"avatar": ("big.png", b"0" * (avatars.AVATAR_MAX_BYTES + 1), "image/png")},
+        )
+        assert res.status_code == 413
+        assert not res.json()["success"]
+        assert not list(tmp_path.iterdir())
+
+    def test_update_avatar_must_be_a_picture(self, monkeypatch, tmp_path):
+        monkeypatch.setattr(avatars, "AVATAR_DIRECTORY", str(tmp_path))
+        headers = {"Authorization": f"Bearer {self.jwt}"}
+        for name, content in (("me.html", b"<script>alert(1)</script>"), ("me.png", b"<svg/>")):
+            res = client.patch(
+                "api/v1/user/update-profile",
+                headers=headers,
+                files={"avatar": (name, content, "image/png")},
+            )
+            assert res.status_code == 400
+            assert res.json()["error"] == "The avatar must be a PNG, JPEG, WEBP or GIF picture."
+        assert not list(tmp_path.iterdir())
+        # named after the format of the content, not the filename
+        res = client.patch(
+            "api/v1/user/update-profile",
+            headers=headers,
+            files={"avatar": ("me.html", self.picture("green"), "text/html")},
+        )
+        assert res.json()["url"].endswith(".png")
+        assert avatars.extension("me.JPG") == "jpeg" and avatars.extension("me.svg") is None
+
+    def test_update_avatar_headers_are_capped(self, monkeypatch, tmp_path):
+        monkeypatch.setattr(avatars, "AVATAR_DIRECTORY", str(tmp_path))
+        body = (
+            b"--b\r\nContent-Disposition: form-data; name=\"avatar\"; filename=\"me.png\"\r\n"
+            + b"X-Padding: " + b"a" * (avatars.MAX_HEADER_VALUE + 1) + b"\r\n\r\n"
+            + self.picture() + b"\r\n--b--\r\n"
+        )
+        res = client.patch(
+            "api/v1/user/update-profile",
+            headers={
+                "Authorization": f"Bearer {self.jwt}",
+                "Content-Type": "multipart/form-data; boundary=b",
+            },
+            content=body,
+        )
+        assert res.status_code == 400
+        assert res.json()["error"] == "The headers of a part are too large."
+        assert not list(tmp_path.iterdir())
+
+    def test_variants_are_written_to_their_own_temporary_files(self, monkeypatch, tmp_path):
+        monkeypatch.setattr(avatars, "AVATAR_DIRECTORY", str(tmp_path))
+        (tmp_path / "a.png").write_bytes(self.picture())
+        avatar = avatars.Avatar("a", "png", 0)
+        with ThreadPoolExecutor(4) as pool:
+            assert all(pool.map(lambda _: avatars.make_variants(avatar), range(4)))
+        assert len(list(tmp_path.glob("a-*"))) == 4
+        assert not list(tmp_path.glob("*.part"))
@@ -0,0 +1,54 @@
+import time
+from utils import (
+    EMAIL_REGEX,
+    NAME_REGEX,
+    PASSWORD_REGEX,
+    USERNAME_REGEX,
+    validate_many,
+    validate_user,
+)
+
+VALID_USER = {
+    "firstName": "Jonh",
+    "lastName": "Doe",
+    "password": "Password@15",
+    "username": "username35",
+    "email": "hello35@gmail.com",
+}
+
+
+class TestUtils:
+    def test_validate_user(self):
+        assert validate_user(VALID_USER) == {}
+        errors = validate_user({**VALID_USER, "username": "a_", "password": "password"})
+        assert errors == {
+            "username": "The username is invalid.",
+            "password": "The password must contain at least one letter, one number and one special character.",
+        }
+
+    def test_validate_user_partial(self):
+        assert validate_user({"email": "hello@gmail.com"}, partial=True) == {}
+        assert list(validate_user({"email": "hello"}, partial=True)) == ["email"]
+        assert len(validate_user({})) == 5
+
+    def test_validate_many(self):
+        errors = validate_many([VALID_USER, {**VALID_USER, "email": "nope"}])
+        assert errors == [{}, {"email": "The email address is invalid."}]
+
+    def test_patterns_do_not_backtrack(self):
+        # inputs built to make a backtracking regex explode, each of them must
+        # still be rejected in linear time
+        n = 100_000
+        adversarial = [
+            (EMAIL_REGEX, "a" * n + "@" + "a" * n),
+            (EMAIL_REGEX, "a@" + "a-" * n),
+            (USERNAME_REGEX, "a" * n + "!"),
+            (USERNAME_REGEX, "a." * n),
+            (PASSWORD_REGEX, "a1" * n + " "),
+            (PASSWORD_REGEX, "@" * n + "a"),
+            (NAME_REGEX, "a" * n + "0"),
+        ]
+        for regex, text in adversarial:
+            start = time.perf_counter()
+            assert regex.match(text) is None
+            assert time.perf_counter() - start < 0.5, regex.pattern
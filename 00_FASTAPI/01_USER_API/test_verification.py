@@ -0,0 +1,117 @@
+import asyncio
+import os
+import tempfile
+from random import randint
+from fastapi.testclient import TestClient
+from sqlalchemy import text
+from sqlmodel import SQLModel
+from app import app
+from db import make_engine, new_session
+from verification import TokenStore
+
+client = TestClient(app)
+
+
+class TestVerification:
+    @classmethod
+    def setup_class(cls):
+        fd, cls.path = tempfile.mkstemp(suffix=".db")
+        os.close(fd)
+        cls.engine = make_engine(f"sqlite:///{cls.path}")
+
+        async def setup():
+            async with cls.engine.begin() as conn:
+                await conn.run_sync(SQLModel.metadata.create_all)
+                # the tokens reference their user
+                await conn.execute(
+                    text(
+                        'INSERT INTO user (id, "firstName", "lastName", password, email, username,'
+                        ' verified, "loggedIn", "verificationToken")'
+                        " VALUES (:id, 'Jonh', 'Doe', 'x', 'user' || :id, 'user' || :id, 0, 0, '000000')"
+                    ),
+                    [{"id": id} for id in [1, 2, 30, *range(10, 20)]],
+                )
+
+        asyncio.run(setup())
+
+    @classmethod
+    def teardown_class(cls):
+        asyncio.run(cls.engine.dispose())
+        for suffix in ("", "-wal", "-shm"):
+            if os.path.exists(cls.path + suffix):
+                os.remove(cls.path + suffix)
+
+    def test_tokens_are_used_once(self):
+        store = TokenStore(self.engine)
+
+        async def run():
+            async with new_session(self.engine) as session:
+                token = await store.issue(session, 1)
+                await session.commit()
+                assert not await store.consume(session, 1, "000000")
+                assert not await store.consume(session, 2, token)
+                assert await store.consume(session, 1, token)
+                await session.commit()
+                assert not await store.consume(session, 1, token)
+
+        asyncio.run(run())
+
+    def test_expired_tokens_are_purged(self):
+        store = TokenStore(self.engine, ttl=-1)
+
+        async def run():
+            async with new_session(self.engine) as session:
+                tokens = await store.issue_many(session, list(range(10, 20)))
+                await session.commit()
+                assert not await store.consume(session, 10, tokens[10])
+            # a fresh one is kept
+            async with new_session(self.engine) as session:
+                await TokenStore(self.engine).issue(session, 30)
+                await session.commit()
+            assert await store.purge() == 10
+            async with self.engine.connect() as conn:
+                rows = await conn.execute(text('SELECT "userId" FROM verification_token'))
+                return [id for id, in rows]
+
+        assert 30 in asyncio.run(run())
+
+    def test_tokens_are_deleted_with_their_user(self):
+        async def run():
+            async with new_session(self.engine) as session:
+                await TokenStore(self.engine).issue(session, 2)
+                await session.commit()
+            async with self.engine.begin() as conn:
+                await conn.execute(text("DELETE FROM user WHERE id = 2"))
+                rows = await conn.execute(text('SELECT count(*) FROM verification_token WHERE "userId" = 2'))
+                return rows.scalar()
+
+        assert asyncio.run(run()) == 0
+
+    def test_verify_and_resend(self, monkeypatch):
+        sent = []
+        monkeypatch.setattr(
+            "routers.authRouter.send_verification_email", lambda user: sent.append(user)
+        )
+        r = randint(0, 10000000)
+        res = client.post(
+            "api/v1/auth/register",
+            json={
+                "firstName": "Jonh",
+                "lastName": "Doe",
+                "password": "Password@15",
+                "username": f"verifyuser{r}",
+                "email": f"verify{r}@gmail.com",
+            },
+        )
+        headers = {"Authorization": f"Bearer {res.json()['jwt']}"}
+        first = sent[-1]["verificationToken"]
+        assert client.post("api/v1/auth/verify/resend", headers=headers).json() == {"error": None}
+        second = sent[-1]["verificationToken"]
+        if first != second:
+            res = client.get(f"api/v1/auth/verify/{first}", headers=headers)
+            assert res.status_code == 401
+        res = client.get(f"api/v1/auth/verify/{second}", headers=headers)
+        assert res.json()["jwt"] is not None
+        assert client.get("api/v1/user/me", headers=headers).json()["me"]["verified"] is True
+        res = client.post("api/v1/auth/verify/resend", headers=headers)
+        assert res.json() == {"error": "The email is already verified."}
@@ -0,0 +1,184 @@
+import asyncio
+import os
+import tempfile
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import event, text
+from sqlalchemy.exc import IntegrityError
+from sqlmodel import SQLModel
+from app import app
+import bulk
+from auth import user_cache
+from db import get_read_session, get_session, make_engine, new_session
+from presence import presence
+from verification import tokens
+from utils import decode_jwt
+from writes import conflict_message
+
+client = TestClient(app)
+
+
+class TestWrites:
+    """
+    Counts the statements each write endpoint sends: one per table written,
+    the written row comes back with RETURNING so there is no SELECT after the
+    write. Routes behind `CurrentUser` are called with the user cached, so
+    that the user isn't loaded first.
+    """
+
+    @classmethod
+    def setup_class(cls):
+        fd, cls.path = tempfile.mkstemp(suffix=".db")
+        os.close(fd)
+        cls.engine = make_engine(f"sqlite:///{cls.path}")
+
+        async def setup():
+            async with cls.engine.begin() as conn:
+                await conn.run_sync(SQLModel.metadata.create_all)
+
+        asyncio.run(setup())
+        cls.statements = []
+
+        @event.listens_for(cls.engine.sync_engine, "before_cursor_execute")
+        def record(conn, cursor, statement, parameters, context, executemany):
+            cls.statements.append(statement)
+
+        async def get_test_session():
+            async with new_session(cls.engine) as session:
+                yield session
+
+        app.dependency_overrides[get_session] = get_test_session
+        app.dependency_overrides[get_read_session] = get_test_session
+
+    @classmethod
+    def teardown_class(cls):
+        app.dependency_overrides.clear()
+        asyncio.run(cls.engine.dispose())
+        for suffix in ("", "-wal", "-shm"):
+            if os.path.exists(cls.path + suffix):
+                os.remove(cls.path + suffix)
+
+    def count(self, request) -> tuple[list[str], dict]:
+        self.statements.clear()
+        data = request().json()
+        return list(self.statements), data
+
+    def register(self, username: str, email: str):
+        return client.post(
+            "api/v1/auth/register",
+            json={
+                "firstName": "jonh",
+                "lastName": "doe",
+                "password": "Password@15",
+                "username": username,
+                "email": email,
+            },
+        )
+
+    def test_one_statement_per_write(self, monkeypatch):
+        monkeypatch.setattr(user_cache, "ttl", 60)
+        presence.pending.clear()
+
+        statements, data = self.count(lambda: self.register("writesuser1", "writes1@gmail.com"))
+        assert data["error"] is None
+        # the user, then its verification token
+        assert [s.split()[0] for s in statements] == ["INSERT", "INSERT"]
+        assert "RETURNING" in statements[0] and "verification_token" in statements[1]
+        headers = {"Authorization": f"Bearer {data['jwt']}"}
+
+        statements, data = self.count(lambda: client.put("api/v1/user/1", json={"firstName": "peter"}))
+        assert data["firstName"] == "Peter" and data["createdAt"] != "None"
+        assert len(statements) == 1
+        assert statements[0].startswith("UPDATE") and "RETURNING" in statements[0]
+
+        # loads the user into the cache
+        me = client.get("api/v1/user/me", headers=headers).json()["me"]
+        assert self.count(lambda: client.get("api/v1/user/me", headers=headers))[0] == []
+        otp = asyncio.run(self.verification_token(me["id"]))
+        statements, data = self.count(lambda: client.get(f"api/v1/auth/verify/{otp}", headers=headers))
+        assert data["jwt"] is not None
+        # the token is read, compared and deleted, then the user is updated
+        assert [s.split()[0] for s in statements] == ["SELECT", "DELETE", "UPDATE"]
+
+        statements, data = self.count(
+            lambda: client.post(
+                "api/v1/auth/login",
+                json={"usernameOrEmail": "writesuser1", "password": "Password@15"},
+            )
+        )
+        # the login state is written behind, see presence
+        assert data["jwt"] is not None
+        assert [s.split()[0] for s in statements] == ["SELECT"]
+
+        statements, data = self.count(lambda: client.delete("api/v1/user/1"))
+        assert len(statements) == 1
+        assert statements[0].startswith("DELETE") and "RETURNING" in statements[0]
+        presence.pending.clear()
+
+    def test_conflicts_come_from_the_unique_indexes(self):
+        self.register("writesuser2", "writes2@gmail.com")
+        res = self.register("writesuser2", "writes3@gmail.com")
+        assert res.json() == {"error": "The username is already in use.", "jwt": None}
+        res = self.register("writesuser3", "writes2@gmail.com")
+        assert res.json() == {"error": "The email is already in use.", "jwt": None}
+        id = decode_jwt(self.register("writesuser3", "writes3@gmail.com").json()["jwt"])["id"]
+        res = client.put(f"api/v1/user/{id}", json={"email": "writes2@gmail.com"})
+        assert res.json()["error"] == "The email is already in use."
+        res = client.put("api/v1/user/1000", json={"firstName": "peter"})
+        assert res.json()["error"] == "The user with id '1000' does not exists"
+
+    def test_conflicts_without_a_field(self):
+        error = IntegrityError("INSERT", {}, Exception("FOREIGN KEY constraint failed"))
+        assert conflict_message(error) == "The user conflicts with existing data."
+
+    def bulk_users(self, *names: str) -> list[dict]:
+        return [
+            {"firstName": "jonh", "lastName": "doe", "password": "Password@15",
+             "username": name, "email": f"{name}@gmail.com"}
+            for name in names
+        ]
+
+    async def register_many(self, records: list[dict]) -> dict:
+        async with new_session(self.engine) as session:
+            return await bulk.register_many(session, records)
+
+    def test_bulk_users_and_tokens_are_one_transaction(self, monkeypatch):
+        async def fail(session, user_ids):
+            raise RuntimeError("tokens")
+
+        monkeypatch.setattr(tokens, "issue_many", fail)
+        with pytest.raises(RuntimeError):
+            asyncio.run(self.register_many(self.bulk_users("bulkwrites1")))
+        monkeypatch.undo()
+        # the users were rolled back with their tokens
+        assert self.register("bulkwrites1", "bulkwrites1@gmail.com").json()["error"] is None
+
+    def test_bulk_rows_taken_since_the_check_are_skipped(self, monkeypatch):
+        self.register("bulkwrites2", "bulkwrites2@gmail.com")
+
+        async def nothing_taken(session, rows):
+            return set(), set()
+
+        monkeypatch.setattr(bulk, "taken", nothing_taken)
+        report = asyncio.run(self.register_many(self.bulk_users("bulkwrites2", "bulkwrites3")))
+        assert [row["error"] for row in report["results"]] == [
+            "The username or email is already in use.",
+            None,
+        ]
+        otp = asyncio.run(self.verification_token(report["results"][1]["id"]))
+        assert len(otp) == 6
+
+    def test_bulk_chunks_fit_the_parameter_limit(self, monkeypatch):
+        async def size():
+            async with new_session(self.engine) as session:
+                return bulk.max_chunk_size(session)
+
+        monkeypatch.setattr(self.engine.sync_engine.dialect, "insertmanyvalues_max_parameters", 999)
+        assert asyncio.run(size()) * bulk.PARAMETERS_PER_USER <= 999
+
+    async def verification_token(self, id: int) -> str:
+        async with self.engine.connect() as conn:
+            rows = await conn.execute(
+                text('SELECT token FROM verification_token WHERE "userId" = :id'), {"id": id}
+            )
+            return rows.scalar_one()
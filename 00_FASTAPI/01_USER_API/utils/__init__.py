@@ -1,13 +1,13 @@
 import jwt
 import re
-from random import randint
+import secrets
 
 
 SECRETE = '696650d131f129a8fa46b72a8eaa491c0b0dccd5f14cb026dcc48e884578cafc1ac3b92aa856f88a33de20dc0916808c0f97a194b8376f1e9a8c3223'
 
 
 def generate_otp()->str:
-    return str(randint(100000, 999999))
+    return str(100000 + secrets.randbelow(900000))
 
 def decode_jwt(token: str) -> dict | None:
     p = jwt.decode(token, SECRETE, algorithms=["HS256"])
@@ -17,21 +17,65 @@ def encode_jwt(payload: dict)->str:
     t = jwt.encode(payload, SECRETE, algorithm="HS256")
     return t
 
+# the patterns are compiled once, none of them nests quantifiers so a match is
+# linear in the length of the input, inputs longer than MAX_LENGTHS are
+# rejected before reaching the regex at all.
+EMAIL_REGEX = re.compile(r'^[a-zA-Z0-9_.+-]+@[a-zA-Z0-9-]+\.[a-zA-Z0-9-.]+$')
+USERNAME_REGEX = re.compile(r'^(?=[a-zA-Z0-9._]{8,20}$)(?!.*[_.]{2})[^_.].*[^_.]$')
+# Minimum eight characters, at least one letter, one number and one special character:
+PASSWORD_REGEX = re.compile(r'^(?=.*[A-Za-z])(?=.*\d)(?=.*[@$!%*#?&])[A-Za-z\d@$!%*#?&]{8,}$')
+NAME_REGEX = re.compile(r"^[\w'\-,.][^0-9_!¡?÷?¿/\+=@#$%ˆ&*(){}|~<>;:[\]]{2,}$")
+
+MAX_LENGTHS = {"email": 254, "username": 20, "password": 128, "name": 15}
+
 # username1@gmail.cm
 def validate_email(email: str) -> bool:
-    regex = re.compile('^[a-zA-Z0-9_.+-]+@[a-zA-Z0-9-]+\.[a-zA-Z0-9-.]+$')
-    return regex.match(email) is not None
+    return len(email) <= MAX_LENGTHS["email"] and EMAIL_REGEX.match(email) is not None
 
 
 def validate_username(username: str) -> bool:
-    regex = re.compile('^(?=[a-zA-Z0-9._]{8,20}$)(?!.*[_.]{2})[^_.].*[^_.]$')
-    return regex.match(username) is not None
+    return len(username) <= MAX_LENGTHS["username"] and USERNAME_REGEX.match(username) is not None
 
 def validate_password(password: str) -> bool:
-    # Minimum eight characters, at least one letter, one number and one special character:
-    regex = re.compile('^(?=.*[A-Za-z])(?=.*\d)(?=.*[@$!%*#?&])[A-Za-z\d@$!%*#?&]{8,}$')
-    return regex.match(password) is not None
+    return len(password) <= MAX_LENGTHS["password"] and PASSWORD_REGEX.match(password) is not None
 
 def validate_name(name: str) -> bool:
-    regex = re.compile("^[\w'\-,.][^0-9_!¡?÷?¿/\\+=@#$%ˆ&*(){}|~<>;:[\]]{2,}$")
-    return regex.match(name) is not None
+    return len(name) <= MAX_LENGTHS["name"] and NAME_REGEX.match(name) is not None
+
+
+# field -> (validator, how the value is normalized before validating it, error)
+USER_FIELDS = {
+    "username": (validate_username, lambda v: v.strip().lower(), "The username is invalid."),
+    "email": (validate_email, lambda v: v.strip().lower(), "The email address is invalid."),
+    "firstName": (validate_name, lambda v: v.strip(), "The first name is invalid."),
+    "lastName": (validate_name, lambda v: v.strip(), "The last name is invalid."),
+    "password": (
+        validate_password,
+        lambda v: v.strip(),
+        "The password must contain at least one letter, one number and one special character.",
+    ),
+}
+
+
+def validate_user(user, partial: bool = False) -> dict[str, str]:
+    """
+    Validates every field of a user payload (a dict or an object such as
+    `models.User`) in one pass and returns all the errors, keyed by field. With
+    `partial=True` missing (None) fields are skipped, as in an update.
+    """
+    errors = {}
+    get = user.get if isinstance(user, dict) else lambda f: getattr(user, f, None)
+    for field, (validate, normalize, error) in USER_FIELDS.items():
+        value = get(field)
+        if value is None:
+            if not partial:
+                errors[field] = error
+            continue
+        if not isinstance(value, str) or not validate(normalize(value)):
+            errors[field] = error
+    return errors
+
+
+def validate_many(records) -> list[dict[str, str]]:
+    """Validates many user payloads, e.g. for a bulk import, one error dict per record."""
+    return [validate_user(record) for record in records]
@@ -0,0 +1,131 @@
+"""
+Email verification tokens. They live in their own `verification_token` table
+rather than in columns of `user`: one row per pending verification, keyed by
+the user id, with an expiry indexed so that the expired tokens are purged in
+bulk. Verified users have no row at all, and sending a new token only writes
+this table.
+
+Tokens are compared in constant time (`hmac.compare_digest`) and a used
+token is deleted.
+
+Configuration (environment variables):
+    - VERIFICATION_TTL: seconds a token is valid for, defaults to 86400.
+    - VERIFICATION_PURGE_SECONDS: interval between two purges of the expired
+      tokens, defaults to 3600.
+"""
+
+import asyncio
+import hmac
+import os
+import time
+from sqlalchemy import delete
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
+from db import engine
+from models import VerificationToken
+from utils import generate_otp
+
+VERIFICATION_TTL = int(os.environ.get("VERIFICATION_TTL", 24 * 60 * 60))
+VERIFICATION_PURGE_SECONDS = float(os.environ.get("VERIFICATION_PURGE_SECONDS", 60 * 60))
+PURGE_CHUNK_SIZE = 5000
+
+
+def upsert(session: AsyncSession, rows: list[dict]):
+    # a user id can be reused by SQLite once its user was deleted
+    dialect = postgresql if session.bind.dialect.name == "postgresql" else sqlite
+    statement = dialect.insert(VerificationToken).values(rows)
+    return statement.on_conflict_do_update(
+        index_elements=["userId"],
+        set_={"token": statement.excluded.token, "expiresAt": statement.excluded.expiresAt},
+    )
+
+
+class TokenStore:
+    def __init__(self, engine, ttl: int = VERIFICATION_TTL, interval: float = VERIFICATION_PURGE_SECONDS):
+        self.engine = engine
+        self.ttl = ttl
+        self.interval = interval
+        self.task: asyncio.Task | None = None
+        self.purged = 0
+
+    async def issue(self, session: AsyncSession, user_id: int) -> str:
+        """Creates (or replaces) the token of a user, the caller commits."""
+        return (await self.issue_many(session, [user_id]))[user_id]
+
+    async def issue_many(self, session: AsyncSession, user_ids: list[int]) -> dict[int, str]:
+        expires_at = int(time.time()) + self.ttl
+        tokens = {id: generate_otp() for id in user_ids}
+        if tokens:
+            rows = [
+                {"userId": id, "token": token, "expiresAt": expires_at}
+                for id, token in tokens.items()
+            ]
+            await session.exec(upsert(session, rows))
+        return tokens
+
+    async def consume(self, session: AsyncSession, user_id: int, token: str) -> bool:
+        """
+        Deletes the token of the user if `token` matches it and it hasn't
+        expired, the caller commits.
+        """
+        stored = (
+            await session.exec(
+                select(VerificationToken.token).where(
+                    VerificationToken.userId == user_id,
+                    VerificationToken.expiresAt > int(time.time()),
+                )
+            )
+        ).first()
+        if stored is None or not hmac.compare_digest(stored.encode(), token.encode()):
+            return False
+        await session.exec(
+            delete(VerificationToken).where(VerificationToken.userId == user_id)
+        )
+        return True
+
+    async def purge(self, now: float | None = None) -> int:
+        """Deletes the expired tokens, a chunk per transaction."""
+        now = int(time.time() if now is None else now)
+        expired = (
+            select(VerificationToken.userId)
+            .where(VerificationToken.expiresAt <= now)
+            .limit(PURGE_CHUNK_SIZE)
+        )
+        purged = 0
+        while True:
+            async with self.engine.begin() as conn:
+                result = await conn.execute(
+                    delete(VerificationToken).where(
+                        VerificationToken.userId.in_(expired.scalar_subquery())
+                    )
+                )
+            purged += result.rowcount
+            if result.rowcount < PURGE_CHUNK_SIZE:
+                break
+        self.purged += purged
+        return purged
+
+    async def run(self):
+        while True:
+            try:
+                await self.purge()
+            except Exception:
+                pass
+            await asyncio.sleep(self.interval)
+
+    def start(self):
+        if self.task is None:
+            self.task = asyncio.get_running_loop().create_task(self.run())
+
+    async def stop(self):
+        if self.task is not None:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+            self.task = None
+
+
+tokens = TokenStore(engine)
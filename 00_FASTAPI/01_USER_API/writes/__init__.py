@@ -0,0 +1,59 @@
+"""
+Writes to the `user` table that return the written row in the same statement
+(`INSERT/UPDATE/DELETE ... RETURNING`, SQLite 3.35+ and Postgres) instead of
+reading it back with `session.refresh`. The row comes back with its id and
+server generated timestamps, and the object in the session is updated.
+
+Unique usernames and emails are left to the unique indexes: a write that
+breaks one raises IntegrityError, `conflicting_field` tells which.
+"""
+
+from sqlalchemy import delete, func, insert, update
+from sqlalchemy.exc import IntegrityError
+from sqlmodel.ext.asyncio.session import AsyncSession
+from models import User
+
+
+async def insert_user(session: AsyncSession, values: dict) -> User:
+    result = await session.exec(insert(User).values(**values).returning(User))
+    return result.scalar_one()
+
+
+async def update_user_by_id(
+    session: AsyncSession, id: int, values: dict, *where
+) -> User | None:
+    """
+    Updates the user and returns it, None when there is no such user (or it
+    doesn't match the extra `where` conditions).
+    """
+    statement = (
+        update(User)
+        .where(User.id == id, *where)
+        .values(**values, updatedAt=func.current_timestamp())
+        .returning(User)
+        .execution_options(populate_existing=True)
+    )
+    return (await session.exec(statement)).scalar_one_or_none()
+
+
+async def delete_user_by_id(session: AsyncSession, id: int) -> User | None:
+    """Deletes the user and returns it, None when there is no such user."""
+    result = await session.exec(delete(User).where(User.id == id).returning(User))
+    return result.scalar_one_or_none()
+
+
+def conflicting_field(error: IntegrityError) -> str | None:
+    """"username" or "email" when `error` broke their unique index."""
+    message = str(error.orig).lower()
+    for field in ("username", "email"):
+        if field in message:
+            return field
+    return None
+
+
+def conflict_message(error: IntegrityError) -> str:
+    """The error shown for `error`, e.g. a foreign key it broke names no field."""
+    field = conflicting_field(error)
+    if field is None:
+        return "The user conflicts with existing data."
+    return f"The {field} is already in use."
@@ -4,3 +4,8 @@ from django.apps import AppConfig
 class ApiConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'api'
+
+    def ready(self):
+        # connects the receivers bumping the table versions and invalidating
+        # the cached responses
+        from api import cache, versions  # noqa: F401
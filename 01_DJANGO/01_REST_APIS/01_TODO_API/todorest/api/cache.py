@@ -0,0 +1,145 @@
+"""
+Cache of the rendered responses of `todos/all` and `todo/one/<id>`, in the
+default cache of Django (locmem, or Redis when `REDIS_URL` is set). A
+response is stored as its bytes, under the shape of its query: the path
+parameters, the pagination and filter parameters and the media type.
+
+Entries aren't deleted on writes, their keys embed a generation instead:
+one for the lists, one per todo. The `post_save` and `post_delete` receivers
+drop the generation of the lists and of the written todo once the write
+commits, so a list or todo read before then is stored under a key no one
+asks for anymore. The writes of `todos/batch`, which don't send signals or
+send them within `versions.batch()`, call `invalidate` with their ids
+themselves.
+
+On a miss, a single request per key queries and renders the response while
+the others wait for it (see `get_or_compute`).
+"""
+
+import hashlib
+import time
+import uuid
+from functools import wraps
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.http import HttpResponse
+from api.models import Todo
+from api import versions
+
+# seconds a response stays cached without writes
+TIMEOUT = 300
+# seconds a miss may take before another request computes it too
+LOCK_TIMEOUT = 5
+# seconds between two looks at a key being computed
+LOCK_WAIT = 0.005
+
+LIST = 'todos'
+
+
+def todo_generation(id) -> str:
+    return f'todo:{id}'
+
+
+def generation(name: str) -> str:
+    key = f'gen:{name}'
+    gen = cache.get(key)
+    if gen is None:
+        # a new token rather than a counter: a key whose generation was
+        # evicted can't come back with its stale entries
+        gen = uuid.uuid4().hex[:12]
+        if not cache.add(key, gen, None):
+            gen = cache.get(key, gen)
+    return gen
+
+
+def invalidate(ids):
+    """Drops the cached lists and todos of `ids` once the transaction commits."""
+    keys = [f'gen:{LIST}'] + [f'gen:{todo_generation(id)}' for id in ids]
+    transaction.on_commit(lambda: cache.delete_many(keys))
+
+
+@receiver(post_save, sender=Todo)
+@receiver(post_delete, sender=Todo)
+def todo_changed(sender, instance, **kwargs):
+    if not versions.in_batch.get():
+        invalidate([instance.id])
+
+
+def get_or_compute(key: str, compute):
+    """
+    The cached value of `key`, else the one `compute` returns. Concurrent
+    misses of a key wait on a lock in the cache (`cache.add`, atomic in every
+    backend) instead of running the same query each; `compute` may return
+    None for a value not to be cached.
+
+    The lock expires after LOCK_TIMEOUT, which is also the longest a request
+    waits for it: past that, it computes the value itself without caching it.
+    A holder only deletes the lock while it still holds its own token, not
+    the lock another request took once it expired.
+    """
+    value = cache.get(key)
+    if value is not None:
+        return value
+    lock, token = f'{key}:lock', uuid.uuid4().hex
+    deadline = time.monotonic() + LOCK_TIMEOUT
+    while not cache.add(lock, token, LOCK_TIMEOUT):
+        if time.monotonic() >= deadline:
+            return compute()
+        time.sleep(LOCK_WAIT)
+        value = cache.get(key)
+        if value is not None:
+            return value
+    try:
+        # computed by the previous holder of the lock
+        value = cache.get(key)
+        if value is None:
+            value = compute()
+            if value is not None:
+                cache.set(key, value, TIMEOUT)
+        return value
+    finally:
+        # not atomic, but the lock can only be taken over once expired
+        if cache.get(lock) == token:
+            cache.delete(lock)
+
+
+def cached_response(shape):
+    """
+    Caches the JSON responses of a view wrapped by `api_view`. `shape`
+    returns the generation names and the query of a request.
+    """
+    def decorator(view):
+        @wraps(view)
+        def inner(request, *args, **kwargs):
+            # the browsable API renders the user, CSRF tokens...
+            if request.method != 'GET' or request.accepted_renderer.format != 'json':
+                return view(request, *args, **kwargs)
+            names, query = shape(request, *args, **kwargs)
+            parts = [request.accepted_media_type, *map(generation, names), *query]
+            digest = hashlib.sha1(repr(parts).encode()).hexdigest()
+            response = None
+
+            def compute():
+                nonlocal response
+                response = view(request, *args, **kwargs)
+                # errors aren't cached, their cause may not be the todos
+                if response.status_code >= 500:
+                    return None
+                body = request.accepted_renderer.render(
+                    response.data, request.accepted_media_type,
+                    {'request': request, 'response': response},
+                )
+                # rendered once, `data` is kept
+                response.content = body
+                response['Content-Type'] = request.accepted_media_type
+                return response.status_code, body
+
+            value = get_or_compute(f'response:{view.__name__}:{digest}', compute)
+            if value is None or response is not None:
+                return response
+            status, body = value
+            return HttpResponse(body, status=status, content_type=request.accepted_media_type)
+        return inner
+    return decorator
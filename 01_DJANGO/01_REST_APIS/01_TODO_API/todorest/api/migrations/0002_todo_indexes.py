@@ -0,0 +1,21 @@
+# Generated by Django 5.2.18 on 2026-10-18 06:04
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='todo',
+            index=models.Index(fields=['created_at', 'id'], name='todo_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='todo',
+            index=models.Index(fields=['completed', 'created_at', 'id'], name='todo_completed_created_idx'),
+        ),
+    ]
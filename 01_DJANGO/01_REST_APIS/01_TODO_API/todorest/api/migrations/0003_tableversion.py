@@ -0,0 +1,28 @@
+# Generated by Django 5.2.18 on 2026-10-18 06:15
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+def create_todo_version(apps, schema_editor):
+    # the versions are bumped with an UPDATE, the row has to exist
+    apps.get_model('api', 'TableVersion').objects.get_or_create(table='api_todo')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0002_todo_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TableVersion',
+            fields=[
+                ('table', models.CharField(max_length=64, primary_key=True, serialize=False)),
+                ('version', models.BigIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+        ),
+        migrations.RunPython(create_todo_version, migrations.RunPython.noop),
+    ]
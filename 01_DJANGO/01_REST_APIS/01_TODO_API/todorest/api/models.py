@@ -8,5 +8,25 @@ class Todo(models.Model):
     created_at = models.DateTimeField(default=timezone.now)
     completed = models.BooleanField(default=False, null=False)
 
+    class Meta:
+        # the listings are paginated on (created_at, id), see api/pagination.py
+        indexes = [
+            models.Index(fields=['created_at', 'id'], name='todo_created_idx'),
+            models.Index(fields=['completed', 'created_at', 'id'], name='todo_completed_created_idx'),
+        ]
+
+    def __str__(self) -> str:
+        return self.title
+
+
+class TableVersion(models.Model):
+    """
+    A counter per table, bumped on every write to it (see api/versions.py).
+    The ETags of the listings are computed from it.
+    """
+    table = models.CharField(max_length=64, primary_key=True)
+    version = models.BigIntegerField(default=0)
+    updated_at = models.DateTimeField(default=timezone.now)
+
     def __str__(self) -> str:
-        return self.title
\ No newline at end of file
+        return f'{self.table} v{self.version}'
@@ -0,0 +1,88 @@
+"""
+Cursor (keyset) pagination of the todos, ordered by (created_at, id).
+
+A page starts right after the last todo of the previous one, whose position is
+sent back to the client as an opaque `next` cursor. The database seeks to it
+on the (created_at, id) indexes instead of skipping the rows of the previous
+pages like an offset would, so every page costs the same however deep it is
+and however large the table grows.
+"""
+
+import base64
+import binascii
+from datetime import datetime
+from operator import attrgetter
+from django.db.models import Q
+
+DEFAULT_LIMIT = 50
+MAX_LIMIT = 500
+
+
+class InvalidPage(ValueError):
+    pass
+
+
+def encode_cursor(created_at: datetime, id: int) -> str:
+    raw = f'{created_at.isoformat()}|{id}'.encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(cursor: str) -> tuple[datetime, int]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode()
+        created_at, id = raw.split('|')
+        return datetime.fromisoformat(created_at), int(id)
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        raise InvalidPage(f'Invalid cursor {cursor!r}.')
+
+
+def parse_limit(value: str | None) -> int:
+    if value is None:
+        return DEFAULT_LIMIT
+    try:
+        limit = int(value)
+    except ValueError:
+        raise InvalidPage(f'Invalid limit {value!r}.')
+    if not 1 <= limit <= MAX_LIMIT:
+        raise InvalidPage(f'The limit must be between 1 and {MAX_LIMIT}.')
+    return limit
+
+
+def parse_bool(value: str) -> bool:
+    lowered = value.lower()
+    if lowered in ('1', 'true', 'yes'):
+        return True
+    if lowered in ('0', 'false', 'no'):
+        return False
+    raise InvalidPage(f'Invalid boolean {value!r}.')
+
+
+def filter_todos(queryset, params):
+    """Applies the `completed` and `title` (prefix) filters of the query string."""
+    if params.get('completed') is not None:
+        queryset = queryset.filter(completed=parse_bool(params['completed']))
+    if params.get('title'):
+        queryset = queryset.filter(title__startswith=params['title'])
+    return queryset
+
+
+def paginate(queryset, after: str | None = None, limit: int = DEFAULT_LIMIT,
+             key=attrgetter('created_at', 'id')):
+    """
+    Returns the todos of the page after the cursor `after` and the next
+    cursor. `key` reads (created_at, id) from a todo, e.g. from the rows of a
+    `values_list` queryset.
+    """
+    queryset = queryset.order_by('created_at', 'id')
+    if after:
+        created_at, id = decode_cursor(after)
+        # the range on created_at alone is what the index seeks to
+        queryset = queryset.filter(
+            Q(created_at__gte=created_at), Q(created_at__gt=created_at) | Q(id__gt=id)
+        )
+    # one more row tells whether there is a next page
+    todos = list(queryset[:limit + 1])
+    if len(todos) > limit:
+        todos = todos[:limit]
+        return todos, encode_cursor(*key(todos[-1]))
+    return todos, None
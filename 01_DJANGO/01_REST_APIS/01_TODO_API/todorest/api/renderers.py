@@ -0,0 +1,25 @@
+from rest_framework.renderers import JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover
+    orjson = None
+
+
+class ORJSONRenderer(JSONRenderer):
+    """
+    `JSONRenderer` on orjson, several times faster than `json.dumps` on list
+    responses. Values orjson doesn't know (lazy strings, decimals...) go
+    through the encoder of DRF. Indented output (the browsable API) and
+    installs without orjson use `JSONRenderer`.
+    """
+
+    encoder = JSONEncoder()
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        if orjson is None or self.get_indent(accepted_media_type or '', renderer_context or {}):
+            return super().render(data, accepted_media_type, renderer_context)
+        return orjson.dumps(data, default=self.encoder.default, option=orjson.OPT_UTC_Z)
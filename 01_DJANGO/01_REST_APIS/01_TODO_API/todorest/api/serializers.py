@@ -1,8 +1,83 @@
 
-from rest_framework import serializers
+from operator import itemgetter
+from rest_framework import ISO_8601, serializers
+from rest_framework.settings import api_settings
 from api.models import Todo
 
 class TodoSerializer(serializers.ModelSerializer):
     class Meta:
         model = Todo
-        fields = '__all__' # fields = ['id', 'title', 'created_at', 'completed']
\ No newline at end of file
+        fields = '__all__' # fields = ['id', 'title', 'created_at', 'completed']
+
+
+# the serializer fields that represent a database value as it is
+PRIMITIVE_FIELDS = (
+    serializers.IntegerField,
+    serializers.FloatField,
+    serializers.BooleanField,
+    serializers.CharField,
+)
+
+
+class ValuesSerializer:
+    """
+    Read only fast path of a `ModelSerializer`: serializes the rows of
+    `queryset.values_list(...)` into dicts without building a model instance
+    per row nor going through the fields of the serializer one by one.
+
+    The plan is compiled once from the serializer fields: the columns to
+    select and what each field needs beyond its database value. Datetimes
+    (ISO 8601, the default format) are only moved to the timezone of the
+    field, the renderers format them like the field does. Other fields that
+    aren't primitives go through their `to_representation`. Writes keep going
+    through the serializer.
+    """
+
+    def __init__(self, serializer_class):
+        fields = serializer_class().fields
+        for name, field in fields.items():
+            if field.source != name:
+                raise ValueError(f'{name} is not a model field of {serializer_class.__name__}')
+        self.names = tuple(fields)
+        self.datetimes, self.converters = [], []
+        for name, field in fields.items():
+            if isinstance(field, serializers.DateTimeField) and is_iso_8601(field):
+                self.datetimes.append((name, field))
+            elif not isinstance(field, PRIMITIVE_FIELDS):
+                self.converters.append((name, field.to_representation))
+
+    def values(self, queryset):
+        return queryset.values_list(*self.names)
+
+    def getter(self, *names):
+        """Reads fields of a row of `values` by name."""
+        return itemgetter(*(self.names.index(name) for name in names))
+
+    def to_representation(self, rows) -> list[dict]:
+        names = self.names
+        data = [dict(zip(names, row)) for row in rows]
+        for name, field in self.datetimes:
+            # the current timezone can change between requests
+            tz = field.timezone if hasattr(field, 'timezone') else field.default_timezone()
+            if tz is None:
+                self.convert(data, name, field.to_representation)
+            else:
+                self.convert(data, name, lambda value: value.astimezone(tz))
+        for name, convert in self.converters:
+            self.convert(data, name, convert)
+        return data
+
+    @staticmethod
+    def convert(data: list[dict], name: str, convert):
+        for item in data:
+            value = item[name]
+            if value is not None:
+                item[name] = convert(value)
+
+
+def is_iso_8601(field) -> bool:
+    output_format = getattr(field, 'format', api_settings.DATETIME_FORMAT)
+    return output_format is not None and output_format.lower() == ISO_8601
+
+
+todo_values = ValuesSerializer(TodoSerializer)
@@ -1,3 +1,277 @@
+import datetime
+import threading
+import time
+from unittest import mock
+from django.core.cache import cache
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
 from django.test import TestCase
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient
+from api.cache import get_or_compute
+from api.models import Todo
+from api.pagination import filter_todos, paginate
+from api.renderers import ORJSONRenderer
+from api.serializers import TodoSerializer, todo_values
 
-# Create your tests here.
+
+class TodosTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        now = timezone.now()
+        # pairs of todos created at the same time, so ties are broken on the id
+        Todo.objects.bulk_create([
+            Todo(
+                title=f'{"Buy" if i % 3 else "Call"} {i}',
+                completed=i % 2 == 0,
+                created_at=now + datetime.timedelta(seconds=i // 2),
+            )
+            for i in range(25)
+        ])
+
+    def setUp(self):
+        self.client = APIClient()
+        cache.clear()
+
+    def walk(self, **params):
+        ids, after = [], None
+        while True:
+            query = {**params, 'limit': 4}
+            if after is not None:
+                query['after'] = after
+            res = self.client.get('/api/v1/todos/all', query)
+            self.assertEqual(res.status_code, 200)
+            ids.extend(todo['id'] for todo in res.data['todos'])
+            after = res.data['next']
+            if after is None:
+                return ids
+
+    def test_cursor_pagination(self):
+        expected = list(Todo.objects.order_by('created_at', 'id').values_list('id', flat=True))
+        self.assertEqual(self.walk(), expected)
+
+    def test_filters(self):
+        completed = Todo.objects.filter(completed=True, title__startswith='Buy')
+        expected = list(completed.order_by('created_at', 'id').values_list('id', flat=True))
+        self.assertEqual(self.walk(completed='true', title='Buy'), expected)
+        self.assertEqual(len(self.walk(completed='false')), 12)
+
+    def test_invalid_parameters(self):
+        for params in ({'after': 'nope'}, {'limit': 0}, {'limit': 'ten'}, {'completed': 'maybe'}):
+            res = self.client.get('/api/v1/todos/all', params)
+            self.assertEqual(res.status_code, 400, params)
+            self.assertIsNone(res.data['todos'])
+
+    def test_pages_seek_on_an_index(self):
+        _, after = paginate(Todo.objects.all(), limit=4)
+        for params in ({}, {'completed': 'true'}):
+            todos = filter_todos(Todo.objects.all(), params)
+            sql, args = paginate_query(todos, after)
+            with connection.cursor() as cursor:
+                cursor.execute(f'EXPLAIN QUERY PLAN {sql}', args)
+                plan = ' '.join(str(row[-1]) for row in cursor.fetchall())
+            self.assertIn('USING INDEX', plan)
+            self.assertNotIn('TEMP B-TREE', plan)
+
+    def test_values_serializer_matches_the_serializer(self):
+        todos = Todo.objects.order_by('id')
+        expected = JSONRenderer().render(TodoSerializer(todos, many=True).data)
+        data = todo_values.to_representation(todo_values.values(todos))
+        self.assertEqual(ORJSONRenderer().render(data), expected)
+        self.assertEqual(JSONRenderer().render(data), expected)
+        todo = todos.first()
+        res = self.client.get(f'/api/v1/todo/one/{todo.id}')
+        self.assertEqual(res.json()['todo'], TodoSerializer(todo).data)
+        self.assertEqual(self.client.get('/api/v1/todo/one/0').status_code, 404)
+
+    def test_orjson_renderer(self):
+        data = {
+            'timestamp': datetime.datetime(2022, 8, 14, 8, 21, 5, 123456),
+            'created_at': timezone.now(),
+            'todos': TodoSerializer(Todo.objects.all()[:3], many=True).data,
+        }
+        self.assertEqual(ORJSONRenderer().render(data), JSONRenderer().render(data))
+
+
+class BatchTestCase(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        cache.clear()
+
+    def batch(self, method: str, data: dict):
+        res = getattr(self.client, method)('/api/v1/todos/batch', data, format='json')
+        self.assertEqual(res.status_code, 200)
+        return [(result['code'], result['todo']) for result in res.data['results']]
+
+    def test_create_update_and_delete_in_a_few_queries(self):
+        todos = [{'title': f'Todo {i}', 'completed': i % 2 == 0} for i in range(1200)]
+        with CaptureQueriesContext(connection) as queries:
+            results = self.batch('post', {'todos': todos})
+        self.assertLessEqual(len(queries), 10)
+        self.assertEqual({code for code, _ in results}, {201})
+        ids = [todo['id'] for _, todo in results]
+        self.assertEqual(Todo.objects.filter(id__in=ids[:900]).count(), 900)
+
+        changes = [{'id': id, 'completed': True} for id in ids] + [{'id': 0, 'title': 'Gone'}]
+        with CaptureQueriesContext(connection) as queries:
+            results = self.batch('patch', {'todos': changes})
+        self.assertLessEqual(len(queries), 12)
+        self.assertEqual(results[-1], (404, None))
+        self.assertEqual(Todo.objects.filter(completed=True).count(), 1200)
+        self.assertEqual(results[1][1]['title'], 'Todo 1')
+
+        with CaptureQueriesContext(connection) as queries:
+            results = self.batch('delete', {'ids': ids[:1000] + [0]})
+        # delete() deletes 100 todos per query
+        self.assertLessEqual(len(queries), 20)
+        self.assertEqual([code for code, _ in results].count(204), 1000)
+        self.assertEqual(results[-1][0], 404)
+        self.assertEqual(Todo.objects.count(), 200)
+
+    def test_invalid_items_dont_stop_the_batch(self):
+        results = self.batch('post', {'todos': [{'title': 'a' * 51}, {'title': 'Ok'}, 'nope']})
+        self.assertEqual([code for code, _ in results], [400, 201, 400])
+        self.assertEqual(Todo.objects.get().title, 'Ok')
+        id = results[1][1]['id']
+        results = self.batch('patch', {'todos': [{'id': id, 'completed': 'maybe'}, {'id': True}]})
+        self.assertEqual([code for code, _ in results], [400, 400])
+        results = self.batch('delete', {'ids': [{'id': id}, {'id': 0}, 'one']})
+        self.assertEqual([code for code, _ in results], [204, 404, 400])
+        self.assertFalse(Todo.objects.exists())
+        res = self.client.post('/api/v1/todos/batch', {'todos': {}}, format='json')
+        self.assertEqual(res.status_code, 400)
+
+
+class ConditionalGetTestCase(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        cache.clear()
+        self.todo = Todo.objects.create(title='Buy milk')
+
+    def test_not_modified_without_reading_the_todos(self):
+        res = self.client.get('/api/v1/todos/all')
+        etag = res['ETag']
+        self.assertTrue(etag.startswith('W/"'))
+        self.assertNotIn('Last-Modified', res)
+        self.assertEqual(self.client.get('/api/v1/todos/all').content, res.content)
+        with CaptureQueriesContext(connection) as queries:
+            res = self.client.get('/api/v1/todos/all', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(res.status_code, 304)
+        self.assertEqual(len(queries), 1)
+        self.assertIn('FROM "api_tableversion"', queries[0]['sql'])
+
+    def test_etags_are_per_resource(self):
+        etag = self.client.get('/api/v1/todos/all')['ETag']
+        url = f'/api/v1/todo/one/{self.todo.id}'
+        res = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(res.status_code, 200)
+        self.assertNotEqual(res['ETag'], etag)
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=res['ETag']).status_code, 304)
+
+    def test_writes_change_the_etag(self):
+        etags = [self.client.get('/api/v1/todos/all')['ETag']]
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.patch(f'/api/v1/todo/update/{self.todo.id}', {'title': 'Buy tea'}, format='json')
+        etags.append(self.client.get('/api/v1/todos/all')['ETag'])
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post('/api/v1/todos/batch', {'todos': [{'title': 'Call'}] * 3}, format='json')
+        etags.append(self.client.get('/api/v1/todos/all')['ETag'])
+        ids = list(Todo.objects.values_list('id', flat=True))
+        with CaptureQueriesContext(connection) as queries, self.captureOnCommitCallbacks(execute=True):
+            self.client.delete('/api/v1/todos/batch', {'ids': ids}, format='json')
+        bumps = [query for query in queries if query['sql'].startswith('UPDATE "api_tableversion"')]
+        self.assertEqual(len(bumps), 1)
+        etags.append(self.client.get('/api/v1/todos/all')['ETag'])
+        self.assertEqual(len(set(etags)), 4)
+        res = self.client.get('/api/v1/todos/all', HTTP_IF_NONE_MATCH=etags[0])
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(res.json()['todos'], [])
+
+
+class CacheTestCase(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        cache.clear()
+        self.todos = [Todo.objects.create(title=f'Todo {i}') for i in range(3)]
+
+    def get(self, url: str, params=None):
+        with CaptureQueriesContext(connection) as queries:
+            res = self.client.get(url, params)
+        self.assertEqual(res.status_code, 200)
+        # the version of the table is always read, for the ETag
+        reads = [query for query in queries if 'FROM "api_todo"' in query['sql']]
+        return res.content, len(reads)
+
+    def test_hits_dont_query_the_todos(self):
+        for url, params in (('/api/v1/todos/all', {'limit': 2}), (f'/api/v1/todo/one/{self.todos[0].id}', None)):
+            content, reads = self.get(url, params)
+            self.assertEqual(reads, 1)
+            self.assertEqual(self.get(url, params), (content, 0))
+        # another query shape
+        self.assertEqual(self.get('/api/v1/todos/all', {'limit': 3})[1], 1)
+
+    def test_writes_invalidate_the_lists_and_their_todo(self):
+        first, second = (f'/api/v1/todo/one/{todo.id}' for todo in self.todos[:2])
+        for url in ('/api/v1/todos/all', first, second):
+            self.get(url)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.patch(first.replace('one', 'update'), {'title': 'Edited'}, format='json')
+        self.assertEqual(self.get(first)[1], 1)
+        self.assertEqual(self.client.get(first).json()['todo']['title'], 'Edited')
+        self.assertEqual(self.get(second)[1], 0)
+        content, reads = self.get('/api/v1/todos/all')
+        self.assertEqual(reads, 1)
+        self.assertIn(b'Edited', content)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.delete('/api/v1/todos/batch', {'ids': [self.todos[1].id]}, format='json')
+        self.assertEqual(self.client.get(second).status_code, 404)
+
+    def test_a_cold_key_is_computed_once(self):
+        calls = []
+
+        def compute():
+            calls.append(1)
+            time.sleep(0.05)
+            return b'todos'
+
+        results = []
+        threads = [
+            threading.Thread(target=lambda: results.append(get_or_compute('cold', compute)))
+            for _ in range(8)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(results, [b'todos'] * 8)
+        self.assertEqual(len(calls), 1)
+
+    def test_locks_are_only_released_by_their_holder(self):
+        def compute():
+            # the lock expired and another request took it
+            cache.set('slow:lock', 'other', 60)
+            return b'todos'
+
+        self.assertEqual(get_or_compute('slow', compute), b'todos')
+        self.assertEqual(cache.get('slow:lock'), 'other')
+
+    def test_waits_are_bounded(self):
+        cache.set('stuck:lock', 'other', 60)
+        with mock.patch('api.cache.LOCK_TIMEOUT', 0.02):
+            self.assertEqual(get_or_compute('stuck', lambda: b'todos'), b'todos')
+        # computed without the lock, so not cached
+        self.assertIsNone(cache.get('stuck'))
+
+
+def paginate_query(todos, after):
+    queries = []
+
+    def record(execute, sql, params, many, context):
+        queries.append((sql, params))
+        return execute(sql, params, many, context)
+
+    with connection.execute_wrapper(record):
+        paginate(todos, after, limit=4)
+    return queries[-1]
@@ -7,5 +7,6 @@ urlpatterns = [
     path('todo/one/<int:id>', getTodo),
     path('todo/update/<int:id>', updateTodo),
     path('todo/delete/<int:id>', deleteTodo),
-    path('todo/add', addTodo)
+    path('todo/add', addTodo),
+    path('todos/batch', batchTodos),
 ]
\ No newline at end of file
@@ -0,0 +1,103 @@
+"""
+Conditional GETs of the todos. Every write to a table bumps its row in
+`TableVersion`, from the `post_save` and `post_delete` signals, so the ETag
+of a response is known from that single row and the path of the request: a
+client sending `If-None-Match` gets a 304 for a primary key lookup, without
+the todos being read or serialized.
+
+The ETags are weak, the body under one can differ in the `timestamp` of a
+response served from a cache. There is no Last-Modified: it is precise to the
+second, two writes within the same second would answer `If-Modified-Since`
+with a 304 for the first one.
+
+The writes which don't send signals (`bulk_create`, `bulk_update`,
+`QuerySet.update`) have to `bump` the version themselves, once per batch.
+So do the deletions of a batch, whose `post_delete` per todo is ignored
+within `batch()`.
+"""
+
+import hashlib
+from contextlib import contextmanager
+from contextvars import ContextVar
+from django.db.models import F
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.utils import timezone
+from django.views.decorators.http import condition
+from api.models import TableVersion, Todo
+
+# true while a batch writes the todos in the current thread
+in_batch: ContextVar[bool] = ContextVar('in_batch', default=False)
+
+
+def bump(model):
+    table = model._meta.db_table
+    updated = TableVersion.objects.filter(table=table).update(
+        version=F('version') + 1, updated_at=timezone.now()
+    )
+    if not updated:
+        TableVersion.objects.get_or_create(table=table, defaults={'version': 1})
+
+
+@receiver(post_save, sender=Todo)
+@receiver(post_delete, sender=Todo)
+def todo_changed(sender, **kwargs):
+    if not in_batch.get():
+        bump(sender)
+
+
+@contextmanager
+def batch():
+    """
+    Turns the receivers of the todos into no-ops for the writes of a batch,
+    which bumps the version once rather than once per todo. They stay
+    connected: the writes of the other requests meanwhile still bump it.
+    """
+    token = in_batch.set(True)
+    try:
+        yield
+    finally:
+        in_batch.reset(token)
+
+
+def table_version(request, model) -> tuple[int, object]:
+    """The version and last update of the table of `model`, read once per request."""
+    # a DRF Request reads the attributes of the Django request it wraps
+    versions = getattr(request, 'table_versions', None)
+    if versions is None:
+        versions = request.table_versions = {}
+    table = model._meta.db_table
+    if table not in versions:
+        row = TableVersion.objects.filter(table=table).values_list('version', 'updated_at').first()
+        versions[table] = row or (0, None)
+    return versions[table]
+
+
+def last_update(request, model):
+    """
+    The `timestamp` of a response, the last write to the table rather than the
+    time of the request, so that the body doesn't change under a same ETag.
+    """
+    return table_version(request, model)[1] or timezone.now()
+
+
+def path_digest(request) -> str:
+    return hashlib.blake2s(request.get_full_path().encode(), digest_size=8).hexdigest()
+
+
+def etag(model):
+    def etag_func(request, *args, **kwargs):
+        version, _ = table_version(request, model)
+        # an ETag of `todos/all` must not match `todo/one/<id>`, so it has
+        # the path and its parameters. Weak: a todo cached by api/cache.py
+        # keeps the `timestamp` of the write it was read after, not the latest
+        return f'W/"{model._meta.db_table}.{version}.{path_digest(request)}"'
+    return etag_func
+
+
+def conditional(model):
+    """
+    `condition` of the version of `model`: 304 when the client has it already,
+    otherwise the view runs and the response gets the ETag.
+    """
+    return condition(etag_func=etag(model))
@@ -4,22 +4,53 @@ from rest_framework.status import *
 from rest_framework.decorators import api_view
 from rest_framework.response import Response
 from api.models import Todo
-from api.serializers import TodoSerializer
+from api.serializers import TodoSerializer, todo_values
+from api.pagination import InvalidPage, filter_todos, paginate, parse_limit
+from api.versions import conditional, last_update
+from api.cache import LIST, cached_response, todo_generation
+from api.batch import InvalidBatch, batch_items, create_todos, delete_todos, update_todos
 import datetime
 # Create your views here.
 
+# the position of a row of todo_values in the pagination order
+cursor_key = todo_values.getter('created_at', 'id')
+
+
+def todos_shape(request):
+    params = request.query_params
+    return [LIST], [(name, params.get(name)) for name in ('after', 'limit', 'completed', 'title')]
+
+
+def todo_shape(request, id):
+    return [todo_generation(id)], [id]
+
+
+@conditional(Todo)
 @api_view(['GET'])
+@cached_response(todos_shape)
 def getTodos(request):
     if request.method == 'GET':
         try:
-            todos = Todo.objects.all()
-            serializer = TodoSerializer(todos, many=True)
+            params = request.query_params
+            todos = todo_values.values(filter_todos(Todo.objects.all(), params))
+            page, next = paginate(
+                todos, params.get('after'), parse_limit(params.get('limit')), key=cursor_key
+            )
             return Response({
                 'code': 200,
                 'message': 'Getting all Todos.',
-                'timestamp': datetime.datetime.now(),
-                'todos': serializer.data,
+                'timestamp': last_update(request, Todo),
+                'todos': todo_values.to_representation(page),
+                'next': next,
             }, HTTP_200_OK)
+        except InvalidPage as e:
+            return Response({
+                'code': 400,
+                'message': str(e),
+                'timestamp': datetime.datetime.now(),
+                'todos': None,
+                'next': None,
+            }, HTTP_400_BAD_REQUEST)
         except:
             return  Response({
                 'code': 500,
@@ -33,17 +64,20 @@ def getTodos(request):
             'timestamp': datetime.datetime.now(),
         }, HTTP_405_METHOD_NOT_ALLOWED)
     
+@conditional(Todo)
 @api_view(["GET"])
+@cached_response(todo_shape)
 def getTodo(request, id):
     if request.method == 'GET':
         try:
-            todo = Todo.objects.get(id=id)
-            serializer = TodoSerializer(todo)
+            todo = todo_values.values(Todo.objects.filter(id=id)).first()
+            if todo is None:
+                raise Todo.DoesNotExist
             return Response({
                 'code': 200,
                 'message': 'Getting all Todos.',
-                'timestamp': datetime.datetime.now(),
-                'todo': serializer.data,
+                'timestamp': last_update(request, Todo),
+                'todo': todo_values.to_representation([todo])[0],
             }, HTTP_200_OK)
         except Todo.DoesNotExist:
             return  Response({
@@ -168,4 +202,41 @@ def addTodo(request):
         return Response({
             'code': 405,
             'message': 'Only POST method is allowed.'
-        }, HTTP_405_METHOD_NOT_ALLOWED)
\ No newline at end of file
+        }, HTTP_405_METHOD_NOT_ALLOWED)
+
+@api_view(['POST', 'PATCH', 'DELETE'])
+def batchTodos(request):
+    if request.method in ('POST', 'PATCH', 'DELETE'):
+        try:
+            if request.method == 'POST':
+                results = create_todos(batch_items(request.data, 'todos'))
+            elif request.method == 'PATCH':
+                results = update_todos(batch_items(request.data, 'todos'))
+            else:
+                results = delete_todos(batch_items(request.data, 'ids'))
+            done = sum(1 for result in results if result['errors'] is None)
+            return Response({
+                'code': 200,
+                'message': f'Wrote {done} of {len(results)} todos.',
+                'timestamp': datetime.datetime.now(),
+                'results': results,
+            }, HTTP_200_OK)
+        except InvalidBatch as e:
+            return Response({
+                'code': 400,
+                'message': str(e),
+                'timestamp': datetime.datetime.now(),
+                'results': None,
+            }, HTTP_400_BAD_REQUEST)
+        except:
+            return  Response({
+                'code': 500,
+                'message': 'Internal Server Error.',
+                'timestamp': datetime.datetime.now(),
+            }, HTTP_500_INTERNAL_SERVER_ERROR)
+    else:
+        return Response({
+            'code': 405,
+            'message': 'Only POST, PATCH or DELETE method(s) are allowed.',
+            'timestamp': datetime.datetime.now(),
+        }, HTTP_405_METHOD_NOT_ALLOWED)
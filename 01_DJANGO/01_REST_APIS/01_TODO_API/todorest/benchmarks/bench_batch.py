@@ -0,0 +1,91 @@
+"""
+Syncing n todos: creating, updating then deleting them one request per todo
+with `todo/add`, `todo/update/<id>` and `todo/delete/<id>`, against one
+`todos/batch` request per step. Prints the queries and the time of each.
+Run from the todorest directory:
+
+    python -m benchmarks.bench_batch --todos 5000
+"""
+
+import argparse
+import time
+from django.db import connection
+from benchmarks.common import make_client, make_todos_db, remove_database
+from api.models import Todo
+
+
+def measure(fn) -> tuple[int, float]:
+    queries = 0
+
+    def count(execute, sql, params, many, context):
+        nonlocal queries
+        queries += 1
+        return execute(sql, params, many, context)
+
+    with connection.execute_wrapper(count):
+        start = time.perf_counter()
+        fn()
+        elapsed = time.perf_counter() - start
+    return queries, elapsed * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--todos', type=int, default=5000)
+    args = parser.parse_args()
+
+    path = make_todos_db(0)
+    try:
+        client = make_client()
+        todos = [{'title': f'Todo {i}', 'completed': False} for i in range(args.todos)]
+
+        def add_one_by_one():
+            for todo in todos:
+                client.post('/api/v1/todo/add', todo, format='json')
+
+        def changes() -> list[dict]:
+            # half of the todos are completed, the other half renamed
+            return [
+                {'id': id, 'title': f'Todo {id}', 'completed': True} if id % 2
+                else {'id': id, 'title': f'Todo {id} (edited)', 'completed': False}
+                for id in Todo.objects.values_list('id', flat=True)
+            ]
+
+        def update_one_by_one():
+            for change in changes():
+                client.patch(f"/api/v1/todo/update/{change['id']}", change, format='json')
+
+        def delete_one_by_one():
+            for id in Todo.objects.values_list('id', flat=True):
+                client.delete(f'/api/v1/todo/delete/{id}')
+
+        def add_batch():
+            client.post('/api/v1/todos/batch', {'todos': todos}, format='json')
+
+        def update_batch():
+            client.patch('/api/v1/todos/batch', {'todos': changes()}, format='json')
+
+        def delete_batch():
+            ids = list(Todo.objects.values_list('id', flat=True))
+            client.delete('/api/v1/todos/batch', {'ids': ids}, format='json')
+
+        print(f"{'step':>7} {'single queries':>15} {'single ms':>10} {'batch queries':>14} {'batch ms':>9}")
+        steps = (
+            ('create', add_one_by_one, add_batch),
+            ('update', update_one_by_one, update_batch),
+            ('delete', delete_one_by_one, delete_batch),
+        )
+        for name, single, batch in steps:
+            single_queries, single_ms = measure(single)
+            if name == 'delete':
+                add_batch()
+            batch_queries, batch_ms = measure(batch)
+            print(f'{name:>7} {single_queries:>15} {single_ms:>10.0f} {batch_queries:>14} {batch_ms:>9.0f}')
+            if name == 'create':
+                Todo.objects.filter(id__in=Todo.objects.order_by('id')[:args.todos]).delete()
+    finally:
+        remove_database(path)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,75 @@
+"""
+Response time of `todos/all` and `todo/one/<id>` served from the response
+cache against computed (cache cleared before every request), and the queries
+of the todos a burst of concurrent requests on a cold key makes. Uses the
+default cache, set REDIS_URL to measure Redis. Run from the todorest
+directory:
+
+    python -m benchmarks.bench_cache --rows 100000 --limit 500 --burst 16
+"""
+
+import argparse
+import threading
+from django.core.cache import cache
+from django.db import connection
+from benchmarks.common import make_client, make_todos_db, remove_database, timed
+from api.models import Todo
+
+
+def burst(url: str, params: dict, n: int) -> int:
+    """Queries of the todos made by `n` concurrent requests on a cold key."""
+    queries = []
+    barrier = threading.Barrier(n)
+
+    def count(execute, sql, params, many, context):
+        if 'FROM "api_todo"' in sql:
+            queries.append(sql)
+        return execute(sql, params, many, context)
+
+    def request():
+        client = make_client()
+        with connection.execute_wrapper(count):
+            barrier.wait()
+            assert client.get(url, params).status_code == 200
+        connection.close()
+
+    cache.clear()
+    threads = [threading.Thread(target=request) for _ in range(n)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return len(queries)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', type=int, default=100_000)
+    parser.add_argument('--limit', type=int, default=500)
+    parser.add_argument('--burst', type=int, default=16)
+    args = parser.parse_args()
+
+    path = make_todos_db(args.rows)
+    try:
+        client = make_client()
+        id = Todo.objects.values_list('id', flat=True).last()
+        print(f"{'route':>10} {'computed ms':>12} {'cached ms':>10} {'speedup':>8} {'burst queries':>14}")
+        for route, url, params in (
+            ('todos/all', '/api/v1/todos/all', {'limit': args.limit}),
+            ('todo/one', f'/api/v1/todo/one/{id}', {}),
+        ):
+            def computed():
+                cache.clear()
+                client.get(url, params)
+
+            assert client.get(url, params).content == client.get(url, params).content
+            slow = timed(computed, repeat=20)
+            fast = timed(lambda: client.get(url, params), repeat=20)
+            queries = burst(url, params, args.burst)
+            print(f'{route:>10} {slow:>12.2f} {fast:>10.2f} {slow / fast:>7.1f}x {queries:>14}')
+    finally:
+        remove_database(path)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,41 @@
+"""
+Cost of a client polling `todos/all` and `todo/one/<id>` when nothing
+changed: a plain GET against a GET with the `If-None-Match` of the previous
+response, answered 304 from the version of the table. Run from the todorest
+directory:
+
+    python -m benchmarks.bench_conditional --rows 100000 --limit 500
+"""
+
+import argparse
+from benchmarks.common import make_client, make_todos_db, remove_database, timed
+from api.models import Todo
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', type=int, default=100_000)
+    parser.add_argument('--limit', type=int, default=500)
+    args = parser.parse_args()
+
+    path = make_todos_db(args.rows)
+    try:
+        client = make_client()
+        id = Todo.objects.values_list('id', flat=True).last()
+        print(f"{'route':>12} {'200 ms':>8} {'304 ms':>8} {'200 bytes':>10} {'speedup':>8}")
+        for route, url, params in (
+            ('todos/all', '/api/v1/todos/all', {'limit': args.limit}),
+            ('todo/one', f'/api/v1/todo/one/{id}', {}),
+        ):
+            res = client.get(url, params)
+            etag = res['ETag']
+            assert client.get(url, params, HTTP_IF_NONE_MATCH=etag).status_code == 304
+            full = timed(lambda: client.get(url, params), repeat=20)
+            cached = timed(lambda: client.get(url, params, HTTP_IF_NONE_MATCH=etag), repeat=20)
+            print(f'{route:>12} {full:>8.2f} {cached:>8.2f} {len(res.content):>10} {full / cached:>7.1f}x')
+    finally:
+        remove_database(path)
+
+
+if __name__ == '__main__':
+    main()
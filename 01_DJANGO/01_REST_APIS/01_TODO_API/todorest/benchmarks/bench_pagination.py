@@ -0,0 +1,53 @@
+"""
+Response time of `todos/all` as the table grows: the first page, a page 90%
+deep (following `next` cursors) and the same with the `completed` and `title`
+filters, against serializing the whole table like the route used to. Run
+from the todorest directory:
+
+    python -m benchmarks.bench_pagination --rows 10000 100000 1000000
+"""
+
+import argparse
+from benchmarks.common import make_client, make_todos_db, remove_database, timed
+from api.models import Todo
+from api.pagination import encode_cursor
+from api.serializers import TodoSerializer
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', type=int, nargs='+', default=[10_000, 100_000, 1_000_000])
+    parser.add_argument('--limit', type=int, default=50)
+    parser.add_argument('--full-max', type=int, default=100_000,
+                        help='largest table serialized whole')
+    args = parser.parse_args()
+
+    print(f"{'rows':>9} {'first ms':>9} {'deep ms':>8} {'filtered ms':>12} {'whole table ms':>15}")
+    for rows in args.rows:
+        path = make_todos_db(rows)
+        try:
+            client = make_client()
+            # the cursor a client would hold 90% of the way through, computed
+            # up front so that it is not part of the timings
+            ordered = Todo.objects.order_by('created_at', 'id')
+            deep = encode_cursor(*ordered.values_list('created_at', 'id')[rows * 9 // 10])
+
+            def page(**params):
+                res = client.get('/api/v1/todos/all', {'limit': args.limit, **params})
+                assert res.status_code == 200 and len(res.data['todos']) > 0
+
+            first_ms = timed(lambda: page())
+            deep_ms = timed(lambda: page(after=deep))
+            filtered_ms = timed(lambda: page(after=deep, completed='true', title='B'))
+            if rows <= args.full_max:
+                whole = timed(lambda: TodoSerializer(Todo.objects.all(), many=True).data, repeat=1)
+                whole_ms = f'{whole:>15.1f}'
+            else:
+                whole_ms = f"{'-':>15}"
+            print(f'{rows:>9} {first_ms:>9.1f} {deep_ms:>8.1f} {filtered_ms:>12.1f} {whole_ms}')
+        finally:
+            remove_database(path)
+
+
+if __name__ == '__main__':
+    main()
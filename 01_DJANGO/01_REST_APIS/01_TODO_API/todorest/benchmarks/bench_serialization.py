@@ -0,0 +1,49 @@
+"""
+Throughput of a list response of n todos: `TodoSerializer(many=True)` on
+model instances rendered by `JSONRenderer`, against `todo_values` on
+`values_list` rows rendered by `ORJSONRenderer`. Both read the todos from the
+database and render the same bytes. Run from the todorest directory:
+
+    python -m benchmarks.bench_serialization --todos 1000 10000 100000
+"""
+
+import argparse
+from benchmarks.common import make_todos_db, remove_database, timed
+from rest_framework.renderers import JSONRenderer
+from api.models import Todo
+from api.renderers import ORJSONRenderer
+from api.serializers import TodoSerializer, todo_values
+
+
+def serializer_response(n: int) -> bytes:
+    todos = TodoSerializer(Todo.objects.order_by('id')[:n], many=True).data
+    return JSONRenderer().render({'todos': todos})
+
+
+def values_response(n: int) -> bytes:
+    todos = todo_values.to_representation(todo_values.values(Todo.objects.order_by('id')[:n]))
+    return ORJSONRenderer().render({'todos': todos})
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--todos', type=int, nargs='+', default=[1_000, 10_000, 100_000])
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    path = make_todos_db(max(args.todos))
+    try:
+        print(f"{'todos':>7} {'serializer ms':>14} {'values ms':>10} {'serializer todos/s':>19}"
+              f" {'values todos/s':>15} {'speedup':>8}")
+        for n in args.todos:
+            assert serializer_response(n) == values_response(n)
+            slow = timed(lambda: serializer_response(n), args.repeat)
+            fast = timed(lambda: values_response(n), args.repeat)
+            print(f'{n:>7} {slow:>14.1f} {fast:>10.1f} {n / slow * 1000:>19.0f}'
+                  f' {n / fast * 1000:>15.0f} {slow / fast:>7.1f}x')
+    finally:
+        remove_database(path)
+
+
+if __name__ == '__main__':
+    main()
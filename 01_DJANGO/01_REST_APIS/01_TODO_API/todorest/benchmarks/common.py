@@ -0,0 +1,77 @@
+import os
+import random
+import sqlite3
+import tempfile
+import time
+import django
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'todorest.settings')
+django.setup()
+
+from django.conf import settings
+from django.core.management import call_command
+from django.db import connections
+from rest_framework.test import APIClient
+
+WORDS = ['Buy', 'Call', 'Write', 'Read', 'Clean', 'Fix', 'Plan', 'Book']
+
+
+def use_database(path: str):
+    """Points the default database at `path` and creates the tables there."""
+    connections.close_all()
+    settings.DATABASES['default']['NAME'] = path
+    connections['default'].settings_dict['NAME'] = path
+    call_command('migrate', 'api', verbosity=0)
+
+
+def make_todos_db(rows: int) -> str:
+    """
+    Creates a throw away sqlite database with `rows` fake todos, one a second
+    from 2020 on, and makes it the default database.
+    """
+    fd, path = tempfile.mkstemp(suffix='.sqlite3')
+    os.close(fd)
+    use_database(path)
+    conn = sqlite3.connect(path)
+    rnd = random.Random(0)
+    batch = 50_000
+    for start in range(0, rows, batch):
+        conn.executemany(
+            'INSERT INTO api_todo (title, created_at, completed) VALUES (?, ?, ?)',
+            [
+                (
+                    f'{rnd.choice(WORDS)} {rnd.choice(WORDS).lower()} {i}',
+                    time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime(1577836800 + i)),
+                    rnd.random() < 0.5,
+                )
+                for i in range(start, min(start + batch, rows))
+            ],
+        )
+        conn.commit()
+    conn.execute('ANALYZE')
+    conn.close()
+    return path
+
+
+def remove_database(path: str):
+    connections.close_all()
+    for suffix in ('', '-wal', '-shm', '-journal'):
+        if os.path.exists(path + suffix):
+            os.remove(path + suffix)
+
+
+def make_client() -> APIClient:
+    # DEBUG keeps every query in memory
+    settings.DEBUG = False
+    settings.ALLOWED_HOSTS = ['*']
+    return APIClient()
+
+
+def timed(fn, repeat: int = 5) -> float:
+    """Returns the best wall time of `repeat` calls in milliseconds."""
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best * 1000
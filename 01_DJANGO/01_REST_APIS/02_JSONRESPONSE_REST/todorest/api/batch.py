@@ -0,0 +1,164 @@
+"""
+Batch writes of todos for `todos/batch`. Many todos are created, updated or
+deleted in one transaction and a handful of queries instead of a query or
+two per todo: `bulk_create` for the creations, `filter(id__in=...).update()`
+and `bulk_update` for the updates, and `filter(id__in=...).delete()` for
+the deletions. The items are validated by the fields of `TodoForm`, a
+ModelForm of the todos. Only the deletions send signals, ignored within
+`versions.batch()`: the version of the todos is bumped once per batch
+instead (see api/versions.py).
+
+Every item gets its own result, in the order of the request: the todo, or
+the errors of the item and a 400 (invalid) or 404 (unknown id) code. Invalid
+items don't stop the valid ones from being written.
+"""
+
+from django.core.exceptions import ValidationError
+from django.db import connection, transaction
+from api.forms import TodoForm
+from api.models import Todo
+from api import versions
+
+MAX_BATCH_SIZE = 10_000
+
+
+class InvalidBatch(ValueError):
+    pass
+
+
+def batch_items(data, key: str) -> list:
+    items = data.get(key) if isinstance(data, dict) else None
+    if not isinstance(items, list):
+        raise InvalidBatch(f'Expected a list of {key}.')
+    if len(items) > MAX_BATCH_SIZE:
+        raise InvalidBatch(f'At most {MAX_BATCH_SIZE} {key} per batch.')
+    return items
+
+
+def chunks(ids: list) -> list[list]:
+    # SQLite takes at most 999 parameters per query
+    size = connection.features.max_query_params or len(ids) or 1
+    return [ids[i:i + size] for i in range(0, len(ids), size)]
+
+
+def todo_id(item):
+    id = item.get('id') if isinstance(item, dict) else item
+    # bool is a subclass of int
+    return id if isinstance(id, int) and not isinstance(id, bool) else None
+
+
+def failure(index: int, code: int, errors) -> dict:
+    return {'index': index, 'code': code, 'errors': errors, 'todo': None}
+
+
+def validate(item, partial: bool = False):
+    """
+    Returns the fields of a todo in `item` and its errors, one of them is None.
+    The fields of `TodoForm` are shared by the items rather than built in a
+    form per item, a partial item is only checked for the fields it has.
+    """
+    if not isinstance(item, dict):
+        return None, {'non_field_errors': ['Expected an object.']}
+    data, errors = {}, {}
+    for name, field in TodoForm.base_fields.items():
+        if partial and name not in item:
+            continue
+        try:
+            data[name] = field.clean(item.get(name))
+        except ValidationError as e:
+            errors[name] = e.messages
+    return (None, errors) if errors else (data, None)
+
+
+def create_todos(items: list) -> list[dict]:
+    results, todos = [None] * len(items), {}
+    for index, item in enumerate(items):
+        data, errors = validate(item)
+        if errors is None:
+            todos[index] = Todo(**data)
+        else:
+            results[index] = failure(index, 400, errors)
+    with transaction.atomic():
+        Todo.objects.bulk_create(todos.values())
+        versions.bump(Todo)
+    for index, todo in todos.items():
+        results[index] = {'index': index, 'code': 201, 'errors': None, 'todo': todo.to_json()}
+    return results
+
+
+def update_todos(items: list) -> list[dict]:
+    results, updated = [None] * len(items), {}
+    # id -> the todo and the names of its changed fields
+    changed = {}
+    ids = [id for id in map(todo_id, items) if id is not None]
+    with transaction.atomic():
+        existing = Todo.objects.in_bulk(ids)
+        for index, item in enumerate(items):
+            id = todo_id(item)
+            if id is None:
+                results[index] = failure(index, 400, {'id': ['An integer id is required.']})
+                continue
+            todo = existing.get(id)
+            if todo is None:
+                results[index] = failure(index, 404, {'id': [f'Todo of id {id} was not found.']})
+                continue
+            data, errors = validate(item, partial=True)
+            if errors is not None:
+                results[index] = failure(index, 400, errors)
+                continue
+            for name, value in data.items():
+                setattr(todo, name, value)
+            changed.setdefault(id, (todo, set()))[1].update(data)
+            updated[index] = todo
+        write_changes(changed.values())
+        versions.bump(Todo)
+    for index, todo in updated.items():
+        results[index] = {'index': index, 'code': 200, 'errors': None, 'todo': todo.to_json()}
+    return results
+
+
+def write_changes(changed):
+    """
+    Writes field by field: the todos given the same value (e.g. all marked
+    completed) with one `UPDATE ... WHERE id IN (...)`, the others with
+    `bulk_update`, whose `CASE WHEN` per todo costs far more to build.
+    """
+    # field -> value -> todos
+    groups = {}
+    for todo, names in changed:
+        for name in names:
+            groups.setdefault(name, {}).setdefault(getattr(todo, name), []).append(todo)
+    for name, by_value in groups.items():
+        rest = []
+        for value, todos in by_value.items():
+            if len(todos) > 1:
+                for chunk in chunks([todo.id for todo in todos]):
+                    Todo.objects.filter(id__in=chunk).update(**{name: value})
+            else:
+                rest.extend(todos)
+        if rest:
+            Todo.objects.bulk_update(rest, [name])
+
+
+def delete_todos(ids: list) -> list[dict]:
+    valid = [id for id in map(todo_id, ids) if id is not None]
+    found = set()
+    with transaction.atomic():
+        for chunk in chunks(valid):
+            found.update(Todo.objects.filter(id__in=chunk).values_list('id', flat=True))
+        # delete() fetches the todos to send their post_delete, then deletes
+        # them 100 at a time
+        with versions.batch():
+            for chunk in chunks(list(found)):
+                Todo.objects.filter(id__in=chunk).delete()
+        versions.bump(Todo)
+    results = []
+    for index, item in enumerate(ids):
+        id = todo_id(item)
+        if id is None:
+            results.append(failure(index, 400, {'id': ['An integer id is required.']}))
+        elif id not in found:
+            results.append(failure(index, 404, {'id': [f'Todo of id {id} was not found.']}))
+        else:
+            results.append({'index': index, 'code': 204, 'errors': None, 'todo': None})
+    return results
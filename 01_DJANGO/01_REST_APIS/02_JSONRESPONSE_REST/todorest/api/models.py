@@ -16,4 +16,16 @@ class Todo(models.Model):
             'id': self.id, 'title': self.title, 
             'created_at': self.created_at, 'completed': self.completed
         }
-    
\ No newline at end of file
+
+
+class TableVersion(models.Model):
+    """
+    A counter per table, bumped on every write to it (see api/versions.py).
+    The ETags of the todos routes are computed from it.
+    """
+    table = models.CharField(max_length=64, primary_key=True)
+    version = models.BigIntegerField(default=0)
+    updated_at = models.DateTimeField(default=timezone.now)
+
+    def __str__(self) -> str:
+        return f'{self.table} v{self.version}'
@@ -1,3 +1,102 @@
+import json
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from api.models import Todo
 
-# Create your tests here.
+
+class BatchTestCase(TestCase):
+    def batch(self, method: str, data: dict):
+        res = getattr(self.client, method)(
+            '/api/v1/todos/batch', json.dumps(data), content_type='application/json'
+        )
+        return res.json()
+
+    def codes(self, res: dict) -> list[int]:
+        return [result['code'] for result in res['results']]
+
+    def test_create_update_and_delete_in_a_few_queries(self):
+        todos = [{'title': f'Todo {i}', 'completed': False} for i in range(1200)]
+        with CaptureQueriesContext(connection) as queries:
+            res = self.batch('post', {'todos': todos})
+        self.assertLessEqual(len(queries), 10)
+        self.assertEqual(set(self.codes(res)), {201})
+        ids = [result['todo']['id'] for result in res['results']]
+
+        changes = [{'id': id, 'completed': True} for id in ids[:600]]
+        changes += [{'id': id, 'title': f'Renamed {id}'} for id in ids[600:]] + [{'id': 0}]
+        with CaptureQueriesContext(connection) as queries:
+            res = self.batch('patch', {'todos': changes})
+        self.assertLessEqual(len(queries), 12)
+        self.assertEqual(self.codes(res)[-1], 404)
+        self.assertEqual(Todo.objects.filter(completed=True).count(), 600)
+        self.assertEqual(Todo.objects.get(id=ids[-1]).title, f'Renamed {ids[-1]}')
+
+        with CaptureQueriesContext(connection) as queries:
+            res = self.batch('delete', {'ids': ids[:1000] + [0, 'one']})
+        # delete() deletes 100 todos per query
+        self.assertLessEqual(len(queries), 20)
+        self.assertEqual(self.codes(res)[-3:], [204, 404, 400])
+        self.assertEqual(Todo.objects.count(), 200)
+
+    def test_invalid_items_dont_stop_the_batch(self):
+        res = self.batch('post', {'todos': [{'title': 'a' * 51}, {'title': 'Ok'}, {'completed': 1}]})
+        self.assertEqual(self.codes(res), [400, 201, 400])
+        self.assertEqual(Todo.objects.get().title, 'Ok')
+        id = res['results'][1]['todo']['id']
+        res = self.batch('delete', {'ids': [{'id': id}, {'id': 0}]})
+        self.assertEqual(self.codes(res), [204, 404])
+        self.assertFalse(Todo.objects.exists())
+        self.assertEqual(self.batch('post', {'todos': 'nope'})['code'], 400)
+
+    def test_items_are_validated_by_the_todo_form(self):
+        res = self.batch('post', {'todos': [{'title': '  '}, {'title': ' Ok '}]})
+        self.assertEqual(self.codes(res), [400, 201])
+        self.assertEqual(res['results'][0]['errors'], {'title': ['This field is required.']})
+        self.assertEqual(res['results'][1]['todo']['title'], 'Ok')
+        self.assertFalse(res['results'][1]['todo']['completed'])
+        # a partial item keeps the fields it doesn't have
+        id = res['results'][1]['todo']['id']
+        res = self.batch('patch', {'todos': [{'id': id, 'completed': True}]})
+        self.assertEqual(res['results'][0]['todo']['title'], 'Ok')
+
+
+class ConditionalGetTestCase(TestCase):
+    def setUp(self):
+        self.todo = Todo.objects.create(title='Buy milk')
+
+    def test_not_modified_without_reading_the_todos(self):
+        res = self.client.get('/api/v1/todos/all')
+        etag = res['ETag']
+        self.assertTrue(etag.startswith('W/"'))
+        self.assertNotIn('Last-Modified', res)
+        self.assertEqual(self.client.get('/api/v1/todos/all').content, res.content)
+        with CaptureQueriesContext(connection) as queries:
+            res = self.client.get('/api/v1/todos/all', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(res.status_code, 304)
+        self.assertEqual(len(queries), 1)
+        self.assertIn('FROM "api_tableversion"', queries[0]['sql'])
+
+    def test_etags_are_per_resource(self):
+        etag = self.client.get('/api/v1/todos/all')['ETag']
+        url = f'/api/v1/todo/one/{self.todo.id}'
+        res = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(res.status_code, 200)
+        self.assertNotEqual(res['ETag'], etag)
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=res['ETag']).status_code, 304)
+
+    def test_writes_change_the_etag(self):
+        etags = [self.client.get('/api/v1/todos/all')['ETag']]
+        self.todo.delete()
+        etags.append(self.client.get('/api/v1/todos/all')['ETag'])
+        self.batch_create([{'title': 'Call'}] * 3)
+        etags.append(self.client.get('/api/v1/todos/all')['ETag'])
+        self.assertEqual(len(set(etags)), 3)
+        res = self.client.get('/api/v1/todos/all', HTTP_IF_NONE_MATCH=etags[0])
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(len(res.json()['todos']), 3)
+
+    def batch_create(self, todos: list):
+        return self.client.post(
+            '/api/v1/todos/batch', json.dumps({'todos': todos}), content_type='application/json'
+        )
@@ -8,4 +8,5 @@ urlpatterns = [
     path('todo/update/<int:id>', updateTodo),
     path('todo/delete/<int:id>', deleteTodo),
     path('todo/add', addTodo),
+    path('todos/batch', batchTodos),
 ]
\ No newline at end of file
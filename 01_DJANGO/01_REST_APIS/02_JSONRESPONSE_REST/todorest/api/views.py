@@ -2,10 +2,13 @@
 import json
 from django.http import JsonResponse
 from api.models import Todo
+from api.versions import conditional, last_update
+from api.batch import InvalidBatch, batch_items, create_todos, delete_todos, update_todos
 import datetime
 from django.views.decorators.csrf import csrf_exempt
 # Create your views here.
 
+@conditional(Todo)
 def getTodos(request):
     if request.method == 'GET':
         try:
@@ -13,7 +16,7 @@ def getTodos(request):
             return JsonResponse({
                 'code': 200,
                 'message': 'Getting all Todos.',
-                'timestamp': datetime.datetime.now(),
+                'timestamp': last_update(request, Todo),
                 'todos': todos,
             }, safe=True)   
         except Exception as e:
@@ -29,6 +32,7 @@ def getTodos(request):
             'timestamp': datetime.datetime.now(),
         })
     
+@conditional(Todo)
 def getTodo(request, id):
     if request.method == 'GET':
         try:
@@ -36,7 +40,7 @@ def getTodo(request, id):
             return JsonResponse({
                 'code': 200,
                 'message': 'Getting all Todos.',
-                'timestamp': datetime.datetime.now(),
+                'timestamp': last_update(request, Todo),
                 'todo': todo.to_json(),
             })
         except Todo.DoesNotExist:
@@ -149,4 +153,45 @@ def addTodo(request):
         return JsonResponse({
             'code': 405,
             'message': 'Only POST method is allowed.'
-        })
\ No newline at end of file
+        })
+
+@csrf_exempt
+def batchTodos(request):
+    if request.method in ('POST', 'PATCH', 'DELETE'):
+        try:
+            try:
+                data = json.loads(request.body.decode('utf-8'))
+            except ValueError:
+                raise InvalidBatch('Invalid JSON.')
+            if request.method == 'POST':
+                results = create_todos(batch_items(data, 'todos'))
+            elif request.method == 'PATCH':
+                results = update_todos(batch_items(data, 'todos'))
+            else:
+                results = delete_todos(batch_items(data, 'ids'))
+            done = sum(1 for result in results if result['errors'] is None)
+            return JsonResponse({
+                'code': 200,
+                'message': f'Wrote {done} of {len(results)} todos.',
+                'timestamp': datetime.datetime.now(),
+                'results': results,
+            })
+        except InvalidBatch as e:
+            return JsonResponse({
+                'code': 400,
+                'message': str(e),
+                'timestamp': datetime.datetime.now(),
+                'results': None,
+            })
+        except:
+            return  JsonResponse({
+                'code': 500,
+                'message': 'Internal Server Error.',
+                'timestamp': datetime.datetime.now(),
+            })
+    else:
+        return JsonResponse({
+            'code': 405,
+            'message': 'Only POST, PATCH or DELETE method(s) are allowed.',
+            'timestamp': datetime.datetime.now(),
+        })